@@ -0,0 +1,198 @@
+"""
+Адаптивный допуск задач по измеренной нагрузке сервера
+"""
+
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from config import (
+    ADMISSION_CONTROL, ADMISSION_MIN_JOBS, ADMISSION_MAX_JOBS, ADMISSION_INTERVAL, ADMISSION_TARGET_LOAD,
+    ADMISSION_MIN_FREE_MB, ADMISSION_JOB_MEMORY_MB, ADMISSION_COOLDOWN, ADMISSION_MAX_QUEUE_WAIT
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SystemLoad:
+    """Снимок нагрузки сервера; None - показатель недоступен (не Linux)"""
+    load_per_cpu: float = None
+    mem_available_mb: float = None
+    swapped_out_pages: int = None
+
+
+def read_system_load(proc_dir: str = '/proc') -> SystemLoad:
+    """Читает load average, доступную память и счетчик вытеснений в swap из /proc"""
+    sample = SystemLoad()
+    cpus = os.cpu_count() or 1
+    try:
+        with open(os.path.join(proc_dir, 'loadavg')) as f:
+            sample.load_per_cpu = float(f.read().split()[0]) / cpus
+    except (OSError, ValueError, IndexError):
+        try:
+            sample.load_per_cpu = os.getloadavg()[0] / cpus
+        except (OSError, AttributeError):
+            pass
+
+    try:
+        with open(os.path.join(proc_dir, 'meminfo')) as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    sample.mem_available_mb = int(line.split()[1]) / 1024
+                    break
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        with open(os.path.join(proc_dir, 'vmstat')) as f:
+            for line in f:
+                if line.startswith('pswpout '):
+                    sample.swapped_out_pages = int(line.split()[1])
+                    break
+    except (OSError, ValueError, IndexError):
+        pass
+    return sample
+
+
+class AdmissionController:
+    """Подстраивает число одновременных задач FairJobQueue под нагрузку.
+
+    Раз в interval секунд читает нагрузку сервера и решает:
+    - памяти меньше min_free_mb или система начала вытеснять страницы в
+      swap - лимит сразу уменьшается вдвое, новые задачи ждут в очереди;
+    - load average на ядро выше target_load - лимит уменьшается на одну задачу;
+    - задачи ждут в очереди, load average ниже 80% цели и памяти хватает
+      еще на одну задачу (job_memory_mb) - лимит увеличивается на одну задачу,
+      не чаще раза в cooldown секунд: load average реагирует с задержкой.
+      Если 90% последних задач ждали в очереди дольше max_queue_wait секунд,
+      лимит растет, пока load average не дойдет до самой цели.
+    Если после увеличения пропускная способность (задач в минуту) упала,
+    увеличение откатывается. Лимит всегда в пределах [min_jobs, max_jobs].
+    """
+
+    def __init__(self, job_queue, min_jobs: int = None, max_jobs: int = None, interval: float = None,
+                 target_load: float = None, min_free_mb: float = None, job_memory_mb: float = None,
+                 cooldown: float = None, enabled: bool = None, reader=read_system_load,
+                 max_queue_wait: float = None):
+        self.job_queue = job_queue
+        self.min_jobs = max(1, min_jobs or ADMISSION_MIN_JOBS)
+        self.max_jobs = max(self.min_jobs, max_jobs or ADMISSION_MAX_JOBS)
+        self.interval = interval or ADMISSION_INTERVAL
+        self.target_load = target_load or ADMISSION_TARGET_LOAD
+        self.min_free_mb = ADMISSION_MIN_FREE_MB if min_free_mb is None else min_free_mb
+        self.job_memory_mb = ADMISSION_JOB_MEMORY_MB if job_memory_mb is None else job_memory_mb
+        self.cooldown = ADMISSION_COOLDOWN if cooldown is None else cooldown
+        self.max_queue_wait = ADMISSION_MAX_QUEUE_WAIT if max_queue_wait is None else max_queue_wait
+        self.enabled = ADMISSION_CONTROL if enabled is None else enabled
+        self.reader = reader
+        self.last_sample = None
+        self._last_swapped_out = None
+        self._last_increase_at = None
+        # Пропускная способность до последнего увеличения лимита: (лимит до увеличения, задач в минуту)
+        self._before_increase = None
+        self._completed_at = None
+        self._throughput = None
+        self._task = None
+
+    def _update_throughput(self, now: float):
+        completed = self.job_queue.completed
+        if self._completed_at is not None:
+            last_completed, last_time = self._completed_at
+            elapsed = now - last_time
+            if elapsed > 0:
+                rate = (completed - last_completed) * 60 / elapsed
+                # Сглаживание: задачи завершаются редко, мгновенная скорость шумит
+                self._throughput = rate if self._throughput is None else 0.7 * self._throughput + 0.3 * rate
+        self._completed_at = (completed, now)
+
+    def _swapping(self, sample: SystemLoad) -> bool:
+        if sample.swapped_out_pages is None:
+            return False
+        swapping = self._last_swapped_out is not None and sample.swapped_out_pages > self._last_swapped_out
+        self._last_swapped_out = sample.swapped_out_pages
+        return swapping
+
+    def decide(self, sample: SystemLoad, now: float = None) -> int:
+        """Новый лимит одновременных задач по снимку нагрузки"""
+        now = time.monotonic() if now is None else now
+        self._update_throughput(now)
+        limit = self.job_queue.max_running
+        stats = self.job_queue.stats()
+        swapping = self._swapping(sample)
+
+        if swapping or (sample.mem_available_mb is not None and sample.mem_available_mb < self.min_free_mb):
+            new_limit = max(self.min_jobs, min(limit, stats['running']) // 2)
+            reason = "вытеснение в swap" if swapping else f"свободно {sample.mem_available_mb:.0f} МБ памяти"
+            self._before_increase = None
+        elif sample.load_per_cpu is not None and sample.load_per_cpu > self.target_load:
+            new_limit = limit - 1
+            reason = f"load average {sample.load_per_cpu:.2f} на ядро"
+            self._before_increase = None
+        elif self._before_increase is not None and self._throughput is not None \
+                and now - self._last_increase_at >= self.cooldown \
+                and self._throughput < self._before_increase[1] * 0.9:
+            # Лишняя задача не ускорила обработку, а замедлила - возвращаем лимит
+            new_limit = self._before_increase[0]
+            reason = f"пропускная способность упала до {self._throughput:.1f} задач/мин"
+            self._before_increase = None
+        elif self._can_increase(sample, stats, now):
+            new_limit = limit + 1
+            if stats['wait_p90'] > self.max_queue_wait:
+                reason = f"задачи ждут в очереди {stats['wait_p90']:.0f} с (p90), ресурсы свободны"
+            else:
+                reason = "задачи ждут в очереди, ресурсы свободны"
+            self._before_increase = (limit, self._throughput or 0.0)
+            self._last_increase_at = now
+        else:
+            return limit
+
+        new_limit = max(self.min_jobs, min(self.max_jobs, new_limit))
+        if new_limit != limit:
+            logger.info(f"Лимит одновременных задач: {limit} -> {new_limit} ({reason})")
+        return new_limit
+
+    def _can_increase(self, sample: SystemLoad, stats: dict, now: float) -> bool:
+        if stats['waiting'] == 0 or stats['running'] < self.job_queue.max_running:
+            return False
+        if self._last_increase_at is not None and now - self._last_increase_at < self.cooldown:
+            return False
+        # Долгое ожидание в очереди: запас по load average не держим, лимит растет до самой цели
+        load_ceiling = self.target_load if stats['wait_p90'] > self.max_queue_wait else self.target_load * 0.8
+        if sample.load_per_cpu is None or sample.load_per_cpu > load_ceiling:
+            return False
+        if sample.mem_available_mb is not None \
+                and sample.mem_available_mb - self.job_memory_mb < self.min_free_mb:
+            return False
+        return True
+
+    async def adjust(self) -> int:
+        """Снимает нагрузку и применяет новый лимит к очереди"""
+        sample = await asyncio.to_thread(self.reader)
+        self.last_sample = sample
+        limit = self.decide(sample)
+        if limit != self.job_queue.max_running:
+            await self.job_queue.resize(limit)
+        return limit
+
+    async def run(self):
+        while True:
+            try:
+                await self.adjust()
+            except Exception as e:
+                logger.warning(f"Не удалось обновить лимит задач: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Запускает фоновую подстройку лимита в текущем цикле событий"""
+        if not self.enabled or self._task is not None:
+            return None
+        self._task = asyncio.create_task(self.run())
+        logger.info(f"Адаптивный допуск задач включен: от {self.min_jobs} до {self.max_jobs} задач")
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
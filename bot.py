@@ -3,14 +3,36 @@ import os
 import asyncio
 import time
 import gc
+import shutil
+from functools import partial
+from dataclasses import asdict
+from contextlib import aclosing
 from datetime import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from pathlib import Path
+from telegram.error import Forbidden
+from telegram import InputFile, Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
     ConversationHandler, filters, ContextTypes
 )
-from config import BOT_TOKEN, ADMIN_IDS, SUPPORTED_IMAGE_FORMATS, MAX_IMAGE_SIZE
-from video_processor import VideoProcessor, process_video_copy_new
+from config import (
+    BOT_TOKEN, ADMIN_IDS, SUPPORTED_IMAGE_FORMATS, MAX_IMAGE_SIZE, PROGRESS_UPDATE_INTERVAL, UPLOAD_CONCURRENCY,
+    DOWNLOAD_CONCURRENCY, JOB_EXECUTION, JOB_SERVICE_DIR, JOB_SERVICE_POLL_INTERVAL,
+    JOB_BROKER_LISTEN, JOB_BROKER_TOKEN, TELEGRAM_BOT_API_URL, TELEGRAM_BOT_API_FILE_URL, TELEGRAM_LOCAL_MODE
+)
+from video_processor import VideoProcessor
+from worker_pool import VideoCopyJob
+from media_probe import estimate_processing_timeout
+from job_progress import JobProgress, format_eta, format_progress_bar
+from job_workspace import WorkspaceManager, estimate_workspace_bytes
+from media_prefetch import MediaPrefetcher
+from input_cache import InputCache
+from job_queue import FairJobQueue, JobQueueFull, job_priority
+from job_stages import UploadStage
+from job_store import JobStore, JOB_DONE, JOB_FAILED
+from job_broker import JobBrokerServer
+from admission import AdmissionController
+from encoding_profiles import select_encoding_profile
 from image_processor import ImageProcessor
 from database import DatabaseManager
 
@@ -26,17 +48,35 @@ MAIN_MENU, WAITING_FOR_VIDEO, WAITING_FOR_IMAGE, PARAMETERS_MENU, IMAGE_PARAMETE
 
 class VideoBot:
     def __init__(self):
-        self.video_processor = VideoProcessor()
+        # Менеджер базы данных для статистики пользователей
+        self.db_manager = DatabaseManager()
+        self.video_processor = VideoProcessor(self.db_manager)
         self.image_processor = ImageProcessor()
+        # Рабочие папки задач обработки видео (RAM с бюджетом, иначе диск)
+        self.workspaces = WorkspaceManager()
+        # Скачанные файлы по file_unique_id: повторное видео не скачивается из Telegram
+        self.input_cache = InputCache()
+        # Одновременные скачивания из Telegram: стадия скачивания не занимает слоты обработки
+        self.download_semaphore = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+        # Файлы скачиваются сразу после получения, пока пользователь выбирает параметры
+        self.prefetcher = MediaPrefetcher(
+            self.workspaces, self.video_processor.probe_cache, input_cache=self.input_cache,
+            download_limit=self.download_semaphore
+        )
         self.user_data = {}
         # Добавляем словарь для отслеживания активных задач обработки
         self.active_processing_tasks = {}
-        # Семафор для ограничения количества одновременных обработок видео
-        # Для конфигурации: 16 vCPU, 32 GB RAM
-        # Оптимальное значение: 8 одновременных обработок
-        self.processing_semaphore = asyncio.Semaphore(10)
-        # Менеджер базы данных для статистики пользователей
-        self.db_manager = DatabaseManager()
+        # Очередь задач обработки: приоритеты, справедливая доля пользователей и лимит задач пользователя
+        self.job_queue = FairJobQueue()
+        # Лимит одновременных задач подстраивается под load average и свободную память
+        self.admission = AdmissionController(self.job_queue)
+        # Режим сервиса: видео обрабатывает worker_service.py, бот ставит задачи и отправляет копии
+        self.job_store = JobStore() if JOB_EXECUTION == 'service' else None
+        self._service_delivery_task = None
+        self.broker_server = None
+        self._delivering_jobs = set()
+        # Одновременные отправки файлов: каждая держит содержимое файла в памяти
+        self.upload_semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
         # ID администраторов загружаются из .env файла
         self.admin_ids = ADMIN_IDS
 
@@ -44,21 +84,54 @@ class VideoBot:
         """Проверяет, является ли пользователь администратором"""
         return user_id in self.admin_ids
 
-    async def _delayed_file_cleanup(self, file_path: str, max_attempts: int = 5):
-        """Отложенное удаление файла с повторными попытками"""
-        for attempt in range(max_attempts):
+    async def _send_output_file(self, send_method, file_path: str, field: str, keep_on_error: bool = False,
+                                **kwargs):
+        """Отправляет готовый файл из открытого дескриптора и сразу удаляет его.
+        
+        С локальным сервером Bot API файл передается по пути и в память бота
+        не читается. Иначе python-telegram-bot загружает содержимое файла целиком
+        (потоковой отправки у него нет), поэтому чтение вынесено в поток, а число
+        одновременных отправок ограничено upload_semaphore.
+        keep_on_error=True - при ошибке отправки файл остается для повторной попытки.
+        """
+        async with self.upload_semaphore:
+            sent = False
             try:
-                await asyncio.sleep(2 ** attempt)  # Экспоненциальная задержка
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.info(f"Файл {file_path} удален с попытки {attempt + 1}")
-                    return
-            except PermissionError:
-                logger.warning(f"Попытка {attempt + 1}: файл {file_path} все еще заблокирован")
-            except Exception as e:
-                logger.error(f"Ошибка при удалении файла {file_path} (попытка {attempt + 1}): {e}")
-        
-        logger.error(f"Не удалось удалить файл {file_path} после {max_attempts} попыток")
+                if TELEGRAM_LOCAL_MODE:
+                    result = await send_method(**{field: Path(file_path).absolute()}, **kwargs)
+                else:
+                    with open(file_path, 'rb') as file_handle:
+                        input_file = await asyncio.to_thread(InputFile, file_handle, os.path.basename(file_path))
+                    result = await send_method(**{field: input_file}, **kwargs)
+                sent = True
+                return result
+            finally:
+                if sent or not keep_on_error:
+                    try:
+                        os.remove(file_path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        logger.warning(f"Не удалось удалить отправленный файл {file_path}: {e}")
+
+    async def post_init(self, application: Application):
+        """Запускает фоновые задачи бота после старта цикла событий"""
+        self.admission.start()
+        if self.job_store is not None:
+            # Копии задач, которые закончились, пока бот был остановлен, отправляются сразу
+            self._service_delivery_task = asyncio.create_task(self._run_service_delivery(application.bot))
+            if JOB_BROKER_LISTEN:
+                # Воркеры на других серверах получают задачи и файлы через брокер
+                self.broker_server = JobBrokerServer(self.job_store, JOB_BROKER_LISTEN, JOB_BROKER_TOKEN)
+                self.broker_server.start()
+
+    async def post_shutdown(self, application: Application):
+        """Останавливает фоновые задачи бота"""
+        self.admission.stop()
+        if self._service_delivery_task is not None:
+            self._service_delivery_task.cancel()
+        if self.broker_server is not None:
+            await asyncio.to_thread(self.broker_server.stop)
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
@@ -78,6 +151,7 @@ class VideoBot:
         # Очищаем данные пользователя при старте
         if user_id in self.user_data:
             del self.user_data[user_id]
+        self.prefetcher.discard(user_id)
         
         welcome_text = (
             f"👋 **Привет, {user_name}!**\n\n"
@@ -171,6 +245,7 @@ class VideoBot:
         try:
             stats = self.db_manager.get_all_users_stats()
             recent_stats = self.db_manager.get_recent_activity(7)
+            queue = self.job_queue.stats()
             
             # Формируем сообщение со статистикой
             message = (
@@ -180,7 +255,8 @@ class VideoBot:
                 f"🎬 **Выходных видео:** {stats['total_output_videos']}\n"
                 f"🖼️ **Изображений обработано:** {stats['total_images_processed']}\n"
                 f"🎨 **Выходных изображений:** {stats['total_output_images']}\n"
-                f"⚙️ **Сессий обработки:** {stats['total_processing_sessions']}\n\n"
+                f"⚙️ **Сессий обработки:** {stats['total_processing_sessions']}\n"
+                f"⏳ **Очередь:** выполняется {queue['running']}/{queue['max_running']}, ждут {queue['waiting']}\n\n"
                 f"📈 **За последние 7 дней:**\n"
                 f"• Активных пользователей: {recent_stats['active_users']}\n"
                 f"• Обработано видео: {recent_stats['videos_processed']}\n"
@@ -231,7 +307,8 @@ class VideoBot:
                     f"🎬 **Выходных видео:** {stats['total_output_videos']}\n"
                     f"🖼️ **Изображений обработано:** {stats['total_images_processed']}\n"
                     f"🎨 **Выходных изображений:** {stats['total_output_images']}\n"
-                    f"⚙️ **Сессий обработки:** {stats['total_processing_sessions']}\n\n"
+                    f"⚙️ **Сессий обработки:** {stats['total_processing_sessions']}\n"
+                    f"⏳ **Очередь:** выполняется {queue['running']}/{queue['max_running']}, ждут {queue['waiting']}\n\n"
                     f"📈 **За последние 7 дней:**\n"
                     f"• Активных пользователей: {recent_stats['active_users']}\n"
                     f"• Обработано видео: {recent_stats['videos_processed']}\n"
@@ -635,6 +712,8 @@ class VideoBot:
             video = update.message.video
             self.user_data[user_id] = {
                 'video_file_id': video.file_id,
+                'video_file_unique_id': video.file_unique_id,
+                'video_file_size': video.file_size,
                 'video_file_name': f"video_{user_id}_{video.file_unique_id}.mp4",
                 # Инициализируем параметры по умолчанию
                 'copies': 1,
@@ -642,6 +721,10 @@ class VideoBot:
                 'change_resolution': False,
                 'compress': False
             }
+            # Скачивание и чтение метаданных идут, пока пользователь выбирает параметры
+            self.prefetcher.start(
+                user_id, context.bot, video.file_id, video.file_unique_id, video.file_size, probe=True
+            )
             
             await update.message.reply_text(
                 "✅ **Видео получено!**\n\n"
@@ -679,6 +762,7 @@ class VideoBot:
             # Сохраняем информацию об изображении
             self.user_data[user_id] = {
                 'image_file_id': photo.file_id,
+                'image_file_unique_id': photo.file_unique_id,
                 'image_file_name': f"image_{user_id}_{photo.file_unique_id}.jpg",
                 'file_type': 'image',
                 # Инициализируем параметры по умолчанию
@@ -688,6 +772,8 @@ class VideoBot:
                 'add_rotation': False,
                 'change_size': False
             }
+            self.prefetcher.start(user_id, context.bot, photo.file_id, photo.file_unique_id, photo.file_size,
+                                  file_name='input.jpg')
             
             await update.message.reply_text(
                 "✅ **Изображение получено!**\n\n"
@@ -815,6 +901,10 @@ class VideoBot:
             # Обновляем данные о видео для обработки
             video = update.message.video
             self.user_data[user_id]['processing_video_id'] = video.file_id
+            self.user_data[user_id]['processing_video_unique_id'] = video.file_unique_id
+            self.prefetcher.start(
+                user_id, context.bot, video.file_id, video.file_unique_id, video.file_size, probe=True
+            )
             
             # Создаем кнопки для выбора количества копий
             keyboard = [
@@ -954,24 +1044,245 @@ class VideoBot:
         )
         return CHOOSING_COMPRESSION
 
+    async def _submit_job(self, user_id: int, priority: int, processing_message):
+        """Ставит задачу в очередь обработки; None - у пользователя уже максимум задач"""
+        try:
+            return self.job_queue.submit(user_id, priority)
+        except JobQueueFull:
+            await self._report_job_limit(user_id, processing_message)
+            return None
+
+    async def _report_job_limit(self, user_id: int, processing_message):
+        """Сообщает пользователю, что у него уже максимум задач в обработке"""
+        logger.info(f"Пользователь {user_id} превысил лимит задач в очереди")
+        try:
+            await asyncio.wait_for(
+                processing_message.edit_text(
+                    f"⏳ У вас уже {self.job_queue.max_per_user} задач в обработке.\n\n"
+                    "Дождитесь их завершения и запустите обработку снова."
+                ),
+                timeout=5.0
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось сообщить о лимите задач: {e}")
+
+    async def _report_queue_position(self, processing_message, position: int):
+        """Показывает место задачи в очереди, пока она ждет слот"""
+        try:
+            await asyncio.wait_for(
+                processing_message.edit_text(
+                    f"⏳ Задача в очереди: {position}-я\n\n"
+                    "Обработка начнется автоматически, как только освободится место."
+                ),
+                timeout=5.0
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Таймаут при обновлении места в очереди")
+        except Exception as e:
+            logger.warning(f"Не удалось обновить место в очереди: {e}")
+
+    async def _enqueue_service_job(self, user_id: int, user_settings: dict, input_path: str, file_unique_id: str,
+                                   cost_mb: float, processing_message, chat_id: int):
+        """Передает скачанное видео сервису воркеров через постоянную очередь задач.
+
+        Лимит JOB_QUEUE_MAX_PER_USER считается по задачам пользователя в
+        JobStore; None - лимит достигнут, задача не поставлена.
+        """
+        max_active = self.job_queue.max_per_user
+        if await asyncio.to_thread(self.job_store.active_jobs, user_id) >= max_active:
+            await self._report_job_limit(user_id, processing_message)
+            return None
+        
+        copies = user_settings['copies']
+        job_dir = os.path.abspath(os.path.join(JOB_SERVICE_DIR, f"job-{os.urandom(8).hex()}"))
+        os.makedirs(os.path.join(job_dir, 'work'), exist_ok=True)
+        
+        # Вход переезжает из рабочей папки задачи (часто в RAM) в общую с воркерами папку на диске
+        service_input = os.path.join(job_dir, 'input.mp4')
+        await asyncio.to_thread(shutil.move, input_path, service_input)
+        
+        video_info = await self.video_processor.probe_cache.probe(service_input, file_unique_id)
+        file_size = os.path.getsize(service_input) / (1024 * 1024)  # MB
+        plan = VideoCopyJob(
+            input_path=service_input,
+            output_paths=[os.path.join(job_dir, f'copy_{i + 1}.mp4') for i in range(copies)],
+            add_frames=user_settings['add_frames'],
+            compress=user_settings['compress'],
+            change_resolution=user_settings['change_resolution'],
+            user_id=user_id,
+            video_info=video_info.to_dict() if video_info else None,
+            work_dir=os.path.join(job_dir, 'work'),
+            profile=select_encoding_profile(self.is_admin(user_id))
+        )
+        payload = asdict(plan)
+        del payload['progress_queue'], payload['cancel_event']
+        payload.update(
+            timeout=estimate_processing_timeout(video_info, copies, file_size, minimum=600, seconds_per_mb=60),
+            job_dir=job_dir,
+            file_id=user_settings.get('processing_video_id', user_settings['video_file_id']),
+            file_size=os.path.getsize(service_input),
+            file_unique_id=file_unique_id
+        )
+        
+        try:
+            job_id = await asyncio.to_thread(
+                self.job_store.enqueue, 'video', user_id, chat_id, payload,
+                job_priority(self.is_admin(user_id), cost_mb), processing_message.message_id,
+                max_active=max_active
+            )
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        if job_id is None:
+            # Параллельная постановка заняла последнее место
+            shutil.rmtree(job_dir, ignore_errors=True)
+            await self._report_job_limit(user_id, processing_message)
+            return None
+        
+        try:
+            await asyncio.wait_for(
+                processing_message.edit_text(
+                    f"⏳ Видео поставлено в очередь обработки\n"
+                    f"📊 Параметры: {copies} копий\n\n"
+                    "Копии придут в этот чат по мере готовности."
+                ),
+                timeout=5.0
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось обновить сообщение о постановке в очередь: {e}")
+        return job_id
+
+    async def _run_service_delivery(self, bot):
+        """Отправляет пользователям копии, готовые в сервисе воркеров"""
+        # Закрытые задачи хранятся сутки - для разбора сбоев
+        await asyncio.to_thread(self.job_store.purge, 24 * 3600)
+        while True:
+            try:
+                jobs = await asyncio.to_thread(self.job_store.pending_delivery)
+                for job in jobs:
+                    if job['job_id'] in self._delivering_jobs:
+                        continue
+                    self._delivering_jobs.add(job['job_id'])
+                    task = asyncio.create_task(self._deliver_service_job(bot, job))
+                    task.add_done_callback(lambda _, job_id=job['job_id']: self._delivering_jobs.discard(job_id))
+            except Exception as e:
+                logger.error(f"Ошибка при проверке очереди сервиса: {e}")
+            await asyncio.sleep(JOB_SERVICE_POLL_INTERVAL)
+
+    async def _deliver_service_job(self, bot, job: dict):
+        """Отправляет готовые копии задачи сервиса и закрывает задачу, когда она закончена"""
+        payload = job['payload']
+        output_paths = payload['output_paths']
+        copies = len(output_paths)
+        chat_id = job['chat_id']
+        delivered = len(job['delivered_copies'])
+        missing = 0
+        
+        try:
+            for copy_index in job['ready_copies']:
+                if copy_index in job['delivered_copies']:
+                    continue
+                video_path = output_paths[copy_index]
+                if not os.path.exists(video_path):
+                    # Копия не отмечается отправленной: пользователь ее не получил
+                    logger.error(f"Готовая копия {copy_index} задачи {job['job_id']} не найдена: {video_path}")
+                    missing += 1
+                    continue
+                # Файл удаляется только после отправки, при ошибке копия отправится при следующей проверке
+                await self._send_output_file(
+                    bot.send_video, video_path, 'video', keep_on_error=True,
+                    chat_id=chat_id,
+                    caption=f"🎬 Уникальная копия #{delivered + 1}/{copies}"
+                )
+                await asyncio.to_thread(self.job_store.mark_copy_delivered, job['job_id'], copy_index)
+                delivered += 1
+        except Forbidden:
+            logger.warning(f"Пользователь {job['user_id']} заблокировал бота, задача {job['job_id']} закрыта")
+            await asyncio.to_thread(self.job_store.mark_delivered, job['job_id'])
+            await asyncio.to_thread(shutil.rmtree, payload['job_dir'], True)
+            return
+        except Exception as e:
+            # Неотправленные копии останутся в очереди до следующей проверки
+            logger.error(f"Ошибка при отправке копий задачи {job['job_id']}: {e}")
+            return
+        
+        if job['status'] not in (JOB_DONE, JOB_FAILED):
+            return
+        
+        if job['status'] == JOB_FAILED and delivered == 0:
+            text = f"❌ Произошла ошибка при обработке видео: {job['error']}"
+        else:
+            text = f"✅ Обработка завершена!\n📹 Отправлено {delivered} уникальных копий"
+            if missing:
+                text += f"\n⚠️ Не удалось отправить копий: {missing}"
+        try:
+            if job['message_id'] is not None:
+                await bot.edit_message_text(text, chat_id=chat_id, message_id=job['message_id'])
+            else:
+                await bot.send_message(chat_id=chat_id, text=text)
+        except Exception as e:
+            logger.warning(f"Не удалось отредактировать сообщение: {e}")
+            try:
+                await bot.send_message(chat_id=chat_id, text=text)
+            except Exception as send_error:
+                logger.error(f"Не удалось отправить финальное сообщение: {send_error}")
+        
+        try:
+            await bot.send_message(
+                chat_id=chat_id,
+                text="📹 Прикрепите следующее видео\n\n"
+                     "📋 Требования:\n"
+                     "• Размер файла: до 50 МБ\n"
+                     "• Формат: MP4, AVI, MKV\n"
+                     "• Длительность: до 10 минут\n\n"
+                     "Просто прикрепите видео к сообщению 👇"
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при отправке сообщения: {e}")
+        
+        # Записываем статистику обработки
+        try:
+            video_info = payload.get('video_info')
+            self.db_manager.record_video_processing(
+                user_id=job['user_id'],
+                input_video_info={
+                    'file_id': payload.get('file_id'),
+                    'file_size': payload.get('file_size'),
+                    'duration': video_info['duration'] if video_info else 'unknown'
+                },
+                output_count=delivered,
+                processing_params={
+                    'copies': copies,
+                    'add_frames': payload['add_frames'],
+                    'compress': payload['compress'],
+                    'change_resolution': payload['change_resolution']
+                }
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при записи статистики: {e}")
+        
+        await asyncio.to_thread(self.job_store.mark_delivered, job['job_id'])
+        await asyncio.to_thread(shutil.rmtree, payload['job_dir'], True)
+        logger.info(f"Задача сервиса {job['job_id']} закрыта, отправлено копий: {delivered}/{copies}")
+
     async def _process_video_async(self, user_id: int, user_settings: dict, 
                                  processing_message, context, chat_id: int):
         """Асинхронная обработка видео с промежуточными обновлениями"""
-        input_path = None
+        workspace = None
         processed_videos = []
         
-        # Используем семафор для ограничения количества одновременных обработок
-        async with self.processing_semaphore:
-            try:
-                copies = user_settings['copies']
-                add_frames = user_settings['add_frames']
-                compress = user_settings['compress']
-                change_resolution = user_settings['change_resolution']
-                
-                # Используем оригинальное видео
-                video_file_id = user_settings.get('processing_video_id', user_settings['video_file_id'])
-                
-                # Скачиваем файл
+        try:
+            copies = user_settings['copies']
+            add_frames = user_settings['add_frames']
+            compress = user_settings['compress']
+            change_resolution = user_settings['change_resolution']
+            
+            # Используем оригинальное видео
+            video_file_id = user_settings.get('processing_video_id', user_settings['video_file_id'])
+            file_unique_id = user_settings.get('processing_video_unique_id', user_settings.get('video_file_unique_id'))
+            
+            # Стадия скачивания идет до очереди обработки: слот обработки не ждет сеть
+            if not self.prefetcher.is_ready(user_id, video_file_id):
                 try:
                     await asyncio.wait_for(
                         processing_message.edit_text(
@@ -985,257 +1296,226 @@ class VideoBot:
                     logger.warning("Таймаут при обновлении сообщения о скачивании")
                 except Exception as e:
                     logger.warning(f"Ошибка при обновлении сообщения: {e}")
-                
-                video_file = await context.bot.get_file(video_file_id)
-                input_path = f"temp/input_{user_id}.mp4"
-                
-                # Создаем директорию temp если не существует
-                os.makedirs("temp", exist_ok=True)
-                
-                await video_file.download_to_drive(input_path)
-                
-                # Проверяем что файл был скачан
-                if not os.path.exists(input_path):
-                    logger.error(f"Файл {input_path} не был создан после скачивания")
-                    try:
-                        await asyncio.wait_for(
-                            processing_message.edit_text("❌ Ошибка при скачивании видео. Попробуйте еще раз."),
-                            timeout=5.0
-                        )
-                    except asyncio.TimeoutError:
-                        logger.warning("Таймаут при отправке сообщения об ошибке скачивания")
-                    except Exception as e:
-                        logger.warning(f"Ошибка при отправке сообщения об ошибке: {e}")
-                    return
-                
-                file_size = os.path.getsize(input_path)
-                logger.info(f"Файл {input_path} успешно скачан, размер: {file_size} байт")
-                
-                # Обновляем статус
-                try:
-                    await asyncio.wait_for(
-                        processing_message.edit_text(
-                            f"🔄 Обработка видео...\n"
-                            f"📊 Параметры: {copies} копий\n\n"
-                            f"🎬 Создаю уникальные копии..."
-                        ),
-                        timeout=5.0
-                    )
-                except asyncio.TimeoutError:
-                    logger.warning("Таймаут при обновлении сообщения о создании копий")
-                except Exception as e:
-                    logger.warning(f"Ошибка при обновлении сообщения: {e}")
-                
-                # Создаем задачу обработки с callback для обновления прогресса
-                processed_videos = await self._process_with_progress_updates(
-                    input_path, user_id, copies, add_frames, compress, change_resolution,
-                    processing_message
+            
+            prefetched = await self.prefetcher.take(user_id, video_file_id)
+            if prefetched is not None:
+                # Папка выделялась до выбора числа копий - расширяем резерв под задачу
+                workspace = prefetched.workspace
+                workspace = await asyncio.to_thread(
+                    self.workspaces.ensure_capacity, workspace,
+                    estimate_workspace_bytes(prefetched.file_size, copies)
                 )
+                input_path = workspace.input_path
+            else:
+                # Своя рабочая папка на задачу: вход, промежуточные файлы и копии
+                workspace = await asyncio.to_thread(
+                    self.workspaces.allocate, estimate_workspace_bytes(user_settings.get('video_file_size'), copies)
+                )
+                input_path = workspace.input_path
                 
-                # Обновляем сообщение
+                # Видео, которое уже присылали, берется из кеша без скачивания
+                async with self.download_semaphore:
+                    await self.input_cache.fetch(context.bot, video_file_id, file_unique_id, input_path)
+            
+            # Проверяем что файл был скачан
+            if not os.path.exists(input_path):
+                logger.error(f"Файл {input_path} не был создан после скачивания")
                 try:
                     await asyncio.wait_for(
-                        processing_message.edit_text(
-                            f"📤 Отправляю обработанные видео...\n"
-                            f"✅ Создано {len(processed_videos)} уникальных копий"
-                        ),
+                        processing_message.edit_text("❌ Ошибка при скачивании видео. Попробуйте еще раз."),
                         timeout=5.0
                     )
                 except asyncio.TimeoutError:
-                    logger.warning("Таймаут при обновлении сообщения о готовности к отправке")
+                    logger.warning("Таймаут при отправке сообщения об ошибке скачивания")
                 except Exception as e:
-                    logger.warning(f"Ошибка при обновлении сообщения: {e}")
-                
-                # Отправляем обработанные видео
-                for i, video_path in enumerate(processed_videos, 1):
-                    # Обновляем прогресс отправки
+                    logger.warning(f"Ошибка при отправке сообщения об ошибке: {e}")
+                return
+            
+            file_size = os.path.getsize(input_path)
+            logger.info(f"Файл {input_path} успешно скачан, размер: {file_size} байт")
+            
+            # Объем работы - размер видео на число копий: маленькие задачи получают приоритет
+            cost_mb = file_size * copies / (1024 * 1024)
+            
+            if self.job_store is not None:
+                # Обработку выполняет сервис воркеров, копии отправит _run_service_delivery
+                await self._enqueue_service_job(
+                    user_id, user_settings, input_path, file_unique_id, cost_mb, processing_message, chat_id
+                )
+                context.user_data['conversation_state'] = WAITING_FOR_VIDEO
+                return
+            
+            ticket = await self._submit_job(user_id, job_priority(self.is_admin(user_id), cost_mb), processing_message)
+            if ticket is None:
+                return
+            
+            async def send_copy(video_path: str):
+                # Файл отправляется и сразу удаляется, освобождая место в рабочей папке
+                await self._send_output_file(
+                    context.bot.send_video, video_path, 'video',
+                    chat_id=chat_id,
+                    caption=f"🎬 Уникальная копия #{len(processed_videos) + 1}/{copies}"
+                )
+                processed_videos.append(video_path)
+                progress.delivered = len(processed_videos)
+            
+            # Стадия отправки забирает готовые копии из очереди: слот обработки занят только кодированием
+            progress = JobProgress(copies)
+            async with UploadStage(send_copy) as uploads:
+                async with self.job_queue.slot(ticket, partial(self._report_queue_position, processing_message)):
+                    # Обновляем статус
                     try:
                         await asyncio.wait_for(
                             processing_message.edit_text(
-                                f"📤 Отправляю видео {i}/{len(processed_videos)}...\n"
-                                f"✅ Создано {len(processed_videos)} уникальных копий"
+                                f"🔄 Обработка видео...\n"
+                                f"📊 Параметры: {copies} копий\n\n"
+                                f"🎬 Создаю уникальные копии..."
                             ),
                             timeout=5.0
                         )
                     except asyncio.TimeoutError:
-                        logger.warning(f"Таймаут при обновлении прогресса отправки {i}/{len(processed_videos)}")
+                        logger.warning("Таймаут при обновлении сообщения о создании копий")
                     except Exception as e:
-                        logger.warning(f"Ошибка при обновлении прогресса: {e}")
+                        logger.warning(f"Ошибка при обновлении сообщения: {e}")
                     
-                    # Используем asyncio.to_thread для неблокирующего чтения файла
-                    video_data = await asyncio.to_thread(self._read_video_file, video_path)
-                    await context.bot.send_video(
-                        chat_id=chat_id,
-                        video=video_data,
-                        caption=f"🎬 Уникальная копия #{i}/{copies}"
-                    )
-                    # Удаляем временный файл
-                    os.remove(video_path)
-                
-                # Удаляем входной файл с задержкой
-                if input_path and os.path.exists(input_path):
-                    try:
-                        # Небольшая задержка для освобождения файла
-                        await asyncio.sleep(1)
-                        os.remove(input_path)
-                        logger.info(f"Удален входной файл: {input_path}")
-                    except PermissionError:
-                        logger.warning(f"Не удалось удалить входной файл {input_path} - файл заблокирован")
-                        # Планируем удаление позже
-                        asyncio.create_task(self._delayed_file_cleanup(input_path))
-                    except Exception as e:
-                        logger.error(f"Ошибка при удалении входного файла {input_path}: {e}")
-                
-                # Финальное сообщение о завершении
+                    async with aclosing(self._process_with_progress_updates(
+                        input_path, user_id, copies, add_frames, compress, change_resolution,
+                        processing_message, file_unique_id, workspace, progress
+                    )) as ready_videos:
+                        async for video_path in ready_videos:
+                            await uploads.put(video_path)
+            
+            # Финальное сообщение о завершении
+            try:
+                await asyncio.wait_for(
+                    processing_message.edit_text(
+                        f"✅ Обработка завершена!\n"
+                        f"📹 Отправлено {len(processed_videos)} уникальных копий"
+                    ),
+                    timeout=5.0
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Таймаут при отправке финального сообщения")
+                # Отправляем новое сообщение вместо редактирования
                 try:
-                    await asyncio.wait_for(
-                        processing_message.edit_text(
-                            f"✅ Обработка завершена!\n"
-                            f"📹 Отправлено {len(processed_videos)} уникальных копий"
-                        ),
-                        timeout=5.0
+                    await context.bot.send_message(
+                        chat_id=update.effective_chat.id,
+                        text=f"✅ Обработка завершена!\n"
+                             f"📹 Отправлено {len(processed_videos)} уникальных копий"
                     )
-                except asyncio.TimeoutError:
-                    logger.warning("Таймаут при отправке финального сообщения")
-                    # Отправляем новое сообщение вместо редактирования
-                    try:
-                        await context.bot.send_message(
-                            chat_id=update.effective_chat.id,
-                            text=f"✅ Обработка завершена!\n"
-                                 f"📹 Отправлено {len(processed_videos)} уникальных копий"
-                        )
-                    except Exception as send_error:
-                        logger.error(f"Не удалось отправить финальное сообщение: {send_error}")
-                except Exception as e:
-                    logger.warning(f"Не удалось отредактировать сообщение: {e}")
-                    # Отправляем новое сообщение вместо редактирования
-                    try:
-                        await context.bot.send_message(
-                            chat_id=update.effective_chat.id,
-                            text=f"✅ Обработка завершена!\n"
-                                 f"📹 Отправлено {len(processed_videos)} уникальных копий"
-                        )
-                    except Exception as send_error:
-                        logger.error(f"Не удалось отправить финальное сообщение: {send_error}")
-                
-                # Записываем статистику обработки
+                except Exception as send_error:
+                    logger.error(f"Не удалось отправить финальное сообщение: {send_error}")
+            except Exception as e:
+                logger.warning(f"Не удалось отредактировать сообщение: {e}")
+                # Отправляем новое сообщение вместо редактирования
                 try:
-                    input_video_info = {
-                        'file_id': video_file_id,
-                        'file_size': file_size,
-                        'duration': 'unknown'  # Можно добавить получение длительности
-                    }
-                    
-                    processing_params = {
-                        'copies': copies,
-                        'add_frames': add_frames,
-                        'compress': compress,
-                        'change_resolution': change_resolution
-                    }
-                    
-                    self.db_manager.record_video_processing(
-                        user_id=user_id,
-                        input_video_info=input_video_info,
-                        output_count=len(processed_videos),
-                        processing_params=processing_params
+                    await context.bot.send_message(
+                        chat_id=update.effective_chat.id,
+                        text=f"✅ Обработка завершена!\n"
+                             f"📹 Отправлено {len(processed_videos)} уникальных копий"
                     )
-                    logger.info(f"Статистика записана для пользователя {user_id}")
-                except Exception as e:
-                    logger.error(f"Ошибка при записи статистики: {e}")
+                except Exception as send_error:
+                    logger.error(f"Не удалось отправить финальное сообщение: {send_error}")
+            
+            # Записываем статистику обработки
+            try:
+                video_info = await asyncio.to_thread(self.video_processor.probe_cache.get, file_unique_id)
+                input_video_info = {
+                    'file_id': video_file_id,
+                    'file_size': file_size,
+                    'duration': video_info.duration if video_info else 'unknown'
+                }
                 
-                # Отправляем отдельное сообщение с предложением прикрепить следующее видео
+                processing_params = {
+                    'copies': copies,
+                    'add_frames': add_frames,
+                    'compress': compress,
+                    'change_resolution': change_resolution
+                }
+                
+                self.db_manager.record_video_processing(
+                    user_id=user_id,
+                    input_video_info=input_video_info,
+                    output_count=len(processed_videos),
+                    processing_params=processing_params
+                )
+                logger.info(f"Статистика записана для пользователя {user_id}")
+            except Exception as e:
+                logger.error(f"Ошибка при записи статистики: {e}")
+            
+            # Отправляем отдельное сообщение с предложением прикрепить следующее видео
+            try:
+                await context.bot.send_message(
+                    chat_id=chat_id,
+                    text="📹 Прикрепите следующее видео\n\n"
+                         "📋 Требования:\n"
+                         "• Размер файла: до 50 МБ\n"
+                         "• Формат: MP4, AVI, MKV\n"
+                         "• Длительность: до 10 минут\n\n"
+                         "Просто прикрепите видео к сообщению 👇"
+                )
+            except Exception as e:
+                logger.error(f"Ошибка при отправке сообщения: {e}")
+            
+            # Устанавливаем состояние ожидания видео через context
+            context.user_data['conversation_state'] = WAITING_FOR_VIDEO
+            
+        except asyncio.CancelledError:
+            logger.info(f"Обработка видео для пользователя {user_id} была отменена")
+            # Не показываем сообщение об ошибке при отмене
+            return
+            
+        except Exception as e:
+            logger.error(f"Ошибка при обработке видео: {e}")
+            
+            # Переход к ожиданию следующего видео при ошибке
+            try:
+                await asyncio.wait_for(
+                    processing_message.edit_text(
+                        f"❌ Произошла ошибка при обработке видео: {str(e)}\n\n"
+                        "📹 Прикрепите следующее видео\n\n"
+                        "📋 Требования:\n"
+                        "• Размер файла: до 50 МБ\n"
+                        "• Формат: MP4, AVI, MKV\n"
+                        "• Длительность: до 10 минут\n\n"
+                        "Просто прикрепите видео к сообщению 👇"
+                    ),
+                    timeout=5.0
+                )
+            except Exception as edit_error:
+                logger.warning(f"Не удалось отредактировать сообщение об ошибке: {edit_error}")
                 try:
                     await context.bot.send_message(
                         chat_id=chat_id,
-                        text="📹 Прикрепите следующее видео\n\n"
+                        text=f"❌ Произошла ошибка при обработке видео: {str(e)}\n\n"
+                             "📹 Прикрепите следующее видео\n\n"
                              "📋 Требования:\n"
                              "• Размер файла: до 50 МБ\n"
                              "• Формат: MP4, AVI, MKV\n"
                              "• Длительность: до 10 минут\n\n"
                              "Просто прикрепите видео к сообщению 👇"
                     )
-                except Exception as e:
-                    logger.error(f"Ошибка при отправке сообщения: {e}")
-                
-                # Устанавливаем состояние ожидания видео через context
-                context.user_data['conversation_state'] = WAITING_FOR_VIDEO
-                
-            except asyncio.CancelledError:
-                logger.info(f"Обработка видео для пользователя {user_id} была отменена")
-                # Не показываем сообщение об ошибке при отмене
-                return
-                
-            except Exception as e:
-                logger.error(f"Ошибка при обработке видео: {e}")
-                
-                # Переход к ожиданию следующего видео при ошибке
-                try:
-                    await asyncio.wait_for(
-                        processing_message.edit_text(
-                            f"❌ Произошла ошибка при обработке видео: {str(e)}\n\n"
-                            "📹 Прикрепите следующее видео\n\n"
-                            "📋 Требования:\n"
-                            "• Размер файла: до 50 МБ\n"
-                            "• Формат: MP4, AVI, MKV\n"
-                            "• Длительность: до 10 минут\n\n"
-                            "Просто прикрепите видео к сообщению 👇"
-                        ),
-                        timeout=5.0
-                    )
-                except Exception as edit_error:
-                    logger.warning(f"Не удалось отредактировать сообщение об ошибке: {edit_error}")
-                    try:
-                        await context.bot.send_message(
-                            chat_id=chat_id,
-                            text=f"❌ Произошла ошибка при обработке видео: {str(e)}\n\n"
-                                 "📹 Прикрепите следующее видео\n\n"
-                                 "📋 Требования:\n"
-                                 "• Размер файла: до 50 МБ\n"
-                                 "• Формат: MP4, AVI, MKV\n"
-                                 "• Длительность: до 10 минут\n\n"
-                                 "Просто прикрепите видео к сообщению 👇"
-                        )
-                    except Exception as send_error:
-                        logger.error(f"Не удалось отправить сообщение об ошибке: {send_error}")
-                
-                # Устанавливаем состояние ожидания видео через context
-                context.user_data['conversation_state'] = WAITING_FOR_VIDEO
-            finally:
-                # Очищаем временные файлы при отмене с безопасным удалением
-                if input_path and os.path.exists(input_path):
-                    try:
-                        await asyncio.sleep(0.5)  # Небольшая задержка
-                        os.remove(input_path)
-                        logger.info(f"Удален входной файл: {input_path}")
-                    except PermissionError:
-                        logger.warning(f"Входной файл {input_path} заблокирован, планируем отложенное удаление")
-                        asyncio.create_task(self._delayed_file_cleanup(input_path))
-                    except Exception as e:
-                        logger.error(f"Ошибка при удалении входного файла {input_path}: {e}")
-                
-                # Очищаем обработанные файлы при отмене
-                for video_path in processed_videos:
-                    if os.path.exists(video_path):
-                        try:
-                            await asyncio.sleep(0.1)  # Небольшая задержка между удалениями
-                            os.remove(video_path)
-                            logger.info(f"Удален обработанный файл: {video_path}")
-                        except PermissionError:
-                            logger.warning(f"Обработанный файл {video_path} заблокирован, планируем отложенное удаление")
-                            asyncio.create_task(self._delayed_file_cleanup(video_path))
-                        except Exception as e:
-                            logger.error(f"Ошибка при удалении обработанного файла {video_path}: {e}")
-                
-                # Очищаем данные пользователя и активную задачу
-                if user_id in self.user_data:
-                    del self.user_data[user_id]
-                if user_id in self.active_processing_tasks:
-                    del self.active_processing_tasks[user_id]
+                except Exception as send_error:
+                    logger.error(f"Не удалось отправить сообщение об ошибке: {send_error}")
+            
+            # Устанавливаем состояние ожидания видео через context
+            context.user_data['conversation_state'] = WAITING_FOR_VIDEO
+        finally:
+            # Входной файл, промежуточные файлы и копии удаляются вместе с рабочей папкой
+            if workspace is not None:
+                await asyncio.to_thread(workspace.cleanup)
+            
+            # Очищаем данные пользователя и активную задачу
+            if user_id in self.user_data:
+                del self.user_data[user_id]
+            if user_id in self.active_processing_tasks:
+                del self.active_processing_tasks[user_id]
 
     async def _process_with_progress_updates(self, input_path: str, user_id: int, 
                                            copies: int, add_frames: bool, compress: bool, change_resolution: bool,
-                                           processing_message):
-        """Обработка видео с параллельной обработкой всех копий одновременно"""
+                                           processing_message, file_unique_id: str = None, workspace=None,
+                                           progress: JobProgress = None):
+        """Обработка всех копий одновременно; пути к готовым копиям отдаются по мере готовности"""
         
         # Обновляем статус - начинаем параллельную обработку
         try:
@@ -1252,67 +1532,70 @@ class VideoBot:
         except Exception as e:
             logger.warning(f"Ошибка при обновлении сообщения: {e}")
         
-        # Создаем задачи для параллельной обработки всех копий
-        tasks = []
-        output_paths = []
+        output_paths = [workspace.output_path(i) for i in range(copies)]
         
-        for i in range(copies):
-            output_path = f"output/processed_{user_id}_{i+1}.mp4"
-            output_paths.append(output_path)
-            
-            # Создаем задачу для каждой копии
-            task = self._process_single_copy(
-                input_path, output_path, i, add_frames, compress, change_resolution, user_id
-            )
-            tasks.append(task)
-        
-        # Создаем задачу для периодического обновления статуса
-        completed_count = {'value': 0}
+        # Прогресс по кадрам приходит из воркера, статус обновляется периодически
+        if progress is None:
+            progress = JobProgress(copies)
         status_update_task = asyncio.create_task(
-            self._update_processing_status(processing_message, copies, completed_count)
+            self._update_processing_status(processing_message, copies, progress)
         )
         
-        # Запускаем все копии параллельно
-        logger.info(f"🚀 Запускаю параллельную обработку {copies} копий")
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Останавливаем обновление статуса
-        status_update_task.cancel()
+        # Все копии создаются за одно декодирование входного видео
+        logger.info(f"🚀 Запускаю fan-out обработку {copies} копий")
+        created = 0
         try:
-            await status_update_task
-        except asyncio.CancelledError:
-            pass
-        
-        # Собираем успешно обработанные видео
-        processed_videos = []
-        for i, (result, output_path) in enumerate(zip(results, output_paths)):
-            if isinstance(result, Exception):
-                logger.error(f"❌ Ошибка при создании копии {i+1}: {str(result)}")
-            elif result and os.path.exists(output_path):
-                processed_videos.append(output_path)
-                logger.info(f"✅ Копия {i+1} создана успешно")
-            else:
-                logger.error(f"❌ Копия {i+1} не была создана")
+            async with aclosing(self._process_copies(
+                input_path, output_paths, add_frames, compress, change_resolution, user_id, file_unique_id,
+                progress, workspace.work_dir
+            )) as ready_copies:
+                async for i, result in ready_copies:
+                    output_path = output_paths[i]
+                    if result and os.path.exists(output_path):
+                        created += 1
+                        logger.info(f"✅ Копия {i+1} создана успешно")
+                        yield output_path
+                    else:
+                        logger.error(f"❌ Копия {i+1} не была создана")
+        finally:
+            # Останавливаем обновление статуса
+            status_update_task.cancel()
+            try:
+                await status_update_task
+            except asyncio.CancelledError:
+                pass
         
-        logger.info(f"✅ Параллельная обработка завершена. Успешно: {len(processed_videos)}/{copies}")
-        return processed_videos
+        logger.info(f"✅ Параллельная обработка завершена. Успешно: {created}/{copies}")
     
-    async def _update_processing_status(self, processing_message, total_copies: int, completed_count: dict):
-        """Периодически обновляет статус обработки"""
+    async def _update_processing_status(self, processing_message, total_copies: int, progress: JobProgress):
+        """Периодически обновляет статус обработки: процент по каждой копии и оставшееся время"""
         dots = 0
         last_text = ""
         while True:
             try:
-                await asyncio.sleep(3)  # Обновляем каждые 3 секунды
+                # Telegram ограничивает частоту редактирования, поэтому не чаще раза в PROGRESS_UPDATE_INTERVAL секунд
+                await asyncio.sleep(PROGRESS_UPDATE_INTERVAL)
                 dots = (dots + 1) % 4
                 animation = "." * dots
                 
-                new_text = (
-                    f"🔄 Обработка видео{animation}\n"
-                    f"📊 Обрабатываю {total_copies} копий параллельно\n\n"
-                    f"⚡ Это быстрее в {total_copies}x раз!\n"
-                    f"⏳ Пожалуйста, подождите..."
-                )
+                if progress.started:
+                    copy_lines = "\n".join(
+                        f"🎬 Копия {i + 1}: {format_progress_bar(progress.copy_percent(i))} {progress.copy_percent(i)}%"
+                        for i in range(total_copies)
+                    )
+                    new_text = (
+                        f"🔄 Обработка видео: {progress.percent}%\n\n"
+                        f"{copy_lines}\n\n"
+                        f"⏳ Осталось: {format_eta(progress.eta_seconds())}"
+                    )
+                    if progress.delivered:
+                        new_text += f"\n📤 Отправлено: {progress.delivered}/{total_copies}"
+                else:
+                    new_text = (
+                        f"🔄 Обработка видео{animation}\n"
+                        f"📊 Обрабатываю {total_copies} копий параллельно\n\n"
+                        f"⏳ Пожалуйста, подождите..."
+                    )
                 
                 # Редактируем только если текст изменился
                 if new_text != last_text:
@@ -1335,56 +1618,56 @@ class VideoBot:
                 logger.error(f"Ошибка при обновлении статуса: {e}")
                 break
 
-    async def _process_single_copy(self, input_path: str, output_path: str, 
-                                 copy_index: int, add_frames: bool, compress: bool, change_resolution: bool, user_id: int = None):
-        """Обработка одной копии видео"""
+    async def _process_copies(self, input_path: str, output_paths: list, add_frames: bool,
+                              compress: bool, change_resolution: bool, user_id: int = None,
+                              file_unique_id: str = None, progress: JobProgress = None, work_dir: str = None):
+        """Обработка всех копий видео за одно декодирование; пары (copy_index, успех) в порядке готовности"""
+        copies = len(output_paths)
+        
+        # Метаданные берутся из кеша по file_unique_id, при промахе - из заголовка файла
+        video_info = await self.video_processor.probe_cache.probe(input_path, file_unique_id)
+        
+        # Таймаут по длительности и разрешению видео (без метаданных - по размеру файла)
+        file_size = os.path.getsize(input_path) / (1024 * 1024)  # MB
+        timeout_seconds = estimate_processing_timeout(video_info, copies, file_size, minimum=600, seconds_per_mb=60)
+        logger.info(f"Установлен таймаут: {timeout_seconds} секунд для файла {file_size:.2f} MB")
+        
+        # Профиль кодирования: часы пик и уровень пользователя
+        profile = select_encoding_profile(self.is_admin(user_id))
+        logger.info(f"Профиль кодирования: {profile}")
+        
+        job = VideoCopyJob(
+            input_path=input_path,
+            output_paths=output_paths,
+            add_frames=add_frames,
+            compress=compress,
+            change_resolution=change_resolution,
+            user_id=user_id,
+            video_info=video_info.to_dict() if video_info else None,
+            work_dir=work_dir,
+            profile=profile
+        )
+        
+        reported = set()
         try:
-            # Используем ThreadPoolExecutor вместо ProcessPoolExecutor для избежания проблем с pickle
-            loop = asyncio.get_event_loop()
-            
-            # Увеличиваем таймаут для больших файлов
-            file_size = os.path.getsize(input_path) / (1024 * 1024)  # MB
-            timeout_seconds = max(600, int(file_size * 60))  # Минимум 10 минут, +60 сек на MB
-            logger.info(f"Установлен таймаут: {timeout_seconds} секунд для файла {file_size:.2f} MB")
-            
-            result = await asyncio.wait_for(
-                loop.run_in_executor(
-                    None,  # Используем стандартный ThreadPoolExecutor
-                    self._process_video_copy_wrapper,
-                    input_path, output_path, copy_index, add_frames, compress, change_resolution, user_id
-                ),
-                timeout=timeout_seconds
-            )
-            
-            return True
+            # Кадровая обработка держит GIL, поэтому копии выполняются в пуле процессов
+            async with aclosing(self.video_processor.iter_copy_job(
+                job, timeout=timeout_seconds, progress=progress
+            )) as ready_copies:
+                async for copy_index, result in ready_copies:
+                    reported.add(copy_index)
+                    yield copy_index, result
             
         except asyncio.TimeoutError:
-            logger.error(f"Таймаут при создании копии {copy_index+1} (превышен лимит {timeout_seconds} секунд)")
+            logger.error(f"Таймаут при создании копий (превышен лимит {timeout_seconds} секунд)")
             logger.error(f"Файл: {input_path}, размер: {file_size:.2f} MB")
-            return False
         except Exception as e:
-            logger.error(f"Ошибка при создании копии {copy_index+1}: {str(e)}")
-            return False
-
-    def _process_video_copy_wrapper(self, input_path: str, output_path: str, 
-                                  copy_index: int, add_frames: bool, compress: bool, change_resolution: bool, user_id: int = None):
-        """Обертка для функции обработки видео"""
-        from video_processor import process_video_copy_new
-        
-        # Получаем абсолютные пути
-        abs_input_path = os.path.abspath(input_path)
-        abs_output_path = os.path.abspath(output_path)
-        
-        # Создаем директорию для выходного файла если не существует
-        os.makedirs(os.path.dirname(abs_output_path), exist_ok=True)
+            logger.error(f"Ошибка при создании копий: {str(e)}")
         
-        # Вызываем функцию обработки с user_id для поддержки отмены
-        return process_video_copy_new(abs_input_path, abs_output_path, copy_index, add_frames, compress, change_resolution, user_id)
-
-    def _read_video_file(self, video_path: str):
-        """Синхронная функция для чтения видеофайла"""
-        with open(video_path, 'rb') as video_file:
-            return video_file.read()
+        # Копии, которые не успели стать готовыми, считаются неудачными
+        for copy_index in range(copies):
+            if copy_index not in reported:
+                yield copy_index, False
 
     async def back_to_main(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Возврат в главное меню"""
@@ -1394,6 +1677,7 @@ class VideoBot:
         user_id = query.from_user.id
         if user_id in self.user_data:
             del self.user_data[user_id]
+        self.prefetcher.discard(user_id)
         
         welcome_text = (
             "🎬 **Главное меню**\n\n"
@@ -1538,6 +1822,8 @@ class VideoBot:
                         logger.error(f"Ошибка при удалении файла {video_path}: {e}")
             
             del self.user_data[user_id]
+        # Файл, скачанный заранее, больше не понадобится
+        self.prefetcher.discard(user_id)
         
         # Убираем клавиатуру и показываем сообщение о загрузке видео
         reply_markup = ReplyKeyboardRemove()
@@ -1840,6 +2126,7 @@ class VideoBot:
                                  processing_message, context, chat_id: int):
         """Асинхронная обработка изображения с промежуточными обновлениями"""
         input_path = None
+        prefetched_workspace = None
         processed_images = []
         
         try:
@@ -1852,28 +2139,36 @@ class VideoBot:
             # Используем оригинальное изображение
             image_file_id = user_settings.get('image_file_id')
             
-            # Скачиваем файл
-            try:
-                await asyncio.wait_for(
-                    processing_message.edit_text(
-                        f"🔄 Обработка изображения...\n"
-                        f"📊 Параметры: {copies} копий\n\n"
-                        f"📥 Скачиваю изображение..."
-                    ),
-                    timeout=5.0
-                )
-            except asyncio.TimeoutError:
-                logger.warning("Таймаут при обновлении сообщения о скачивании")
-            except Exception as e:
-                logger.warning(f"Ошибка при обновлении сообщения: {e}")
-            
-            image_file = await context.bot.get_file(image_file_id)
-            input_path = f"temp/input_image_{user_id}.jpg"
-            
-            # Создаем директорию temp если не существует
-            os.makedirs("temp", exist_ok=True)
+            # Стадия скачивания идет до очереди обработки: слот обработки не ждет сеть
+            if not self.prefetcher.is_ready(user_id, image_file_id):
+                try:
+                    await asyncio.wait_for(
+                        processing_message.edit_text(
+                            f"🔄 Обработка изображения...\n"
+                            f"📊 Параметры: {copies} копий\n\n"
+                            f"📥 Скачиваю изображение..."
+                        ),
+                        timeout=5.0
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning("Таймаут при обновлении сообщения о скачивании")
+                except Exception as e:
+                    logger.warning(f"Ошибка при обновлении сообщения: {e}")
             
-            await image_file.download_to_drive(input_path)
+            prefetched = await self.prefetcher.take(user_id, image_file_id)
+            if prefetched is not None:
+                prefetched_workspace = prefetched.workspace
+                input_path = prefetched.path
+            else:
+                input_path = f"temp/input_image_{user_id}.jpg"
+                
+                # Создаем директорию temp если не существует
+                os.makedirs("temp", exist_ok=True)
+                
+                async with self.download_semaphore:
+                    await self.input_cache.fetch(
+                        context.bot, image_file_id, user_settings.get('image_file_unique_id'), input_path
+                    )
             
             # Проверяем что файл был скачан
             if not os.path.exists(input_path):
@@ -1892,20 +2187,10 @@ class VideoBot:
             file_size = os.path.getsize(input_path)
             logger.info(f"Файл {input_path} успешно скачан, размер: {file_size} байт")
             
-            # Обновляем статус
-            try:
-                await asyncio.wait_for(
-                    processing_message.edit_text(
-                        f"🔄 Обработка изображения...\n"
-                        f"📊 Параметры: {copies} копий\n\n"
-                        f"🎨 Создаю уникальные копии..."
-                    ),
-                    timeout=5.0
-                )
-            except asyncio.TimeoutError:
-                logger.warning("Таймаут при обновлении сообщения о создании копий")
-            except Exception as e:
-                logger.warning(f"Ошибка при обновлении сообщения: {e}")
+            # Изображение обрабатывается за секунды - всегда маленькая задача
+            ticket = await self._submit_job(user_id, job_priority(self.is_admin(user_id), 0), processing_message)
+            if ticket is None:
+                return
             
             # Получаем выбранный размер
             target_size = user_settings.get('target_size', None)
@@ -1919,50 +2204,52 @@ class VideoBot:
             else:
                 target_size_tuple = None
             
-            # Обрабатываем изображение
-            processed_images = await self.image_processor.process_image(
-                input_path, user_id, copies, add_frames, add_filters, add_rotation, change_size, target_size_tuple
-            )
-            
-            # Обновляем сообщение
-            try:
-                await asyncio.wait_for(
-                    processing_message.edit_text(
-                        f"📤 Отправляю обработанные изображения...\n"
-                        f"✅ Создано {len(processed_images)} уникальных копий"
-                    ),
-                    timeout=5.0
-                )
-            except asyncio.TimeoutError:
-                logger.warning("Таймаут при обновлении сообщения о готовности к отправке")
-            except Exception as e:
-                logger.warning(f"Ошибка при обновлении сообщения: {e}")
-            
-            # Отправляем обработанные изображения
-            for i, image_path in enumerate(processed_images, 1):
+            async def send_copy(image_path: str):
+                i = uploads.sent + 1
+                
                 # Обновляем прогресс отправки
                 try:
                     await asyncio.wait_for(
-                        processing_message.edit_text(
-                            f"📤 Отправляю изображение {i}/{len(processed_images)}...\n"
-                            f"✅ Создано {len(processed_images)} уникальных копий"
-                        ),
+                        processing_message.edit_text(f"📤 Отправляю изображение {i}/{copies}..."),
                         timeout=5.0
                     )
                 except asyncio.TimeoutError:
-                    logger.warning(f"Таймаут при обновлении прогресса отправки {i}/{len(processed_images)}")
+                    logger.warning(f"Таймаут при обновлении прогресса отправки {i}/{copies}")
                 except Exception as e:
                     logger.warning(f"Ошибка при обновлении прогресса: {e}")
                 
-                # Используем asyncio.to_thread для неблокирующего чтения файла
-                image_data = await asyncio.to_thread(self._read_image_file, image_path)
-                await context.bot.send_photo(
+                # Файл отправляется и сразу удаляется
+                await self._send_output_file(
+                    context.bot.send_photo, image_path, 'photo',
                     chat_id=chat_id,
-                    photo=image_data,
                     caption=f"🖼️ Уникальная копия #{i}/{copies}"
                 )
-                # Удаляем временный файл
-                os.remove(image_path)
+            
+            # Стадия отправки забирает готовые копии из очереди: слот обработки занят только обработкой
+            async with UploadStage(send_copy) as uploads:
+                async with self.job_queue.slot(ticket, partial(self._report_queue_position, processing_message)):
+                    # Обновляем статус
+                    try:
+                        await asyncio.wait_for(
+                            processing_message.edit_text(
+                                f"🔄 Обработка изображения...\n"
+                                f"📊 Параметры: {copies} копий\n\n"
+                                f"🎨 Создаю уникальные копии..."
+                            ),
+                            timeout=5.0
+                        )
+                    except asyncio.TimeoutError:
+                        logger.warning("Таймаут при обновлении сообщения о создании копий")
+                    except Exception as e:
+                        logger.warning(f"Ошибка при обновлении сообщения: {e}")
+                    
+                    async with aclosing(self.image_processor.iter_image_copies(
+                        input_path, user_id, copies, add_frames, add_filters, add_rotation, change_size,
+                        target_size_tuple
+                    )) as ready_images:
+                        async for image_path in ready_images:
+                            processed_images.append(image_path)
+                            await uploads.put(image_path)
             
             # Удаляем входной файл с задержкой
             if input_path and os.path.exists(input_path):
@@ -2109,17 +2396,16 @@ class VideoBot:
                     except Exception as e:
                         logger.error(f"Ошибка при удалении обработанного файла {image_path}: {e}")
             
+            # Папка файла, скачанного заранее
+            if prefetched_workspace is not None:
+                prefetched_workspace.cleanup()
+            
             # Очищаем данные пользователя и активную задачу
             if user_id in self.user_data:
                 del self.user_data[user_id]
             if user_id in self.active_processing_tasks:
                 del self.active_processing_tasks[user_id]
 
-    def _read_image_file(self, image_path: str):
-        """Синхронная функция для чтения изображения"""
-        with open(image_path, 'rb') as image_file:
-            return image_file.read()
-
 def main():
     """Запуск бота"""
     if not BOT_TOKEN:
@@ -2131,12 +2417,27 @@ def main():
     from config import TEMP_DIR
     cleanup_old_temp_files(TEMP_DIR)
     
-    # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
-    
     # Создаем экземпляр бота
     video_bot = VideoBot()
     
+    # Создаем приложение
+    builder = Application.builder().token(BOT_TOKEN)
+    builder = builder.post_init(video_bot.post_init).post_shutdown(video_bot.post_shutdown)
+    if TELEGRAM_LOCAL_MODE:
+        # Локальный сервер Bot API: файлы передаются по пути на общем диске
+        builder = builder.base_url(TELEGRAM_BOT_API_URL).local_mode(True)
+        if TELEGRAM_BOT_API_FILE_URL:
+            builder = builder.base_file_url(TELEGRAM_BOT_API_FILE_URL)
+    application = builder.build()
+    
+    # Удаляем рабочие папки задач, оставшиеся после аварийной остановки
+    video_bot.workspaces.cleanup_stale()
+    # Кеш скачанных файлов: записи старше срока хранения и сверх бюджета
+    video_bot.input_cache.evict()
+    
+    # Заранее поднимаем процессы-воркеры, чтобы первая задача не ждала импорта moviepy
+    video_bot.video_processor.worker_pool.start()
+    
     # Настраиваем обработчик разговора
     conv_handler = ConversationHandler(
         entry_points=[
@@ -2245,7 +2546,10 @@ def main():
     
     # Запускаем бота
     logger.info("Бот запущен")
-    application.run_polling()
+    try:
+        application.run_polling()
+    finally:
+        video_bot.video_processor.worker_pool.shutdown()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -21,6 +21,82 @@ if ADMIN_IDS_STR:
 MAX_VIDEO_SIZE = 50 * 1024 * 1024  # 50 MB
 SUPPORTED_VIDEO_FORMATS = ['.mp4', '.avi', '.mov', '.mkv']
 
+# Бэкенд обработки видео: 'moviepy' (кадры обрабатываются в Python) или 'ffmpeg' (фильтрграф ffmpeg)
+VIDEO_BACKEND = os.getenv('VIDEO_BACKEND', 'moviepy')
+
+# Без рамок, сжатия и смены разрешения копии создаются без перекодирования (только контейнер)
+VIDEO_REMUX_FAST_PATH = os.getenv('VIDEO_REMUX_FAST_PATH', 'true').lower() in ('1', 'true', 'yes')
+
+# Управление битрейтом: 'target_size' - битрейт копий подбирается так, чтобы файл
+# уложился в VIDEO_TARGET_SIZE_MB (лимит отправки Telegram - 50 МБ); 'fixed' - фиксированные битрейты
+VIDEO_RATE_CONTROL = os.getenv('VIDEO_RATE_CONTROL', 'target_size')
+VIDEO_TARGET_SIZE_MB = float(os.getenv('VIDEO_TARGET_SIZE_MB', 48))
+
+# Профили кодирования libx264: preset/tune, режим битрейта (crf=None - по битрейту,
+# иначе CRF с ограничением maxrate), GOP в кадрах и раскладка MP4 с moov в начале (faststart)
+ENCODING_PROFILES = {
+    'fast': {'preset': 'veryfast', 'tune': None, 'crf': None, 'gop': 120, 'faststart': True},
+    'balanced': {'preset': 'medium', 'tune': None, 'crf': None, 'gop': 250, 'faststart': True},
+    'quality': {'preset': 'slow', 'tune': 'film', 'crf': 20, 'gop': 250, 'faststart': True},
+}
+ENCODING_PROFILE = os.getenv('ENCODING_PROFILE', 'balanced')  # Профиль по умолчанию
+ENCODING_PROFILE_ADMIN = os.getenv('ENCODING_PROFILE_ADMIN', '')  # Профиль для администраторов
+# Профиль в часы пик, например ENCODING_PEAK_HOURS=18-23 и ENCODING_PEAK_PROFILE=fast
+ENCODING_PEAK_PROFILE = os.getenv('ENCODING_PEAK_PROFILE', '')
+ENCODING_PEAK_HOURS = os.getenv('ENCODING_PEAK_HOURS', '')
+
+# Пул процессов для обработки видео
+VIDEO_WORKER_PROCESSES = int(os.getenv('VIDEO_WORKER_PROCESSES', os.cpu_count() or 4))
+VIDEO_WORKER_MAX_TASKS = int(os.getenv('VIDEO_WORKER_MAX_TASKS', 20))  # Перезапуск воркера после N задач
+
+# Общий бюджет потоков кодирования (libx264) на все задачи
+ENCODER_THREAD_BUDGET = int(os.getenv('ENCODER_THREAD_BUDGET', os.cpu_count() or 4))
+ENCODER_MAX_THREADS_PER_COPY = int(os.getenv('ENCODER_MAX_THREADS_PER_COPY', 4))
+
+# Сегментное кодирование длинных видео при свободных ядрах
+VIDEO_SEGMENT_MIN_DURATION = int(os.getenv('VIDEO_SEGMENT_MIN_DURATION', 60))  # секунд
+VIDEO_MAX_SEGMENTS = int(os.getenv('VIDEO_MAX_SEGMENTS', 4))
+
+# Рабочие папки задач в RAM (tmpfs); пустое значение - только диск (TEMP_DIR)
+WORKSPACE_RAM_DIR = os.getenv('WORKSPACE_RAM_DIR', '/dev/shm/videobot')
+WORKSPACE_RAM_BUDGET_MB = int(os.getenv('WORKSPACE_RAM_BUDGET_MB', 2048))  # Сверх бюджета - на диск
+
+# Сколько файлов одновременно отправляется в Telegram (ограничивает память на отправку)
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', 4))
+
+# Сколько файлов одновременно скачивается из Telegram (стадия скачивания, независимо от слотов обработки)
+DOWNLOAD_CONCURRENCY = int(os.getenv('DOWNLOAD_CONCURRENCY', 4))
+
+# Локальный сервер Telegram Bot API (--local): файлы отправляются по пути, без чтения в память бота
+TELEGRAM_BOT_API_URL = os.getenv('TELEGRAM_BOT_API_URL', '')  # например http://localhost:8081/bot
+TELEGRAM_BOT_API_FILE_URL = os.getenv('TELEGRAM_BOT_API_FILE_URL', '')  # например http://localhost:8081/file/bot
+TELEGRAM_LOCAL_MODE = bool(TELEGRAM_BOT_API_URL)
+
+# Очередь задач обработки: одновременные задачи, лимит задач пользователя и порог маленькой задачи
+JOB_QUEUE_CONCURRENCY = int(os.getenv('JOB_QUEUE_CONCURRENCY', 10))
+JOB_QUEUE_MAX_PER_USER = int(os.getenv('JOB_QUEUE_MAX_PER_USER', 3))  # В очереди и в работе
+JOB_QUEUE_SMALL_JOB_MB = float(os.getenv('JOB_QUEUE_SMALL_JOB_MB', 30))  # Размер входа в МБ x число копий
+JOB_QUEUE_AGING_SECONDS = float(os.getenv('JOB_QUEUE_AGING_SECONDS', 60))  # Повышение приоритета за ожидание
+
+# Адаптивный допуск: лимит одновременных задач подстраивается под load average и свободную память
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', 'true').lower() in ('1', 'true', 'yes')
+ADMISSION_MIN_JOBS = int(os.getenv('ADMISSION_MIN_JOBS', 1))
+ADMISSION_MAX_JOBS = int(os.getenv('ADMISSION_MAX_JOBS', 20))
+ADMISSION_INTERVAL = float(os.getenv('ADMISSION_INTERVAL', 5))  # Как часто снимать нагрузку, секунд
+ADMISSION_TARGET_LOAD = float(os.getenv('ADMISSION_TARGET_LOAD', 1.0))  # Load average на ядро
+ADMISSION_MIN_FREE_MB = int(os.getenv('ADMISSION_MIN_FREE_MB', 1024))  # Меньше - лимит снижается, задачи ждут
+ADMISSION_JOB_MEMORY_MB = int(os.getenv('ADMISSION_JOB_MEMORY_MB', 400))  # Оценка памяти одной задачи
+ADMISSION_COOLDOWN = float(os.getenv('ADMISSION_COOLDOWN', 30))  # Пауза между увеличениями лимита, секунд
+# Если 90% последних задач ждали в очереди дольше, лимит растет до ADMISSION_TARGET_LOAD, а не до 80% цели
+ADMISSION_MAX_QUEUE_WAIT = float(os.getenv('ADMISSION_MAX_QUEUE_WAIT', 60))  # секунд
+
+# Скачивание файла сразу после получения, пока пользователь выбирает параметры
+MEDIA_PREFETCH = os.getenv('MEDIA_PREFETCH', 'true').lower() in ('1', 'true', 'yes')
+MEDIA_PREFETCH_TTL = int(os.getenv('MEDIA_PREFETCH_TTL', 900))  # Невостребованный файл удаляется через N секунд
+
+# Как часто обновлять сообщение о прогрессе обработки, секунд
+PROGRESS_UPDATE_INTERVAL = float(os.getenv('PROGRESS_UPDATE_INTERVAL', 5))
+
 # Настройки для обработки изображений
 MAX_IMAGE_SIZE = 20 * 1024 * 1024  # 20 MB
 SUPPORTED_IMAGE_FORMATS = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp']
@@ -28,6 +104,30 @@ OUTPUT_DIR = 'processed_videos'
 OUTPUT_IMAGES_DIR = 'processed_images'
 TEMP_DIR = 'temp'
 
+# Кеш скачанных файлов по file_unique_id: повторное видео не скачивается из Telegram
+INPUT_CACHE_DIR = os.getenv('INPUT_CACHE_DIR', os.path.join(TEMP_DIR, 'input_cache'))  # пустое - кеш выключен
+INPUT_CACHE_MAX_MB = int(os.getenv('INPUT_CACHE_MAX_MB', 4096))
+INPUT_CACHE_TTL = int(os.getenv('INPUT_CACHE_TTL', 24 * 3600))  # Удаляется, если не использовался N секунд
+
+# Где выполняется обработка видео: 'local' - в процессе бота, 'service' - в сервисе воркеров
+# (worker_service.py), которому бот передает задачи через постоянную очередь в SQLite
+JOB_EXECUTION = os.getenv('JOB_EXECUTION', 'local')
+JOB_STORE_DB = os.getenv('JOB_STORE_DB', 'job_queue.db')
+JOB_SERVICE_DIR = os.getenv('JOB_SERVICE_DIR', os.path.join(TEMP_DIR, 'jobs'))  # Общая папка бота и воркеров
+JOB_SERVICE_PROCESSES = int(os.getenv('JOB_SERVICE_PROCESSES', max(1, (os.cpu_count() or 2) // 2)))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))  # Попыток на задачу при сбоях воркеров
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', 60))  # Без продления аренды задача возвращается в очередь
+JOB_SERVICE_POLL_INTERVAL = float(os.getenv('JOB_SERVICE_POLL_INTERVAL', 2))  # Как часто проверять очередь, секунд
+
+# Воркеры на других серверах получают задачи через брокер (job_broker.py): бот слушает JOB_BROKER_LISTEN,
+# воркеры подключаются к JOB_BROKER_URL; без JOB_BROKER_URL воркер работает с JOB_STORE_DB напрямую
+JOB_BROKER_LISTEN = os.getenv('JOB_BROKER_LISTEN', '')  # host:port, пустое - брокер выключен
+JOB_BROKER_URL = os.getenv('JOB_BROKER_URL', '')  # host:port брокера для воркера
+JOB_BROKER_TOKEN = os.getenv('JOB_BROKER_TOKEN', '')  # Общий секрет бота и воркеров
+# true - JOB_SERVICE_DIR смонтирована на всех серверах по одному пути, файлы не передаются через брокер
+JOB_BROKER_SHARED_STORAGE = os.getenv('JOB_BROKER_SHARED_STORAGE', 'false').lower() == 'true'
+JOB_BROKER_TIMEOUT = float(os.getenv('JOB_BROKER_TIMEOUT', 60))  # Таймаут сетевых операций брокера, секунд
+
 # Создаем необходимые директории
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(OUTPUT_IMAGES_DIR, exist_ok=True)
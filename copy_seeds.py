@@ -0,0 +1,19 @@
+"""
+Изолированные генераторы случайных чисел для копий задачи
+"""
+
+import random
+
+
+def new_job_seed() -> int:
+    """Случайный seed задачи; сохраненный seed воспроизводит те же параметры копий"""
+    return random.SystemRandom().getrandbits(64)
+
+
+def copy_rng(job_seed: int, copy_index: int) -> random.Random:
+    """Отдельный генератор копии: не зависит от глобального random и от других копий.
+
+    Один и тот же (job_seed, copy_index) всегда дает одну и ту же
+    последовательность - в потоке, процессе-воркере или на другой машине.
+    """
+    return random.Random(f"{job_seed}:{copy_index}")
@@ -98,6 +98,15 @@ class DatabaseManager:
                     )
                 ''')
                 
+                # Создаем таблицу кеша метаданных видео (по Telegram file_unique_id)
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS video_probe_cache (
+                        file_unique_id TEXT PRIMARY KEY,
+                        video_info TEXT NOT NULL,
+                        created_at TEXT NOT NULL
+                    )
+                ''')
+                
                 # Создаем индексы для быстрого поиска
                 cursor.execute('''
                     CREATE INDEX IF NOT EXISTS idx_users_last_seen 
@@ -232,6 +241,36 @@ class DatabaseManager:
             logger.error(f"Ошибка при записи статистики обработки видео: {e}")
             raise
 
+    def get_video_probe(self, file_unique_id: str) -> Optional[Dict]:
+        """Возвращает закешированные метаданные видео или None"""
+        try:
+            with sqlite3.connect(self.db_file) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'SELECT video_info FROM video_probe_cache WHERE file_unique_id = ?',
+                    (file_unique_id,)
+                )
+                row = cursor.fetchone()
+                return json.loads(row[0]) if row else None
+                
+        except Exception as e:
+            logger.error(f"Ошибка при чтении кеша метаданных видео: {e}")
+            return None
+    
+    def save_video_probe(self, file_unique_id: str, video_info: Dict):
+        """Сохраняет метаданные видео в кеш"""
+        try:
+            with sqlite3.connect(self.db_file) as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO video_probe_cache (file_unique_id, video_info, created_at)
+                    VALUES (?, ?, ?)
+                ''', (file_unique_id, json.dumps(video_info), get_utc_now()))
+                conn.commit()
+                
+        except Exception as e:
+            logger.error(f"Ошибка при записи кеша метаданных видео: {e}")
+
     def record_image_processing(self, user_id: int, input_image_info: Dict, output_count: int, processing_params: Dict):
         """Записывает информацию об обработке изображений"""
         try:
@@ -495,6 +534,12 @@ class DatabaseManager:
                     WHERE timestamp < ?
                 ''', (cutoff_timestamp,))
                 
+                # Удаляем устаревший кеш метаданных видео
+                cursor.execute('''
+                    DELETE FROM video_probe_cache 
+                    WHERE created_at < ?
+                ''', (cutoff_timestamp,))
+                
                 # Обновляем количество уникальных дней активности
                 cursor.execute('''
                     UPDATE users 
@@ -0,0 +1,143 @@
+"""
+Планировщик потоков кодирования видео
+"""
+
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from config import (
+    ENCODER_THREAD_BUDGET, ENCODER_MAX_THREADS_PER_COPY, VIDEO_SEGMENT_MIN_DURATION, VIDEO_MAX_SEGMENTS, VIDEO_BACKEND
+)
+
+logger = logging.getLogger(__name__)
+
+# Площадь кадра на один полезный поток libx264: маленькие кадры много потоков не используют
+PIXELS_PER_ENCODER_THREAD = 480 * 240
+
+# Минимальная длина одного сегмента при сегментном кодировании, секунд
+MIN_SEGMENT_SECONDS = 15
+
+
+@dataclass
+class EncoderSlot:
+    """Выделенная задаче доля бюджета: число потоков на каждый энкодер копии
+    и число сегментов, которые кодируются параллельно"""
+    copies: int
+    threads_per_copy: int
+    segments: int = 1
+
+    @property
+    def threads(self) -> int:
+        return self.copies * self.threads_per_copy * self.segments
+
+
+class EncoderScheduler:
+    """Глобальный бюджет потоков libx264 на все задачи бота.
+
+    Каждая задача получает явное число потоков на энкодер копии и ждет,
+    пока в бюджете не освободится место. Когда очередь пустая, задача
+    получает много потоков на копию (параллелизм внутри копии); когда
+    задач много, потоков на копию меньше, зато больше задач идет
+    одновременно (параллелизм между копиями). Если после этого у одиночной
+    задачи остаются свободные потоки, длинное видео кодируется по сегментам
+    (только бэкендом ffmpeg, segmented; по умолчанию - при VIDEO_BACKEND=ffmpeg).
+    """
+
+    def __init__(self, total_threads: int = None, max_threads_per_copy: int = None, segmented: bool = None):
+        self.total_threads = max(1, total_threads or ENCODER_THREAD_BUDGET)
+        self.max_threads_per_copy = max(1, max_threads_per_copy or ENCODER_MAX_THREADS_PER_COPY)
+        self.segmented = VIDEO_BACKEND == 'ffmpeg' if segmented is None else segmented
+        self.used_threads = 0
+        self.active_jobs = 0
+        self.waiting_jobs = 0
+        self._condition = asyncio.Condition()
+        # Ожидающие задачи в порядке прихода: слот получает только первая
+        self._waiters = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        """Количество задач, которые выполняются или ждут потоков"""
+        return self.active_jobs + self.waiting_jobs
+
+    def plan(self, copies: int, queue_depth: int = None, frame_pixels: int = None,
+             duration: float = None) -> EncoderSlot:
+        """Выбирает число потоков на копию при заданной глубине очереди.
+
+        queue_depth учитывает и саму задачу; по умолчанию - текущая очередь
+        планировщика плюс эта задача, еще не поставленная в него.
+
+        frame_pixels - площадь выходного кадра из метаданных видео; для
+        маленьких кадров потоков выделяется меньше, чем позволяет бюджет.
+        duration - длительность видео; видео от VIDEO_SEGMENT_MIN_DURATION
+        секунд делится на сегменты, если доля задачи позволяет.
+        """
+        copies = max(1, copies)
+        if queue_depth is None:
+            queue_depth = self.queue_depth + 1
+
+        max_threads_per_copy = self.max_threads_per_copy
+        if frame_pixels:
+            max_threads_per_copy = min(max_threads_per_copy, max(1, frame_pixels // PIXELS_PER_ENCODER_THREAD))
+
+        # Справедливая доля бюджета на одну задачу при текущей очереди
+        job_share = max(1, self.total_threads // max(1, queue_depth))
+        threads_per_copy = max(1, min(max_threads_per_copy, job_share // copies))
+
+        segments = 1
+        if self.segmented and duration and duration >= VIDEO_SEGMENT_MIN_DURATION:
+            free_multiplier = job_share // (copies * threads_per_copy)
+            segments = max(1, min(VIDEO_MAX_SEGMENTS, free_multiplier, int(duration // MIN_SEGMENT_SECONDS)))
+        return EncoderSlot(copies=copies, threads_per_copy=threads_per_copy, segments=segments)
+
+    def _fits(self, slot: EncoderSlot) -> bool:
+        # Задача, которой не хватает всего бюджета, запускается только на пустом планировщике
+        return self.used_threads == 0 or self.used_threads + slot.threads <= self.total_threads
+
+    async def acquire(self, copies: int, frame_pixels: int = None, duration: float = None) -> EncoderSlot:
+        """Ждет место в бюджете и возвращает выделенный слот.
+
+        Задачи получают слоты строго в порядке прихода: маленькая задача не
+        обгоняет большую, которая ждет освобождения потоков, иначе большая
+        могла бы не дождаться своей очереди при постоянном потоке маленьких.
+        """
+        async with self._condition:
+            waiter = object()
+            self._waiters.append(waiter)
+            self.waiting_jobs += 1
+            try:
+                # Сама задача уже учтена в waiting_jobs - глубина очереди передается явно
+                slot = self.plan(copies, self.queue_depth, frame_pixels, duration)
+                while self._waiters[0] is not waiter or not self._fits(slot):
+                    await self._condition.wait()
+                    # Пока задача ждала, очередь могла измениться
+                    slot = self.plan(copies, self.queue_depth, frame_pixels, duration)
+            finally:
+                self.waiting_jobs -= 1
+                self._waiters.remove(waiter)
+                # Следующая задача в очереди (или вместо отмененной) может уже поместиться
+                self._condition.notify_all()
+
+            self.used_threads += slot.threads
+            self.active_jobs += 1
+            logger.info(
+                f"Выделено {slot.threads_per_copy} потоков на копию ({slot.copies} копий, {slot.segments} сегм.), "
+                f"занято {self.used_threads}/{self.total_threads}, в очереди {self.waiting_jobs}"
+            )
+            return slot
+
+    async def release(self, slot: EncoderSlot):
+        """Возвращает потоки слота в бюджет"""
+        async with self._condition:
+            self.used_threads = max(0, self.used_threads - slot.threads)
+            self.active_jobs = max(0, self.active_jobs - 1)
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """Текущее состояние бюджета"""
+        return {
+            'total_threads': self.total_threads,
+            'used_threads': self.used_threads,
+            'active_jobs': self.active_jobs,
+            'waiting_jobs': self.waiting_jobs,
+        }
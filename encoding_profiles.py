@@ -0,0 +1,52 @@
+"""
+Профили кодирования видео: выбор профиля для задачи
+"""
+
+import logging
+from datetime import datetime
+from typing import Optional
+
+from config import (
+    ENCODING_PROFILES, ENCODING_PROFILE, ENCODING_PROFILE_ADMIN, ENCODING_PEAK_PROFILE, ENCODING_PEAK_HOURS
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_encoding_profile(name: str = None) -> dict:
+    """Настройки профиля по имени; неизвестное имя заменяется профилем по умолчанию"""
+    name = name or ENCODING_PROFILE
+    if name not in ENCODING_PROFILES:
+        logger.warning(f"Неизвестный профиль кодирования '{name}', используем '{ENCODING_PROFILE}'")
+        name = ENCODING_PROFILE
+    return dict(ENCODING_PROFILES.get(name, ENCODING_PROFILES['balanced']))
+
+
+def parse_peak_hours(peak_hours: str) -> Optional[tuple]:
+    """'18-23' -> (18, 23); пустая или неверная строка -> None"""
+    try:
+        start, end = (int(part) for part in peak_hours.split('-'))
+        return start % 24, end % 24
+    except ValueError:
+        return None
+
+
+def is_peak_hour(hour: int, peak_hours: str = None) -> bool:
+    """Попадает ли час в интервал часов пик (интервал может переходить через полночь)"""
+    bounds = parse_peak_hours(ENCODING_PEAK_HOURS if peak_hours is None else peak_hours)
+    if bounds is None:
+        return False
+    start, end = bounds
+    if start <= end:
+        return start <= hour <= end
+    return hour >= start or hour <= end
+
+
+def select_encoding_profile(is_admin: bool = False, now: datetime = None) -> str:
+    """Имя профиля для задачи: часы пик важнее уровня пользователя"""
+    hour = (now or datetime.now()).hour
+    if ENCODING_PEAK_PROFILE and is_peak_hour(hour):
+        return ENCODING_PEAK_PROFILE
+    if is_admin and ENCODING_PROFILE_ADMIN:
+        return ENCODING_PROFILE_ADMIN
+    return ENCODING_PROFILE
@@ -0,0 +1,135 @@
+"""
+Кадровые ядра для обработки видео и изображений
+"""
+
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Импортируем cv2 только если он нужен, иначе используем numpy
+try:
+    import cv2
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+
+def build_brightness_lut(brightness_factor: float) -> np.ndarray:
+    """Строит таблицу из 256 значений uint8 для изменения яркости.
+
+    Значения совпадают с np.clip(image * brightness_factor, 0, 255).astype('uint8').
+    """
+    values = np.arange(256, dtype=np.float64) * brightness_factor
+    return np.clip(values, 0, 255).astype(np.uint8)
+
+
+def apply_lut(frame: np.ndarray, lut: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """Применяет таблицу uint8 к кадру без промежуточных float-массивов.
+
+    Если передан out, результат записывается в него (допускается out is frame).
+    """
+    if out is None:
+        out = np.empty_like(frame)
+    if CV2_AVAILABLE and frame.flags['C_CONTIGUOUS'] and out.flags['C_CONTIGUOUS']:
+        cv2.LUT(frame, lut, dst=out)
+    else:
+        np.take(lut, frame, out=out, mode='clip')
+    return out
+
+
+def _shifted_region(y0: int, y1: int, x0: int, x1: int, shift: tuple, height: int, width: int):
+    """Сдвигает прямоугольник на shift и обрезает его по границам кадра"""
+    shift_x, shift_y = shift
+    y0, y1 = max(0, y0 + shift_y), min(height, y1 + shift_y)
+    x0, x1 = max(0, x0 + shift_x), min(width, x1 + shift_x)
+    if y0 >= y1 or x0 >= x1:
+        return None
+    return (slice(y0, y1), slice(x0, x1))
+
+
+def build_frame_geometry(height: int, width: int, top_bottom: int = 0, left_right: int = 0,
+                         shift: tuple = (0, 0)) -> dict:
+    """Вычисляет срезы для копирования содержимого, черных полос сдвига и рамки.
+
+    Рамка рисуется по краям исходного кадра и сдвигается вместе с ним,
+    как в цепочке drawbox + pad/crop ffmpeg-бэкенда.
+    """
+    shift_x, shift_y = shift
+
+    # Часть исходного кадра, которая остается видимой после сдвига
+    source = (slice(max(0, -shift_y), height - max(0, shift_y)), slice(max(0, -shift_x), width - max(0, shift_x)))
+    target = (slice(max(0, shift_y), height + min(0, shift_y)), slice(max(0, shift_x), width + min(0, shift_x)))
+
+    # Освободившиеся после сдвига полосы заливаются черным
+    padding = []
+    if shift_y > 0:
+        padding.append((slice(0, shift_y), slice(None)))
+    elif shift_y < 0:
+        padding.append((slice(height + shift_y, height), slice(None)))
+    if shift_x > 0:
+        padding.append((slice(None), slice(0, shift_x)))
+    elif shift_x < 0:
+        padding.append((slice(None), slice(width + shift_x, width)))
+
+    border = []
+    if top_bottom > 0:
+        border.append(_shifted_region(0, top_bottom, 0, width, shift, height, width))
+        border.append(_shifted_region(height - top_bottom, height, 0, width, shift, height, width))
+    if left_right > 0:
+        border.append(_shifted_region(0, height, 0, left_right, shift, height, width))
+        border.append(_shifted_region(0, height, width - left_right, width, shift, height, width))
+
+    return {
+        'source': source,
+        'target': target,
+        'padding': padding,
+        'border': [region for region in border if region is not None],
+    }
+
+
+class FrameKernel:
+    """Модификации кадра копии за один проход: яркость, сдвиг и рамка.
+
+    Таблица яркости и геометрия рамки вычисляются один раз на копию
+    (геометрия пересчитывается только при смене размера кадра).
+    Экземпляр вызывается как функция frame -> frame и подходит для fl_image.
+    Возвращаемый массив перезаписывается при следующем вызове, входной кадр
+    не изменяется.
+    """
+
+    def __init__(self, brightness_factor: float = None, border_color=None, top_bottom: int = 0,
+                 left_right: int = 0, shift: tuple = (0, 0)):
+        self.brightness_factor = brightness_factor
+        self.lut = build_brightness_lut(brightness_factor) if brightness_factor is not None else None
+        self.border_color = np.array(border_color, dtype=np.uint8) if border_color is not None else None
+        self.top_bottom = top_bottom if border_color is not None else 0
+        self.left_right = left_right if border_color is not None else 0
+        self.shift = tuple(shift)
+        self._geometry = None
+        self._buffer = None
+
+    def __call__(self, frame: np.ndarray) -> np.ndarray:
+        if frame.dtype != np.uint8:
+            frame = np.clip(frame, 0, 255).astype(np.uint8)
+        if self._buffer is None or self._buffer.shape != frame.shape:
+            self._buffer = np.empty_like(frame)
+            height, width = frame.shape[:2]
+            self._geometry = build_frame_geometry(height, width, self.top_bottom, self.left_right, self.shift)
+
+        out = self._buffer
+        geometry = self._geometry
+        source, target = geometry['source'], geometry['target']
+
+        if self.lut is not None:
+            apply_lut(frame[source], self.lut, out=out[target])
+        else:
+            out[target] = frame[source]
+
+        for region in geometry['padding']:
+            out[region] = 0
+
+        for region in geometry['border']:
+            out[region] = self.border_color
+
+        return out
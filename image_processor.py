@@ -3,10 +3,11 @@ import random
 import asyncio
 import logging
 import time
-import hashlib
 from PIL import Image, ImageDraw, ImageFilter, ImageEnhance
 import numpy as np
 from config import OUTPUT_IMAGES_DIR, TEMP_DIR
+from frame_kernels import apply_lut, build_brightness_lut
+from copy_seeds import copy_rng, new_job_seed
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -77,42 +78,9 @@ class ImageProcessor:
         processed_images = []
         
         try:
-            # Проверяем существование входного файла
-            if not os.path.exists(input_path):
-                logger.error(f"Входной файл не найден: {input_path}")
-                raise FileNotFoundError(f"Файл {input_path} не найден")
-            
-            logger.info(f"Входной файл найден: {input_path}")
-            file_size = os.path.getsize(input_path) / (1024 * 1024)  # MB
-            logger.info(f"Размер файла: {file_size:.2f} MB")
-            
-            # Создаем задачи для параллельной обработки всех копий
-            tasks = []
-            output_paths = []
-            
-            for i in range(copies):
-                output_path = f"{OUTPUT_IMAGES_DIR}/processed_{user_id}_{i+1}.jpg"
-                output_paths.append(output_path)
-                
-                # Создаем задачу для каждой копии
-                task = self._process_single_image_copy(
-                    input_path, output_path, i, add_frames, add_filters, add_rotation, change_size, user_id, target_size
-                )
-                tasks.append(task)
-            
-            # Запускаем все копии параллельно
-            logger.info(f"🚀 Запускаю параллельную обработку {copies} копий изображения")
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Собираем успешно обработанные изображения
-            for i, (result, output_path) in enumerate(zip(results, output_paths)):
-                if isinstance(result, Exception):
-                    logger.error(f"❌ Ошибка при создании копии {i+1}: {str(result)}")
-                elif result and os.path.exists(output_path):
-                    processed_images.append(output_path)
-                    logger.info(f"✅ Копия {i+1} создана успешно")
-                else:
-                    logger.error(f"❌ Копия {i+1} не была создана")
+            async for output_path in self.iter_image_copies(
+                    input_path, user_id, copies, add_frames, add_filters, add_rotation, change_size, target_size):
+                processed_images.append(output_path)
             
             logger.info(f"✅ Параллельная обработка завершена. Успешно: {len(processed_images)}/{copies}")
             return processed_images
@@ -129,9 +97,72 @@ class ImageProcessor:
                         pass
             raise
 
+    async def iter_image_copies(self, input_path: str, user_id: int, copies: int, add_frames: bool,
+                                add_filters: bool, add_rotation: bool, change_size: bool, target_size: tuple = None):
+        """Создает копии изображения параллельно и отдает пути к ним в порядке готовности.
+        
+        Асинхронный итератор: копию можно отправлять, пока остальные еще
+        обрабатываются. Неудачные копии пропускаются.
+        """
+        # Проверяем существование входного файла
+        if not os.path.exists(input_path):
+            logger.error(f"Входной файл не найден: {input_path}")
+            raise FileNotFoundError(f"Файл {input_path} не найден")
+        
+        logger.info(f"Входной файл найден: {input_path}")
+        file_size = os.path.getsize(input_path) / (1024 * 1024)  # MB
+        logger.info(f"Размер файла: {file_size:.2f} MB")
+        
+        # Планы копий строятся заранее из seed задачи: потоки не делят общий random
+        seed = new_job_seed()
+        logger.info(f"Seed задачи: {seed}")
+        
+        # Создаем задачи для параллельной обработки всех копий
+        tasks = []
+        
+        for i in range(copies):
+            output_path = f"{OUTPUT_IMAGES_DIR}/processed_{user_id}_{i+1}.jpg"
+            params = generate_image_modification_params(
+                i, add_frames, add_filters, add_rotation, change_size, target_size, copy_rng(seed, i)
+            )
+            
+            # Создаем задачу для каждой копии
+            tasks.append(asyncio.create_task(self._indexed_image_copy(
+                i, output_path,
+                self._process_single_image_copy(
+                    input_path, output_path, i, add_frames, add_filters, add_rotation, change_size, user_id,
+                    target_size, params
+                )
+            )))
+        
+        # Запускаем все копии параллельно, забираем их по мере готовности
+        logger.info(f"🚀 Запускаю параллельную обработку {copies} копий изображения")
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                i, output_path, result = await next_done
+                if isinstance(result, Exception):
+                    logger.error(f"❌ Ошибка при создании копии {i+1}: {str(result)}")
+                elif result and os.path.exists(output_path):
+                    logger.info(f"✅ Копия {i+1} создана успешно")
+                    yield output_path
+                else:
+                    logger.error(f"❌ Копия {i+1} не была создана")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    async def _indexed_image_copy(copy_index: int, output_path: str, copy_task):
+        """Результат копии вместе с ее номером: as_completed отдает результаты без порядка"""
+        try:
+            return copy_index, output_path, await copy_task
+        except Exception as e:
+            return copy_index, output_path, e
+
     async def _process_single_image_copy(self, input_path: str, output_path: str, 
                                        copy_index: int, add_frames: bool, add_filters: bool, 
-                                       add_rotation: bool, change_size: bool, user_id: int, target_size: tuple = None):
+                                       add_rotation: bool, change_size: bool, user_id: int, target_size: tuple = None,
+                                       params: dict = None):
         """Обработка одной копии изображения"""
         try:
             # Используем ThreadPoolExecutor для обработки изображения
@@ -146,7 +177,8 @@ class ImageProcessor:
                 loop.run_in_executor(
                     None,  # Используем стандартный ThreadPoolExecutor
                     self._process_image_copy_wrapper,
-                    input_path, output_path, copy_index, add_frames, add_filters, add_rotation, change_size, user_id, target_size
+                    input_path, output_path, copy_index, add_frames, add_filters, add_rotation, change_size, user_id, target_size,
+                    params
                 ),
                 timeout=timeout_seconds
             )
@@ -162,86 +194,174 @@ class ImageProcessor:
 
     def _process_image_copy_wrapper(self, input_path: str, output_path: str, 
                                   copy_index: int, add_frames: bool, add_filters: bool, 
-                                  add_rotation: bool, change_size: bool, user_id: int, target_size: tuple = None):
+                                  add_rotation: bool, change_size: bool, user_id: int, target_size: tuple = None,
+                                  params: dict = None):
         """Обертка для функции обработки изображения"""
         return process_image_copy_new(input_path, output_path, copy_index, add_frames, 
-                                    add_filters, add_rotation, change_size, user_id, target_size)
+                                    add_filters, add_rotation, change_size, user_id, target_size, params)
 
-def apply_unique_image_modifications(image: Image.Image, copy_index: int, add_frames: bool, 
-                                   add_filters: bool, add_rotation: bool, change_size: bool, target_size: tuple = None):
-    """Применяет уникальные модификации к изображению"""
+# Фильтры, из которых выбираются 1-3 для копии
+IMAGE_FILTERS = ['brightness', 'contrast', 'saturation', 'blur', 'sharpen', 'color_enhance', 'hue_shift', 'color_tint', 'curves_adjustment', 'color_channel_adjustment', 'levels_adjustment']
+
+# Расширенная палитра цветов для рамок
+IMAGE_FRAME_COLORS = [
+    (255, 0, 0),      # Красный
+    (0, 255, 0),      # Зеленый  
+    (0, 0, 255),      # Синий
+    (255, 255, 0),    # Желтый
+    (255, 0, 255),    # Пурпурный
+    (0, 255, 255),    # Голубой
+    (255, 128, 0),    # Оранжевый
+    (128, 0, 255),    # Фиолетовый
+    (255, 192, 203),  # Розовый
+    (0, 128, 0),      # Темно-зеленый
+    (128, 128, 0),    # Оливковый
+    (0, 128, 128),    # Темно-голубой
+    (128, 0, 0),      # Темно-красный
+    (0, 0, 128),      # Темно-синий
+    (255, 165, 0),    # Оранжево-красный
+    (75, 0, 130),     # Индиго
+    (238, 130, 238),  # Фиолетово-розовый
+    (255, 20, 147),   # Темно-розовый
+    (0, 191, 255),    # Ярко-голубой
+    (50, 205, 50),    # Лайм-зеленый
+    (255, 69, 0),     # Красно-оранжевый
+    (138, 43, 226),   # Сине-фиолетовый
+    (255, 215, 0),    # Золотой
+    (220, 20, 60),    # Малиновый
+    (32, 178, 170),   # Светло-морской
+    (255, 105, 180),  # Ярко-розовый
+    (124, 252, 0),    # Лайм
+    (255, 99, 71),    # Томатный
+    (72, 61, 139),    # Темно-синий сланец
+    (255, 140, 0)     # Темно-оранжевый
+]
+
+
+def generate_image_modification_params(copy_index: int, add_frames: bool, add_filters: bool, add_rotation: bool,
+                                       change_size: bool, target_size: tuple = None,
+                                       rng: random.Random = None) -> dict:
+    """Генерирует план модификаций одной копии изображения.
+    
+    План содержит только простые типы (сериализуется в JSON): размер,
+    угол поворота, выбранные фильтры с коэффициентами, рамку и seed для
+    случайных деталей фильтров. rng - генератор копии (copy_seeds.copy_rng);
+    глобальный random не используется.
+    """
+    if rng is None:
+        rng = random.Random()
+    
+    params = {
+        'copy_index': copy_index,
+        'size': None,
+        'rotation': None,
+        'filters': [],
+        'frame': None,
+        # Очень небольшое изменение яркости для уникальности
+        'brightness_factor': 0.95 + (copy_index * 0.02),
+        # Seed для случайных деталей фильтров (цвет пленки, кривые, уровни)
+        'detail_seed': rng.getrandbits(64),
+    }
     
-    # Создаем уникальный seed на основе времени и copy_index
-    current_time = int(time.time() * 1000000)  # Микросекунды для большей уникальности
-    seed_string = f"{current_time}_{copy_index}_{random.randint(1, 999999)}"
-    seed_hash = int(hashlib.md5(seed_string.encode()).hexdigest()[:8], 16)
+    if change_size:
+        if target_size:
+            params['size'] = tuple(target_size)
+        else:
+            # Случайные размеры для Stories/Reels/TikTok (fallback)
+            target_sizes = [
+                (1080, 1920),  # Вертикальное
+                (1920, 1080),  # Горизонтальное
+                (1080, 1080),  # Квадратное
+                (1080, 1350),   # 4:5 (Instagram)
+                (1080, 1080),   # 1:1
+            ]
+            params['size'] = rng.choice(target_sizes)
     
-    # Используем seed для генерации случайных параметров
-    random.seed(seed_hash)
+    if add_rotation:
+        # Случайный поворот от -2 до +2 градусов
+        params['rotation'] = rng.uniform(-2, 2)
+    
+    if add_filters:
+        # Выбираем случайное количество фильтров (1-3) для большей уникальности
+        num_filters = rng.randint(1, 3)
+        for filter_type in rng.sample(IMAGE_FILTERS, min(num_filters, len(IMAGE_FILTERS))):
+            factor = None
+            if filter_type == 'brightness':
+                factor = rng.uniform(0.8, 1.2)
+            elif filter_type == 'contrast':
+                factor = rng.uniform(0.8, 1.3)
+            elif filter_type == 'saturation':
+                factor = rng.uniform(0.7, 1.4)
+            elif filter_type == 'blur':
+                factor = rng.uniform(0.5, 2.0)
+            params['filters'].append({'type': filter_type, 'factor': factor})
+    
+    if add_frames:
+        params['frame'] = {
+            # Случайный выбор цвета рамки
+            'color': rng.choice(IMAGE_FRAME_COLORS),
+            # Случайная толщина рамки от 5 до 50 пикселей
+            'thickness': rng.randint(5, 50),
+            # Случайные пропорции для разных сторон рамки
+            'style': rng.choice(['uniform', 'top_bottom_thick', 'sides_thick']),
+        }
+    
+    return params
+
+
+def apply_unique_image_modifications(image: Image.Image, copy_index: int, add_frames: bool, 
+                                   add_filters: bool, add_rotation: bool, change_size: bool, target_size: tuple = None,
+                                   params: dict = None):
+    """Применяет уникальные модификации к изображению по плану копии (generate_image_modification_params)"""
+    if params is None:
+        params = generate_image_modification_params(
+            copy_index, add_frames, add_filters, add_rotation, change_size, target_size
+        )
+    # Случайные детали фильтров берутся из генератора копии, а не из глобального random
+    rng = random.Random(params['detail_seed'])
     
     modified_image = image.copy()
     
     # 1. Изменение размера (если включено)
-    if change_size and target_size:
-        # Используем переданный размер
-        modified_image = modified_image.resize(target_size, Image.Resampling.LANCZOS)
-        logger.info(f"Копия {copy_index + 1}: размер изменен на {target_size}")
-    elif change_size and not target_size:
-        # Случайные размеры для Stories/Reels/TikTok (fallback)
-        target_sizes = [
-            (1080, 1920),  # Вертикальное
-            (1920, 1080),  # Горизонтальное
-            (1080, 1080),  # Квадратное
-            (1080, 1350),   # 4:5 (Instagram)
-            (1080, 1080),   # 1:1
-        ]
-        random_size = random.choice(target_sizes)
-        modified_image = modified_image.resize(random_size, Image.Resampling.LANCZOS)
-        logger.info(f"Копия {copy_index + 1}: размер изменен на {random_size}")
+    if params['size']:
+        size = tuple(params['size'])
+        modified_image = modified_image.resize(size, Image.Resampling.LANCZOS)
+        logger.info(f"Копия {copy_index + 1}: размер изменен на {size}")
     
     # 2. Поворот (если включен)
-    if add_rotation:
-        # Случайный поворот от -5 до +5 градусов
-        rotation_angle = random.uniform(-2, 2)
+    if params['rotation'] is not None:
+        rotation_angle = params['rotation']
         modified_image = modified_image.rotate(rotation_angle, expand=True, fillcolor=(255, 255, 255))
         logger.info(f"Копия {copy_index + 1}: поворот на {rotation_angle:.1f}°")
     
     # 3. Фильтры (если включены)
-    if add_filters:
-        # Выбираем случайное количество фильтров (1-3) для большей уникальности
-        num_filters = random.randint(1, 3)
-        available_filters = ['brightness', 'contrast', 'saturation', 'blur', 'sharpen', 'color_enhance', 'hue_shift', 'color_tint', 'curves_adjustment', 'color_channel_adjustment', 'levels_adjustment']
-        selected_filters = random.sample(available_filters, min(num_filters, len(available_filters)))
-        
-        logger.info(f"Копия {copy_index + 1}: применяем фильтры: {selected_filters}")
+    if params['filters']:
+        logger.info(f"Копия {copy_index + 1}: применяем фильтры: {[f['type'] for f in params['filters']]}")
         
-        for filter_type in selected_filters:
+        for image_filter in params['filters']:
+            filter_type, factor = image_filter['type'], image_filter['factor']
             if filter_type == 'brightness':
                 # Изменение яркости
-                brightness_factor = random.uniform(0.8, 1.2)
                 enhancer = ImageEnhance.Brightness(modified_image)
-                modified_image = enhancer.enhance(brightness_factor)
-                logger.info(f"  - яркость {brightness_factor:.2f}")
+                modified_image = enhancer.enhance(factor)
+                logger.info(f"  - яркость {factor:.2f}")
                 
             elif filter_type == 'contrast':
                 # Изменение контраста
-                contrast_factor = random.uniform(0.8, 1.3)
                 enhancer = ImageEnhance.Contrast(modified_image)
-                modified_image = enhancer.enhance(contrast_factor)
-                logger.info(f"  - контраст {contrast_factor:.2f}")
+                modified_image = enhancer.enhance(factor)
+                logger.info(f"  - контраст {factor:.2f}")
                 
             elif filter_type == 'saturation':
                 # Изменение насыщенности
-                saturation_factor = random.uniform(0.7, 1.4)
                 enhancer = ImageEnhance.Color(modified_image)
-                modified_image = enhancer.enhance(saturation_factor)
-                logger.info(f"  - насыщенность {saturation_factor:.2f}")
+                modified_image = enhancer.enhance(factor)
+                logger.info(f"  - насыщенность {factor:.2f}")
                 
             elif filter_type == 'blur':
                 # Легкое размытие
-                blur_radius = random.uniform(0.5, 2.0)
-                modified_image = modified_image.filter(ImageFilter.GaussianBlur(radius=blur_radius))
-                logger.info(f"  - размытие {blur_radius:.1f}px")
+                modified_image = modified_image.filter(ImageFilter.GaussianBlur(radius=factor))
+                logger.info(f"  - размытие {factor:.1f}px")
                 
             elif filter_type == 'sharpen':
                 # Увеличение резкости
@@ -255,85 +375,48 @@ def apply_unique_image_modifications(image: Image.Image, copy_index: int, add_fr
                 
             elif filter_type == 'hue_shift':
                 # Случайное изменение оттенка
-                modified_image = apply_hue_shift(modified_image)
+                modified_image = apply_hue_shift(modified_image, rng)
                 logger.info(f"  - сдвиг оттенка")
                 
             elif filter_type == 'color_tint':
                 # Цветной оттенок с градиентом
-                modified_image = apply_color_tint(modified_image)
+                modified_image = apply_color_tint(modified_image, rng)
                 logger.info(f"  - цветной оттенок")
                 
             elif filter_type == 'curves_adjustment':
                 # Кривые для изменения тональности
-                modified_image = apply_curves_adjustment(modified_image)
+                modified_image = apply_curves_adjustment(modified_image, rng)
                 logger.info(f"  - кривые тональности")
                 
             elif filter_type == 'color_channel_adjustment':
                 # Изменения отдельных цветовых каналов
-                modified_image = apply_color_channel_adjustment(modified_image)
+                modified_image = apply_color_channel_adjustment(modified_image, rng)
                 logger.info(f"  - цветовые каналы")
                 
             elif filter_type == 'levels_adjustment':
                 # Изменения уровней
-                modified_image = apply_levels_adjustment(modified_image)
+                modified_image = apply_levels_adjustment(modified_image, rng)
                 logger.info(f"  - уровни")
     
     # 4. Рамки (если включены)
-    if add_frames:
-        frame_colors = [
-            (255, 0, 0),      # Красный
-            (0, 255, 0),      # Зеленый  
-            (0, 0, 255),      # Синий
-            (255, 255, 0),    # Желтый
-            (255, 0, 255),    # Пурпурный
-            (0, 255, 255),    # Голубой
-            (255, 128, 0),    # Оранжевый
-            (128, 0, 255),    # Фиолетовый
-            (255, 192, 203),  # Розовый
-            (0, 128, 0),      # Темно-зеленый
-            (128, 128, 0),    # Оливковый
-            (0, 128, 128),    # Темно-голубой
-            (128, 0, 0),      # Темно-красный
-            (0, 0, 128),      # Темно-синий
-            (255, 165, 0),    # Оранжево-красный
-            (75, 0, 130),     # Индиго
-            (238, 130, 238),  # Фиолетово-розовый
-            (255, 20, 147),   # Темно-розовый
-            (0, 191, 255),    # Ярко-голубой
-            (50, 205, 50),    # Лайм-зеленый
-            (255, 69, 0),     # Красно-оранжевый
-            (138, 43, 226),   # Сине-фиолетовый
-            (255, 215, 0),    # Золотой
-            (220, 20, 60),    # Малиновый
-            (32, 178, 170),   # Светло-морской
-            (255, 105, 180),  # Ярко-розовый
-            (124, 252, 0),    # Лайм
-            (255, 99, 71),    # Томатный
-            (72, 61, 139),    # Темно-синий сланец
-            (255, 140, 0)     # Темно-оранжевый
-        ]
-        
-        # Случайный выбор цвета рамки
-        frame_color = random.choice(frame_colors)
-        
-        # Случайная толщина рамки от 5 до 50 пикселей
-        frame_thickness = random.randint(5, 50)
-        
-        # Случайные пропорции для разных сторон рамки
-        frame_style = random.choice(['uniform', 'top_bottom_thick', 'sides_thick'])
-        
-        modified_image = add_background_to_image(modified_image, frame_color, frame_thickness, frame_style)
-        logger.info(f"Копия {copy_index + 1}: фон {frame_color}, толщина {frame_thickness}px, стиль {frame_style}")
+    frame = params['frame']
+    if frame:
+        frame_color = tuple(frame['color'])
+        modified_image = add_background_to_image(modified_image, frame_color, frame['thickness'], frame['style'], rng)
+        logger.info(f"Копия {copy_index + 1}: фон {frame_color}, толщина {frame['thickness']}px, стиль {frame['style']}")
     
     # 5. Небольшое изменение яркости для уникальности
-    brightness_factor = 0.95 + (copy_index * 0.02)  # Очень небольшое изменение яркости
-    enhancer = ImageEnhance.Brightness(modified_image)
-    modified_image = enhancer.enhance(brightness_factor)
+    brightness_factor = params['brightness_factor']
+    # То же ядро, что и для кадров видео: таблица uint8, результат пишется в тот же массив
+    image_array = np.array(modified_image)
+    apply_lut(image_array, build_brightness_lut(brightness_factor), out=image_array)
+    modified_image = Image.fromarray(image_array)
     logger.info(f"Копия {copy_index + 1}: финальная яркость {brightness_factor:.2f}")
     
     return modified_image
 
-def add_background_to_image(image: Image.Image, color: tuple, thickness: int, frame_style: str = 'uniform'):
+def add_background_to_image(image: Image.Image, color: tuple, thickness: int, frame_style: str = 'uniform',
+                            rng=random):
     """Добавляет цветной фон к изображению"""
     import numpy as np
     
@@ -359,7 +442,7 @@ def add_background_to_image(image: Image.Image, color: tuple, thickness: int, fr
     new_height = height + (top_bottom_thickness * 2)
     
     # Создаем фон с градиентом или однотонным цветом
-    background_style = random.choice(['solid', 'gradient_vertical', 'gradient_horizontal', 'gradient_diagonal'])
+    background_style = rng.choice(['solid', 'gradient_vertical', 'gradient_horizontal', 'gradient_diagonal'])
     
     if background_style == 'solid':
         # Однотонный фон
@@ -417,7 +500,7 @@ def create_gradient_background(width: int, height: int, base_color: tuple, style
     
     return Image.fromarray(gradient)
 
-def apply_hue_shift(image: Image.Image):
+def apply_hue_shift(image: Image.Image, rng=random):
     """Применяет эффект цветной пленки к изображению"""
     import numpy as np
     
@@ -438,7 +521,7 @@ def apply_hue_shift(image: Image.Image):
     ]
     
     # Выбираем случайный цвет пленки
-    overlay_color = random.choice(color_overlays)
+    overlay_color = rng.choice(color_overlays)
     r, g, b, alpha = overlay_color
     
     # Создаем цветную пленку
@@ -449,7 +532,7 @@ def apply_hue_shift(image: Image.Image):
     
     return result
 
-def apply_color_tint(image: Image.Image):
+def apply_color_tint(image: Image.Image, rng=random):
     """Применяет цветной оттенок с градиентом к изображению"""
     import numpy as np
     
@@ -468,14 +551,14 @@ def apply_color_tint(image: Image.Image):
     ]
     
     # Выбираем случайный цвет
-    tint_color = random.choice(tint_colors)
+    tint_color = rng.choice(tint_colors)
     
     # Создаем градиентную пленку
     width, height = image.size
     overlay = Image.new('RGB', (width, height))
     
     # Создаем градиент от прозрачного к цветному
-    gradient_style = random.choice(['vertical', 'horizontal', 'diagonal', 'radial'])
+    gradient_style = rng.choice(['vertical', 'horizontal', 'diagonal', 'radial'])
     
     if gradient_style == 'vertical':
         # Вертикальный градиент
@@ -518,7 +601,7 @@ def apply_color_tint(image: Image.Image):
     
     return result
 
-def apply_curves_adjustment(image: Image.Image):
+def apply_curves_adjustment(image: Image.Image, rng=random):
     """Применяет случайные кривые для изменения тональности изображения"""
     import numpy as np
     
@@ -531,14 +614,14 @@ def apply_curves_adjustment(image: Image.Image):
         curve_points = []
         
         # Добавляем начальную и конечную точки
-        curve_points.append((0, random.randint(-20, 20)))
-        curve_points.append((255, 255 + random.randint(-20, 20)))
+        curve_points.append((0, rng.randint(-20, 20)))
+        curve_points.append((255, 255 + rng.randint(-20, 20)))
         
         # Добавляем случайные промежуточные точки
-        num_points = random.randint(1, 3)
+        num_points = rng.randint(1, 3)
         for _ in range(num_points):
-            x = random.randint(50, 200)
-            y = x + random.randint(-30, 30)
+            x = rng.randint(50, 200)
+            y = x + rng.randint(-30, 30)
             y = max(0, min(255, y))  # Ограничиваем значения
             curve_points.append((x, y))
         
@@ -558,7 +641,7 @@ def apply_curves_adjustment(image: Image.Image):
     
     return Image.fromarray(img_array.astype(np.uint8))
 
-def apply_color_channel_adjustment(image: Image.Image):
+def apply_color_channel_adjustment(image: Image.Image, rng=random):
     """Применяет случайные изменения к отдельным цветовым каналам"""
     import numpy as np
     
@@ -577,8 +660,8 @@ def apply_color_channel_adjustment(image: Image.Image):
     }
     
     # Выбираем случайные цветовые диапазоны для изменения
-    num_adjustments = random.randint(2, 4)
-    selected_ranges = random.sample(list(color_ranges.keys()), num_adjustments)
+    num_adjustments = rng.randint(2, 4)
+    selected_ranges = rng.sample(list(color_ranges.keys()), num_adjustments)
     
     # Конвертируем в HSV для работы с оттенками
     hsv_array = np.array(image.convert('HSV'))
@@ -587,9 +670,9 @@ def apply_color_channel_adjustment(image: Image.Image):
         hue_min, hue_max = color_ranges[color_range]
         
         # Случайные изменения
-        hue_shift = random.randint(-20, 20)
-        saturation_factor = random.uniform(0.7, 1.4)
-        brightness_factor = random.uniform(0.8, 1.2)
+        hue_shift = rng.randint(-20, 20)
+        saturation_factor = rng.uniform(0.7, 1.4)
+        brightness_factor = rng.uniform(0.8, 1.2)
         
         # Создаем маску для выбранного цветового диапазона
         mask = (hsv_array[:, :, 0] >= hue_min) & (hsv_array[:, :, 0] <= hue_max)
@@ -602,7 +685,7 @@ def apply_color_channel_adjustment(image: Image.Image):
     # Конвертируем обратно в RGB
     return Image.fromarray(hsv_array.astype(np.uint8), 'HSV').convert('RGB')
 
-def apply_levels_adjustment(image: Image.Image):
+def apply_levels_adjustment(image: Image.Image, rng=random):
     """Применяет случайные изменения уровней (как в Photoshop)"""
     import numpy as np
     
@@ -611,9 +694,9 @@ def apply_levels_adjustment(image: Image.Image):
     # Случайные изменения для каждого канала
     for channel in range(3):
         # Случайные точки черного, серого и белого
-        black_point = random.randint(0, 50)
-        white_point = random.randint(200, 255)
-        gray_point = random.uniform(0.8, 1.2)
+        black_point = rng.randint(0, 50)
+        white_point = rng.randint(200, 255)
+        gray_point = rng.uniform(0.8, 1.2)
         
         # Применяем изменения уровней
         channel_data = img_array[:, :, channel].astype(np.float32)
@@ -633,8 +716,9 @@ def apply_levels_adjustment(image: Image.Image):
     return Image.fromarray(img_array.astype(np.uint8))
 
 def process_image_copy_new(input_path: str, output_path: str, copy_index: int, add_frames: bool, 
-                          add_filters: bool, add_rotation: bool, change_size: bool, user_id: int = None, target_size: tuple = None):
-    """Обрабатывает одну копию изображения"""
+                          add_filters: bool, add_rotation: bool, change_size: bool, user_id: int = None, target_size: tuple = None,
+                          params: dict = None):
+    """Обрабатывает одну копию изображения; params - план копии из generate_image_modification_params"""
     try:
         logger.info(f"Начинаю обработку копии изображения {copy_index + 1}: {input_path} -> {output_path}")
         
@@ -654,7 +738,7 @@ def process_image_copy_new(input_path: str, output_path: str, copy_index: int, a
             
             # Применяем уникальные модификации
             modified_image = apply_unique_image_modifications(
-                image, copy_index, add_frames, add_filters, add_rotation, change_size, target_size
+                image, copy_index, add_frames, add_filters, add_rotation, change_size, target_size, params
             )
             
             # Создаем папку temp если не существует
@@ -0,0 +1,157 @@
+"""
+Кеш скачанных входных файлов по file_unique_id
+"""
+
+import os
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+
+from config import INPUT_CACHE_DIR, INPUT_CACHE_MAX_MB, INPUT_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class InputCache:
+    """Дисковый LRU-кеш входных файлов.
+
+    file_unique_id у Telegram одинаков для одного и того же файла у всех
+    пользователей, поэтому повторно присланное или пересланное видео
+    берется из кеша, а не скачивается через Bot API. Время последнего
+    использования хранится в mtime файла; записи старше ttl и самые
+    давние сверх бюджета max_bytes удаляются. Метаданные видео по тому же
+    ключу хранит ProbeCache.
+    """
+
+    def __init__(self, cache_dir: str = None, max_mb: int = None, ttl: int = None):
+        cache_dir = INPUT_CACHE_DIR if cache_dir is None else cache_dir
+        self.max_bytes = (INPUT_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+        self.ttl = INPUT_CACHE_TTL if ttl is None else ttl
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir and self.max_bytes > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, file_unique_id: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(file_unique_id.encode()).hexdigest()[:32])
+
+    def get(self, file_unique_id: str):
+        """Путь к файлу в кеше или None; обращение продлевает жизнь записи"""
+        if not self.cache_dir or not file_unique_id:
+            return None
+        entry_path = self._entry_path(file_unique_id)
+        with self._lock:
+            try:
+                if time.time() - os.path.getmtime(entry_path) > self.ttl:
+                    os.remove(entry_path)
+                    return None
+                os.utime(entry_path)
+            except FileNotFoundError:
+                return None
+        return entry_path
+
+    def copy_to(self, file_unique_id: str, dest_path: str) -> bool:
+        """Кладет файл из кеша в dest_path (жесткой ссылкой, если возможно); False - промах"""
+        entry_path = self.get(file_unique_id)
+        if entry_path is None:
+            self.misses += 1
+            return False
+        try:
+            _link_or_copy(entry_path, dest_path)
+        except OSError as e:
+            logger.warning(f"Не удалось взять файл {file_unique_id} из кеша: {e}")
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def put(self, file_unique_id: str, source_path: str):
+        """Сохраняет скачанный файл в кеш и освобождает место сверх бюджета"""
+        if not self.cache_dir or not file_unique_id:
+            return None
+        try:
+            if os.path.getsize(source_path) > self.max_bytes:
+                return None
+            # Запись появляется в кеше атомарно: сначала временное имя в той же папке
+            fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.cache_dir)
+            os.close(fd)
+            os.remove(tmp_path)
+            _link_or_copy(source_path, tmp_path)
+            entry_path = self._entry_path(file_unique_id)
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить файл {file_unique_id} в кеш: {e}")
+            return None
+        self.evict()
+        return entry_path
+
+    def evict(self):
+        """Удаляет записи старше ttl, затем самые давние, пока кеш не уложится в бюджет"""
+        if not self.cache_dir:
+            return
+        with self._lock:
+            entries = []
+            now = time.time()
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name.startswith('.tmp-'):
+                    # Недописанная запись после сбоя
+                    if now - stat.st_mtime > 3600:
+                        _remove(path)
+                    continue
+                if now - stat.st_mtime > self.ttl:
+                    _remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                _remove(path)
+                total -= size
+
+    async def fetch(self, bot, file_id: str, file_unique_id: str, dest_path: str) -> bool:
+        """Кладет файл в dest_path из кеша или скачивает его из Telegram и кеширует.
+
+        Возвращает True, если файл взят из кеша.
+        """
+        if await asyncio.to_thread(self.copy_to, file_unique_id, dest_path):
+            logger.info(f"Файл {file_unique_id} взят из кеша, скачивание пропущено")
+            return True
+        telegram_file = await bot.get_file(file_id)
+        await telegram_file.download_to_drive(dest_path)
+        await asyncio.to_thread(self.put, file_unique_id, dest_path)
+        return False
+
+    def stats(self) -> dict:
+        return {
+            'cache_dir': self.cache_dir,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+def _link_or_copy(source_path: str, dest_path: str):
+    """Жесткая ссылка в пределах одной файловой системы, иначе копия (кеш на диске, задачи в tmpfs)"""
+    try:
+        os.link(source_path, dest_path)
+    except OSError:
+        shutil.copyfile(source_path, dest_path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Не удалось удалить запись кеша {path}: {e}")
@@ -0,0 +1,355 @@
+"""
+Брокер задач сервиса воркеров: очередь и передача файлов между серверами
+"""
+
+import os
+import hmac
+import json
+import shutil
+import socket
+import logging
+import threading
+import socketserver
+from contextlib import contextmanager
+
+from config import (
+    JOB_SERVICE_DIR, JOB_BROKER_URL, JOB_BROKER_TOKEN, JOB_BROKER_SHARED_STORAGE, JOB_BROKER_TIMEOUT
+)
+from job_store import JobStore, JOB_RUNNING
+
+logger = logging.getLogger(__name__)
+
+# Размер блока при передаче файлов через брокер
+CHUNK_SIZE = 1024 * 1024
+# Максимальная длина строки запроса или ответа (JSON без содержимого файлов)
+MAX_LINE_BYTES = 1024 * 1024
+
+
+class BrokerError(Exception):
+    """Брокер отклонил запрос"""
+
+
+def parse_address(address: str) -> tuple:
+    """'host:port' -> (host, port)"""
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class JobBroker:
+    """Интерфейс воркера к очереди задач.
+
+    Методы очереди повторяют JobStore (claim, heartbeat, complete, release,
+    fail, mark_copy_ready, get); все методы задачи принимают worker, чтобы
+    брокер мог проверить аренду. Файлы задачи воркер получает через
+    job_files(job), а каждую готовую копию сдает через push_output - после
+    этого копия считается готовой к отправке. Базовая реализация считает, что
+    папка задачи доступна воркеру по тем же путям (общая файловая система).
+    """
+
+    def claim(self, worker: str, lease_seconds: float):
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: str, worker: str, lease_seconds: float) -> bool:
+        raise NotImplementedError
+
+    def get(self, job_id: str, worker: str):
+        raise NotImplementedError
+
+    def mark_copy_ready(self, job_id: str, worker: str, copy_index: int):
+        raise NotImplementedError
+
+    def complete(self, job_id: str, worker: str) -> bool:
+        raise NotImplementedError
+
+    def release(self, job_id: str, worker: str) -> bool:
+        raise NotImplementedError
+
+    def fail(self, job_id: str, worker: str, error: str, attempts: int, max_attempts: int) -> bool:
+        raise NotImplementedError
+
+    @contextmanager
+    def job_files(self, job: dict, worker: str):
+        """Возвращает (input_path, output_paths, work_dir) задачи на этом сервере"""
+        payload = job['payload']
+        yield payload['input_path'], payload['output_paths'], payload.get('work_dir')
+
+    def push_output(self, job: dict, worker: str, copy_index: int, path: str):
+        """Сдает готовую копию: после этого бот может ее отправить"""
+        self.mark_copy_ready(job['job_id'], worker, copy_index)
+
+
+class LocalBroker(JobBroker):
+    """Брокер в том же процессе: JobStore и общая файловая система"""
+
+    def __init__(self, store: JobStore = None):
+        self.store = store or JobStore()
+
+    def claim(self, worker: str, lease_seconds: float):
+        return self.store.claim(worker, lease_seconds)
+
+    def heartbeat(self, job_id: str, worker: str, lease_seconds: float) -> bool:
+        return self.store.heartbeat(job_id, worker, lease_seconds)
+
+    # Воркер в том же процессе, что и очередь, - аренда для get и mark_copy_ready не проверяется
+    def get(self, job_id: str, worker: str):
+        return self.store.get(job_id)
+
+    def mark_copy_ready(self, job_id: str, worker: str, copy_index: int):
+        self.store.mark_copy_ready(job_id, copy_index)
+
+    def complete(self, job_id: str, worker: str) -> bool:
+        return self.store.complete(job_id, worker)
+
+    def release(self, job_id: str, worker: str) -> bool:
+        return self.store.release(job_id, worker)
+
+    def fail(self, job_id: str, worker: str, error: str, attempts: int, max_attempts: int) -> bool:
+        return self.store.fail(job_id, worker, error, attempts, max_attempts)
+
+
+def _send_line(stream, message: dict):
+    stream.write(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def _read_line(stream) -> dict:
+    line = stream.readline(MAX_LINE_BYTES + 1)
+    if not line:
+        raise ConnectionError("Соединение с брокером закрыто")
+    if len(line) > MAX_LINE_BYTES:
+        raise BrokerError("Слишком длинный запрос")
+    return json.loads(line)
+
+
+def _copy_stream(source, target, size: int):
+    """Копирует ровно size байт из source в target блоками CHUNK_SIZE"""
+    remaining = size
+    while remaining > 0:
+        chunk = source.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise ConnectionError(f"Передача файла оборвалась, не получено {remaining} байт")
+        target.write(chunk)
+        remaining -= len(chunk)
+
+
+class SocketBroker(JobBroker):
+    """Брокер на другом сервере: запросы к JobBrokerServer по TCP.
+
+    Каждый запрос - отдельное соединение: строка JSON с токеном, методом и
+    аргументами, за ней для push_output - содержимое файла; ответ - строка
+    JSON, за ней для входного файла - его содержимое. Без shared_storage
+    входной файл скачивается в JOB_SERVICE_DIR этого сервера, а копии
+    передаются брокеру и удаляются локально.
+    """
+
+    def __init__(self, address: str = None, token: str = None, shared_storage: bool = None,
+                 work_root: str = None, timeout: float = None):
+        self.address = parse_address(address or JOB_BROKER_URL)
+        self.token = token if token is not None else JOB_BROKER_TOKEN
+        self.shared_storage = JOB_BROKER_SHARED_STORAGE if shared_storage is None else shared_storage
+        self.work_root = work_root or JOB_SERVICE_DIR
+        self.timeout = timeout or JOB_BROKER_TIMEOUT
+
+    def _call(self, method: str, upload_path: str = None, download_path: str = None, **args):
+        with socket.create_connection(self.address, timeout=self.timeout) as sock:
+            with sock.makefile('rwb') as stream:
+                request = {'token': self.token, 'method': method, 'args': args}
+                if upload_path is not None:
+                    request['size'] = os.path.getsize(upload_path)
+                _send_line(stream, request)
+                if upload_path is not None:
+                    with open(upload_path, 'rb') as f:
+                        shutil.copyfileobj(f, stream, CHUNK_SIZE)
+                stream.flush()
+
+                response = _read_line(stream)
+                if not response.get('ok'):
+                    raise BrokerError(response.get('error', 'неизвестная ошибка'))
+                if download_path is not None:
+                    partial_path = download_path + '.part'
+                    with open(partial_path, 'wb') as f:
+                        _copy_stream(stream, f, response['size'])
+                    os.replace(partial_path, download_path)
+                return response.get('result')
+
+    def claim(self, worker: str, lease_seconds: float):
+        return self._call('claim', worker=worker, lease_seconds=lease_seconds)
+
+    def heartbeat(self, job_id: str, worker: str, lease_seconds: float) -> bool:
+        return self._call('heartbeat', job_id=job_id, worker=worker, lease_seconds=lease_seconds)
+
+    def get(self, job_id: str, worker: str):
+        return self._call('get', job_id=job_id, worker=worker)
+
+    def mark_copy_ready(self, job_id: str, worker: str, copy_index: int):
+        self._call('mark_copy_ready', job_id=job_id, worker=worker, copy_index=copy_index)
+
+    def complete(self, job_id: str, worker: str) -> bool:
+        return self._call('complete', job_id=job_id, worker=worker)
+
+    def release(self, job_id: str, worker: str) -> bool:
+        return self._call('release', job_id=job_id, worker=worker)
+
+    def fail(self, job_id: str, worker: str, error: str, attempts: int, max_attempts: int) -> bool:
+        return self._call('fail', job_id=job_id, worker=worker, error=error, attempts=attempts,
+                          max_attempts=max_attempts)
+
+    @contextmanager
+    def job_files(self, job: dict, worker: str):
+        if self.shared_storage:
+            with super().job_files(job, worker) as files:
+                yield files
+            return
+
+        job_dir = os.path.join(self.work_root, f"job-{job['job_id']}")
+        work_dir = os.path.join(job_dir, 'work')
+        os.makedirs(work_dir, exist_ok=True)
+        try:
+            input_path = os.path.join(job_dir, 'input.mp4')
+            self._call('fetch_input', download_path=input_path, job_id=job['job_id'], worker=worker)
+            output_paths = [
+                os.path.join(job_dir, os.path.basename(path)) for path in job['payload']['output_paths']
+            ]
+            yield input_path, output_paths, work_dir
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def push_output(self, job: dict, worker: str, copy_index: int, path: str):
+        if self.shared_storage:
+            super().push_output(job, worker, copy_index, path)
+            return
+        self._call('push_output', upload_path=path, job_id=job['job_id'], worker=worker, copy_index=copy_index)
+        # Копия уже у бота - локальный файл больше не нужен
+        os.remove(path)
+
+
+class _BrokerRequestHandler(socketserver.StreamRequestHandler):
+    # Таймаут чтения запроса, секунд
+    timeout = JOB_BROKER_TIMEOUT
+
+    def handle(self):
+        try:
+            request = _read_line(self.rfile)
+            if not hmac.compare_digest(str(request.get('token', '')), self.server.token):
+                raise BrokerError("Неверный токен брокера")
+            method = request.get('method')
+            handler = getattr(self.server, f"_handle_{method}", None) if method in self.server.METHODS else None
+            if handler is None:
+                raise BrokerError(f"Неизвестный метод брокера: {method}")
+            handler(self, request.get('args', {}), request)
+        except Exception as e:
+            logger.warning(f"Запрос к брокеру от {self.client_address[0]} отклонен: {e}")
+            try:
+                _send_line(self.wfile, {'ok': False, 'error': str(e)})
+            except OSError:
+                pass
+
+    def reply(self, result=None, **fields):
+        _send_line(self.wfile, {'ok': True, 'result': result, **fields})
+
+
+class JobBrokerServer(socketserver.ThreadingTCPServer):
+    """Брокер на сервере бота: открывает очередь JobStore воркерам на других серверах.
+
+    Отдает задачу и ее входной файл, принимает готовые копии и отметки о
+    них только воркеру, который сейчас держит аренду задачи; пути файлов
+    берутся из задачи, а не из запроса. Копия записывается во временный
+    файл и заменяет итоговый только после полной передачи.
+    """
+
+    METHODS = {
+        'claim', 'heartbeat', 'get', 'mark_copy_ready', 'complete', 'release', 'fail',
+        'fetch_input', 'push_output'
+    }
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, store: JobStore, address: str, token: str):
+        if not token:
+            raise ValueError("Для брокера нужен JOB_BROKER_TOKEN")
+        super().__init__(parse_address(address), _BrokerRequestHandler)
+        self.store = store
+        self.token = token
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='job-broker', daemon=True)
+        self._thread.start()
+        logger.info(f"Брокер задач слушает {self.address}")
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join(timeout=5)
+
+    def _owned_job(self, args: dict) -> dict:
+        job = self.store.get(args['job_id'])
+        if job is None or job['status'] != JOB_RUNNING or job['worker'] != args['worker']:
+            raise BrokerError(f"Задача {args['job_id']} не принадлежит воркеру {args['worker']}")
+        return job
+
+    @staticmethod
+    def _copy_index(job: dict, args: dict) -> int:
+        copy_index = args['copy_index']
+        if not isinstance(copy_index, int) or not 0 <= copy_index < len(job['payload']['output_paths']):
+            raise BrokerError(f"Нет копии {copy_index} в задаче {job['job_id']}")
+        return copy_index
+
+    def _handle_claim(self, handler, args, request):
+        handler.reply(self.store.claim(args['worker'], args['lease_seconds']))
+
+    def _handle_heartbeat(self, handler, args, request):
+        handler.reply(self.store.heartbeat(args['job_id'], args['worker'], args['lease_seconds']))
+
+    def _handle_get(self, handler, args, request):
+        handler.reply(self._owned_job(args))
+
+    def _handle_mark_copy_ready(self, handler, args, request):
+        job = self._owned_job(args)
+        copy_index = self._copy_index(job, args)
+        handler.reply(self.store.mark_copy_ready(job['job_id'], copy_index))
+
+    def _handle_complete(self, handler, args, request):
+        handler.reply(self.store.complete(args['job_id'], args['worker']))
+
+    def _handle_release(self, handler, args, request):
+        handler.reply(self.store.release(args['job_id'], args['worker']))
+
+    def _handle_fail(self, handler, args, request):
+        handler.reply(self.store.fail(
+            args['job_id'], args['worker'], args['error'], args['attempts'], args['max_attempts']
+        ))
+
+    def _handle_fetch_input(self, handler, args, request):
+        input_path = self._owned_job(args)['payload']['input_path']
+        handler.reply(size=os.path.getsize(input_path))
+        with open(input_path, 'rb') as f:
+            shutil.copyfileobj(f, handler.wfile, CHUNK_SIZE)
+
+    def _handle_push_output(self, handler, args, request):
+        job = self._owned_job(args)
+        output_path = job['payload']['output_paths'][self._copy_index(job, args)]
+        partial_path = output_path + '.part'
+        try:
+            with open(partial_path, 'wb') as f:
+                _copy_stream(handler.rfile, f, int(request['size']))
+            # Аренду могли забрать, пока шла передача
+            self._owned_job(args)
+            os.replace(partial_path, output_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        self.store.mark_copy_ready(job['job_id'], args['copy_index'])
+        handler.reply()
+
+
+def create_broker(address: str = None) -> JobBroker:
+    """Брокер для воркера: удаленный при заданном адресе (JOB_BROKER_URL), иначе локальный"""
+    address = address or JOB_BROKER_URL
+    if address:
+        return SocketBroker(address)
+    return LocalBroker()
@@ -0,0 +1,125 @@
+"""
+Отмена задач обработки внутри процесса-воркера
+"""
+
+import logging
+import threading
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# Как часто поток-наблюдатель проверяет флаг отмены, секунд
+CANCEL_POLL_INTERVAL = 0.2
+
+
+class JobCancelled(BaseException):
+    """Задача отменена: таймаут, перезапуск пользователем или остановка бота.
+
+    Наследуется от BaseException, как asyncio.CancelledError, чтобы отмену
+    не перехватывали обработчики `except Exception` и запасные пути обработки.
+    """
+
+
+class CancelScope:
+    """Область отмены одной задачи в процессе-воркере.
+
+    Поток-наблюдатель ждет событие отмены (Event из Manager) и, когда оно
+    установлено, сразу завершает все зарегистрированные процессы ffmpeg.
+    Кадровые циклы проверяют локальный флаг через check() без обращения к Manager.
+    """
+
+    def __init__(self, cancel_event=None):
+        self.cancel_event = cancel_event
+        self.cancelled = False
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._watcher = None
+
+    def __enter__(self):
+        global _current_scope
+        _current_scope = self
+        if self.cancel_event is not None:
+            self._watcher = threading.Thread(target=self._watch, name='job-cancel', daemon=True)
+            self._watcher.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _current_scope
+        self._done.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=1)
+        _current_scope = None
+        return False
+
+    def _watch(self):
+        while not self._done.is_set():
+            try:
+                if self.cancel_event.wait(CANCEL_POLL_INTERVAL):
+                    self.cancel()
+                    return
+            except Exception:
+                # Manager недоступен - бот останавливается, прекращаем работу
+                self.cancel()
+                return
+
+    def cancel(self):
+        """Помечает задачу отмененной и завершает все ее процессы ffmpeg"""
+        self.cancelled = True
+        with self._lock:
+            processes = list(self._processes)
+        for proc in processes:
+            kill_process(proc)
+        if processes:
+            logger.info(f"Задача отменена, остановлено процессов ffmpeg: {len(processes)}")
+
+    def track(self, proc):
+        with self._lock:
+            self._processes.add(proc)
+        if self.cancelled:
+            kill_process(proc)
+
+    def untrack(self, proc):
+        with self._lock:
+            self._processes.discard(proc)
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled()
+
+
+_current_scope = None
+
+
+def kill_process(proc):
+    """Немедленно завершает дочерний процесс, если он еще работает"""
+    try:
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+    except Exception as e:
+        logger.debug(f"Не удалось завершить процесс: {e}")
+
+
+def track_process(proc):
+    """Регистрирует процесс ffmpeg текущей задачи, чтобы его можно было убить при отмене"""
+    if _current_scope is not None and proc is not None:
+        _current_scope.track(proc)
+
+
+def untrack_process(proc):
+    if _current_scope is not None and proc is not None:
+        _current_scope.untrack(proc)
+
+
+def check_cancelled():
+    """Выбрасывает JobCancelled, если текущая задача отменена"""
+    if _current_scope is not None:
+        _current_scope.check()
+
+
+def popen_tracked(cmd: list, **kwargs) -> subprocess.Popen:
+    """subprocess.Popen с регистрацией процесса в текущей области отмены"""
+    check_cancelled()
+    proc = subprocess.Popen(cmd, **kwargs)
+    track_process(proc)
+    return proc
@@ -0,0 +1,130 @@
+"""
+Прогресс обработки копий: отчеты из процессов-воркеров и их отображение
+"""
+
+import time
+import logging
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Не чаще одного отчета из воркера за этот интервал, секунд
+PROGRESS_REPORT_INTERVAL = 0.5
+
+
+class ProgressReporter:
+    """Отправляет из процесса-воркера число обработанных кадров по копиям.
+
+    Экземпляр вызывается как progress_callback(frames, copy_indices=None, total_frames=None):
+    frames - сколько кадров готово у перечисленных копий (у всех, если copy_indices не задан).
+    Отчеты прореживаются, последний отправляется через finish().
+    copy_ready(copy_index) сразу сообщает, что файл копии готов к отправке.
+    """
+
+    def __init__(self, queue, job_id: str, copies: int, total_frames: int = 0):
+        self.queue = queue
+        self.job_id = job_id
+        self.frames = [0] * copies
+        self.total_frames = total_frames or 0
+        self.ready = []
+        self._last_sent = 0.0
+
+    def __call__(self, frames: int, copy_indices: list = None, total_frames: int = None):
+        if total_frames:
+            self.total_frames = total_frames
+        for copy_index in (range(len(self.frames)) if copy_indices is None else copy_indices):
+            self.frames[copy_index] = frames
+
+        now = time.monotonic()
+        if now - self._last_sent >= PROGRESS_REPORT_INTERVAL:
+            self._last_sent = now
+            self._send()
+
+    def copy_ready(self, copy_index: int):
+        """Сообщает, что копия записана полностью и ее можно отправлять, не дожидаясь остальных"""
+        if copy_index not in self.ready:
+            self.ready.append(copy_index)
+        if self.total_frames:
+            self.frames[copy_index] = self.total_frames
+        self._send()
+
+    def finish(self):
+        """Отправляет итоговый отчет: все копии обработаны полностью"""
+        if self.total_frames:
+            self.frames = [self.total_frames] * len(self.frames)
+        self._send()
+
+    def _send(self):
+        try:
+            self.queue.put_nowait((self.job_id, list(self.frames), self.total_frames, list(self.ready)))
+        except Exception as e:
+            logger.debug(f"Не удалось отправить прогресс задачи {self.job_id}: {e}")
+
+
+@dataclass
+class JobProgress:
+    """Прогресс одной задачи в основном процессе бота"""
+    copies: int
+    total_frames: int = 0
+    frames: list = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    ready: list = field(default_factory=list)  # Готовые копии в порядке готовности
+    delivered: int = 0  # Сколько копий уже отправлено пользователю
+    on_copy_ready: object = field(default=None, repr=False)  # Вызывается с индексом каждой новой готовой копии
+
+    def __post_init__(self):
+        if not self.frames:
+            self.frames = [0] * self.copies
+
+    def update(self, frames: list, total_frames: int, ready: list = None):
+        """Принимает отчет из воркера"""
+        self.frames = list(frames)
+        if total_frames:
+            self.total_frames = total_frames
+        for copy_index in ready or ():
+            if copy_index in self.ready:
+                continue
+            self.ready.append(copy_index)
+            if self.on_copy_ready is not None:
+                self.on_copy_ready(copy_index)
+
+    @property
+    def started(self) -> bool:
+        return self.total_frames > 0 and any(self.frames)
+
+    def copy_percent(self, copy_index: int) -> int:
+        if not self.total_frames:
+            return 0
+        return min(100, int(self.frames[copy_index] * 100 / self.total_frames))
+
+    @property
+    def percent(self) -> int:
+        if not self.total_frames:
+            return 0
+        return min(100, int(min(self.frames) * 100 / self.total_frames))
+
+    @property
+    def completed_copies(self) -> int:
+        return sum(1 for i in range(self.copies) if self.copy_percent(i) >= 100)
+
+    def eta_seconds(self):
+        """Оставшееся время по текущей скорости или None, если оценить нельзя"""
+        done = min(self.frames) if self.frames else 0
+        if not self.total_frames or done <= 0:
+            return None
+        elapsed = time.monotonic() - self.started_at
+        return max(0, int(elapsed * (self.total_frames - done) / done))
+
+
+def format_eta(seconds) -> str:
+    """Форматирует оставшееся время для сообщения пользователю"""
+    if seconds is None:
+        return "оцениваю..."
+    if seconds < 60:
+        return f"~{seconds} сек"
+    return f"~{seconds // 60} мин {seconds % 60:02d} сек"
+
+
+def format_progress_bar(percent: int, width: int = 10) -> str:
+    filled = percent * width // 100
+    return "▓" * filled + "░" * (width - filled)
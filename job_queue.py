@@ -0,0 +1,204 @@
+"""
+Очередь задач обработки с приоритетами и справедливой долей пользователей
+"""
+
+import time
+import asyncio
+import itertools
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from config import JOB_QUEUE_CONCURRENCY, JOB_QUEUE_MAX_PER_USER, JOB_QUEUE_SMALL_JOB_MB, JOB_QUEUE_AGING_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета: меньше - раньше
+PRIORITY_ADMIN = 0
+PRIORITY_SMALL = 1
+PRIORITY_NORMAL = 2
+
+
+def job_priority(is_admin: bool, cost_mb: float = None) -> int:
+    """Класс приоритета задачи; cost_mb - объем работы (размер входа в МБ, умноженный на число копий)"""
+    if is_admin:
+        return PRIORITY_ADMIN
+    if cost_mb is not None and cost_mb <= JOB_QUEUE_SMALL_JOB_MB:
+        return PRIORITY_SMALL
+    return PRIORITY_NORMAL
+
+
+class JobQueueFull(Exception):
+    """У пользователя уже максимум задач в очереди"""
+
+
+@dataclass
+class JobTicket:
+    """Место задачи в очереди"""
+    user_id: int
+    priority: int
+    seq: int
+    submitted_at: float = field(default_factory=time.monotonic)
+    running: bool = False
+    released: bool = False
+
+
+class FairJobQueue:
+    """Допуск задач обработки к выполнению.
+
+    Одновременно выполняется не больше max_running задач. Когда слот
+    освобождается, его получает ожидающая задача с наименьшим ключом:
+    класс приоритета, число задач ее пользователя впереди нее (выполняющихся
+    и ожидающих), время последнего запуска задачи пользователя, порядок
+    поступления. Администраторы и маленькие задачи идут первыми, а внутри
+    класса пользователи обслуживаются по кругу - несколько задач одного
+    пользователя не задерживают задачу другого. Класс приоритета улучшается
+    на единицу за каждые aging_seconds ожидания, чтобы большие задачи не ждали
+    бесконечно. У одного пользователя не больше max_per_user задач в очереди
+    и в работе.
+    """
+
+    def __init__(self, max_running: int = None, max_per_user: int = None, aging_seconds: float = None):
+        self.max_running = max(1, max_running or JOB_QUEUE_CONCURRENCY)
+        self.max_per_user = max(1, max_per_user or JOB_QUEUE_MAX_PER_USER)
+        self.aging_seconds = aging_seconds or JOB_QUEUE_AGING_SECONDS
+        self._waiting = []
+        self._running_by_user = {}
+        self._last_start_by_user = {}
+        self._running = 0
+        self.completed = 0
+        # Сколько ждали в очереди последние запущенные задачи, секунд
+        self.recent_waits = deque(maxlen=50)
+        self._seq = itertools.count()
+        self._condition = asyncio.Condition()
+
+    def user_jobs(self, user_id: int) -> int:
+        """Сколько задач пользователя ждут или выполняются"""
+        waiting = sum(1 for ticket in self._waiting if ticket.user_id == user_id)
+        return waiting + self._running_by_user.get(user_id, 0)
+
+    def submit(self, user_id: int, priority: int = PRIORITY_NORMAL) -> JobTicket:
+        """Ставит задачу в очередь; JobQueueFull, если у пользователя уже max_per_user задач"""
+        if self.user_jobs(user_id) >= self.max_per_user:
+            raise JobQueueFull()
+        ticket = JobTicket(user_id=user_id, priority=priority, seq=next(self._seq))
+        self._waiting.append(ticket)
+        return ticket
+
+    def _ordered_waiting(self) -> list:
+        now = time.monotonic()
+        # Сколько задач пользователя впереди: выполняющиеся и ожидающие с меньшим номером
+        ahead = dict(self._running_by_user)
+        keys = {}
+        for ticket in sorted(self._waiting, key=lambda ticket: ticket.seq):
+            aging = int((now - ticket.submitted_at) // self.aging_seconds)
+            user_ahead = ahead.get(ticket.user_id, 0)
+            ahead[ticket.user_id] = user_ahead + 1
+            keys[ticket.seq] = (
+                ticket.priority - aging,
+                user_ahead,
+                self._last_start_by_user.get(ticket.user_id, 0.0),
+                ticket.seq,
+            )
+        return sorted(self._waiting, key=lambda ticket: keys[ticket.seq])
+
+    def position(self, ticket: JobTicket) -> int:
+        """Место задачи среди ожидающих, начиная с 1; 0 - задача уже выполняется"""
+        if ticket.running or ticket not in self._waiting:
+            return 0
+        return self._ordered_waiting().index(ticket) + 1
+
+    async def wait(self, ticket: JobTicket, on_position=None):
+        """Ждет, пока задача получит слот.
+
+        on_position(position) - корутина, которая вызывается при каждом
+        изменении места в очереди (вне блокировки очереди).
+        """
+        last_position = None
+        while True:
+            async with self._condition:
+                position = self.position(ticket)
+                if self._running < self.max_running and position == 1:
+                    self._start(ticket)
+                    # Свободных слотов может быть больше одного - следующая задача проверит свой
+                    self._condition.notify_all()
+                    return
+                if position == last_position or on_position is None:
+                    await self._wait_for_change()
+                    continue
+            last_position = position
+            await on_position(position)
+
+    async def _wait_for_change(self):
+        # Старение меняет порядок без событий, поэтому ожидание ограничено по времени
+        try:
+            await asyncio.wait_for(self._condition.wait(), timeout=self.aging_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    def _start(self, ticket: JobTicket):
+        self._waiting.remove(ticket)
+        ticket.running = True
+        self._running += 1
+        self._running_by_user[ticket.user_id] = self._running_by_user.get(ticket.user_id, 0) + 1
+        self._last_start_by_user[ticket.user_id] = time.monotonic()
+        waited = time.monotonic() - ticket.submitted_at
+        self.recent_waits.append(waited)
+        logger.info(
+            f"Задача пользователя {ticket.user_id} запущена после {waited:.1f} с ожидания "
+            f"(приоритет {ticket.priority}), выполняется {self._running}/{self.max_running}, "
+            f"в очереди {len(self._waiting)}"
+        )
+
+    @asynccontextmanager
+    async def slot(self, ticket: JobTicket, on_position=None):
+        """Ждет слот для задачи и освобождает его по выходу, в том числе при отмене в очереди"""
+        try:
+            await self.wait(ticket, on_position)
+            yield ticket
+        finally:
+            await self.release(ticket)
+
+    async def release(self, ticket: JobTicket):
+        """Освобождает слот задачи или снимает ее из очереди, если она не успела начаться"""
+        async with self._condition:
+            if ticket.released:
+                return
+            ticket.released = True
+            if ticket.running:
+                self._running = max(0, self._running - 1)
+                self.completed += 1
+                remaining = self._running_by_user.get(ticket.user_id, 1) - 1
+                if remaining > 0:
+                    self._running_by_user[ticket.user_id] = remaining
+                else:
+                    self._running_by_user.pop(ticket.user_id, None)
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+            if not self.user_jobs(ticket.user_id):
+                self._last_start_by_user.pop(ticket.user_id, None)
+            self._condition.notify_all()
+
+    async def resize(self, max_running: int):
+        """Меняет число одновременных задач; уже запущенные сверх нового лимита дорабатывают"""
+        async with self._condition:
+            self.max_running = max(1, max_running)
+            self._condition.notify_all()
+
+    def recent_wait(self, percentile: float = 0.9) -> float:
+        """Процентиль времени ожидания последних запущенных задач, секунд; 0 - задач еще не было"""
+        if not self.recent_waits:
+            return 0.0
+        waits = sorted(self.recent_waits)
+        return waits[min(len(waits) - 1, int(len(waits) * percentile))]
+
+    def stats(self) -> dict:
+        """Текущее состояние очереди"""
+        return {
+            'max_running': self.max_running,
+            'running': self._running,
+            'waiting': len(self._waiting),
+            'users_running': len(self._running_by_user),
+            'completed': self.completed,
+            'wait_p90': self.recent_wait(0.9),
+        }
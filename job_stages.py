@@ -0,0 +1,63 @@
+"""
+Передача готовых копий между стадиями обработки и отправки
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UploadStage:
+    """Стадия отправки: готовые копии передаются ей через очередь.
+
+    Обработка кладет путь копии в очередь (put) и сразу продолжает
+    кодирование; отдельная задача отправляет копии по одной через
+    send_copy(path). Число одновременных отправок всего бота ограничивает
+    сама send_copy (upload_semaphore), поэтому слот обработки после
+    кодирования последней копии освобождается, не дожидаясь сети.
+
+    При выходе из async with без ошибки дожидается отправки всех копий;
+    при ошибке или отмене неотправленные копии бросаются. Ошибка отправки
+    прерывает обработку при следующем put().
+    """
+
+    def __init__(self, send_copy):
+        self.send_copy = send_copy
+        self.sent = 0
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._queue.put_nowait(None)
+            await self._task
+            return False
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return False
+
+    async def put(self, path: str):
+        """Передает готовую копию на отправку"""
+        if self._task.done():
+            # Отправка уже упала - ошибка поднимается в обработке
+            self._task.result()
+            raise RuntimeError("Стадия отправки завершилась раньше обработки")
+        self._queue.put_nowait(path)
+
+    @property
+    def pending(self) -> int:
+        """Сколько копий ждет отправки"""
+        return self._queue.qsize()
+
+    async def _run(self):
+        while True:
+            path = await self._queue.get()
+            if path is None:
+                return
+            await self.send_copy(path)
+            self.sent += 1
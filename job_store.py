@@ -0,0 +1,270 @@
+"""
+Постоянная очередь задач обработки в SQLite для сервиса воркеров
+"""
+
+import json
+import time
+import uuid
+import sqlite3
+import logging
+from contextlib import contextmanager
+
+from config import JOB_STORE_DB, JOB_MAX_ATTEMPTS
+
+logger = logging.getLogger(__name__)
+
+# Состояния задачи
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_DELIVERED = 'delivered'
+
+
+class JobStore:
+    """Очередь задач в файле SQLite, общая для бота и процессов-воркеров.
+
+    Бот ставит задачу (enqueue), воркер забирает ее с арендой на
+    lease_seconds (claim) и продлевает аренду, пока работает (heartbeat).
+    Если воркер упал, аренда истекает и задача возвращается в очередь,
+    пока не исчерпаны попытки max_attempts. Готовые копии отмечаются по
+    одной (mark_copy_ready): при повторе воркер делает только недостающие,
+    а бот после перезапуска досылает готовые, но не отправленные копии.
+    """
+
+    def __init__(self, db_file: str = None):
+        self.db_file = db_file or JOB_STORE_DB
+        self.init_database()
+
+    @contextmanager
+    def _connect(self):
+        # Автокоммит: транзакции открываются явно (BEGIN IMMEDIATE) там, где нужны
+        conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def init_database(self):
+        """Создает таблицу задач; WAL позволяет читать очередь, пока воркер пишет"""
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    chat_id INTEGER NOT NULL,
+                    message_id INTEGER,
+                    priority INTEGER NOT NULL DEFAULT 2,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    worker TEXT,
+                    lease_until REAL,
+                    ready_copies TEXT NOT NULL DEFAULT '[]',
+                    delivered_copies TEXT NOT NULL DEFAULT '[]',
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, priority, created_at)')
+
+    @staticmethod
+    def _row_to_job(row) -> dict:
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['ready_copies'] = json.loads(job['ready_copies'])
+        job['delivered_copies'] = json.loads(job['delivered_copies'])
+        return job
+
+    def enqueue(self, kind: str, user_id: int, chat_id: int, payload: dict, priority: int = 2,
+                message_id: int = None, max_attempts: int = None, max_active: int = None):
+        """Ставит задачу в очередь и возвращает ее id.
+
+        max_active - лимит задач пользователя в очереди и в работе: если он
+        уже достигнут, задача не ставится и возвращается None.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE: проверка лимита и вставка не разрываются параллельной постановкой
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if max_active is not None and self._count_active(conn, user_id) >= max_active:
+                    conn.execute('COMMIT')
+                    return None
+                conn.execute(
+                    '''INSERT INTO jobs (job_id, kind, user_id, chat_id, message_id, priority, payload, status,
+                                         max_attempts, created_at, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    (job_id, kind, user_id, chat_id, message_id, priority, json.dumps(payload), JOB_QUEUED,
+                     max_attempts or JOB_MAX_ATTEMPTS, now, now)
+                )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        logger.info(f"Задача {job_id} ({kind}) пользователя {user_id} поставлена в очередь сервиса")
+        return job_id
+
+    @staticmethod
+    def _count_active(conn, user_id: int) -> int:
+        row = conn.execute(
+            'SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status IN (?, ?)', (user_id, JOB_QUEUED, JOB_RUNNING)
+        ).fetchone()
+        return row[0]
+
+    def active_jobs(self, user_id: int) -> int:
+        """Число задач пользователя в очереди и в работе"""
+        with self._connect() as conn:
+            return self._count_active(conn, user_id)
+
+    def get(self, job_id: str):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def _requeue_expired(self, conn, now: float):
+        """Возвращает в очередь задачи воркеров, которые перестали продлевать аренду"""
+        expired = conn.execute(
+            'SELECT job_id, attempts, max_attempts FROM jobs WHERE status = ? AND lease_until < ?',
+            (JOB_RUNNING, now)
+        ).fetchall()
+        for row in expired:
+            if row['attempts'] >= row['max_attempts']:
+                status, error = JOB_FAILED, 'Воркер не завершил задачу за все попытки'
+            else:
+                status, error = JOB_QUEUED, None
+            conn.execute(
+                'UPDATE jobs SET status = ?, worker = NULL, lease_until = NULL, error = ?, updated_at = ? '
+                'WHERE job_id = ?',
+                (status, error, now, row['job_id'])
+            )
+            logger.warning(f"Аренда задачи {row['job_id']} истекла, новое состояние: {status}")
+
+    def claim(self, worker: str, lease_seconds: float):
+        """Забирает следующую задачу из очереди для воркера; None - очередь пуста"""
+        now = time.time()
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE: два воркера не заберут одну задачу
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._requeue_expired(conn, now)
+                row = conn.execute(
+                    'SELECT * FROM jobs WHERE status = ? ORDER BY priority, created_at LIMIT 1', (JOB_QUEUED,)
+                ).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None
+                conn.execute(
+                    'UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, '
+                    'updated_at = ? WHERE job_id = ?',
+                    (JOB_RUNNING, worker, now + lease_seconds, now, row['job_id'])
+                )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        job = self._row_to_job(row)
+        job.update(status=JOB_RUNNING, worker=worker, attempts=row['attempts'] + 1)
+        return job
+
+    def heartbeat(self, job_id: str, worker: str, lease_seconds: float) -> bool:
+        """Продлевает аренду; False - задача уже не принадлежит воркеру"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET lease_until = ?, updated_at = ? WHERE job_id = ? AND status = ? AND worker = ?',
+                (now + lease_seconds, now, job_id, JOB_RUNNING, worker)
+            )
+        return cursor.rowcount == 1
+
+    def _add_to_list(self, job_id: str, column: str, copy_index: int):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(f'SELECT {column} FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+                if row is not None:
+                    values = json.loads(row[column])
+                    if copy_index not in values:
+                        values.append(copy_index)
+                        conn.execute(
+                            f'UPDATE jobs SET {column} = ?, updated_at = ? WHERE job_id = ?',
+                            (json.dumps(sorted(values)), time.time(), job_id)
+                        )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def mark_copy_ready(self, job_id: str, copy_index: int):
+        """Копия записана полностью и ее можно отправлять"""
+        self._add_to_list(job_id, 'ready_copies', copy_index)
+
+    def mark_copy_delivered(self, job_id: str, copy_index: int):
+        """Копия отправлена пользователю"""
+        self._add_to_list(job_id, 'delivered_copies', copy_index)
+
+    def _finish(self, job_id: str, worker: str, status: str, error: str = None) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, worker = NULL, lease_until = NULL, error = ?, updated_at = ? '
+                'WHERE job_id = ? AND status = ? AND worker = ?',
+                (status, error, time.time(), job_id, JOB_RUNNING, worker)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker: str) -> bool:
+        """Воркер закончил задачу"""
+        return self._finish(job_id, worker, JOB_DONE)
+
+    def release(self, job_id: str, worker: str) -> bool:
+        """Воркер останавливается: задача возвращается в очередь, попытка не засчитывается"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, worker = NULL, lease_until = NULL, attempts = attempts - 1, '
+                'updated_at = ? WHERE job_id = ? AND status = ? AND worker = ?',
+                (JOB_QUEUED, now, job_id, JOB_RUNNING, worker)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker: str, error: str, attempts: int, max_attempts: int) -> bool:
+        """Ошибка обработки: задача возвращается в очередь, пока есть попытки"""
+        status = JOB_QUEUED if attempts < max_attempts else JOB_FAILED
+        logger.warning(f"Задача {job_id} завершилась ошибкой (попытка {attempts}/{max_attempts}): {error}")
+        return self._finish(job_id, worker, status, error)
+
+    def pending_delivery(self) -> list:
+        """Задачи, у которых есть неотправленные копии или которые закончились, но еще не закрыты"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT * FROM jobs WHERE status IN (?, ?) '
+                'OR (status IN (?, ?) AND ready_copies != delivered_copies) ORDER BY created_at',
+                (JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def mark_delivered(self, job_id: str):
+        """Результат задачи отправлен пользователю - задача закрыта"""
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, updated_at = ? WHERE job_id = ?', (JOB_DELIVERED, time.time(), job_id)
+            )
+
+    def purge(self, older_than: float):
+        """Удаляет закрытые задачи старше older_than секунд"""
+        with self._connect() as conn:
+            conn.execute(
+                'DELETE FROM jobs WHERE status = ? AND updated_at < ?', (JOB_DELIVERED, time.time() - older_than)
+            )
+
+    def stats(self) -> dict:
+        """Число задач по состояниям"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT status, COUNT(*) AS count FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['count'] for row in rows}
@@ -0,0 +1,210 @@
+"""
+Рабочие папки задач обработки: отдельная папка на задачу в RAM (tmpfs) или на диске
+"""
+
+import os
+import time
+import shutil
+import logging
+import tempfile
+import threading
+
+from config import TEMP_DIR, MAX_VIDEO_SIZE, WORKSPACE_RAM_DIR, WORKSPACE_RAM_BUDGET_MB
+
+logger = logging.getLogger(__name__)
+
+# Префикс папок задач: по нему при запуске находятся папки, оставшиеся после сбоя
+WORKSPACE_PREFIX = 'job-'
+# Префикс папок, которые уже отсоединены и удаляются
+TRASH_PREFIX = '.trash-'
+
+
+def estimate_workspace_bytes(input_size: int, copies: int) -> int:
+    """Оценка места под задачу: входной файл и копии с запасом на промежуточные файлы"""
+    input_size = input_size or MAX_VIDEO_SIZE
+    return input_size * (1 + 2 * max(1, copies))
+
+
+class JobWorkspace:
+    """Рабочая папка одной задачи.
+
+    Владеет путями скачанного файла, промежуточных файлов (аудиодорожка,
+    сегменты) и готовых копий. Имена не зависят от user_id, поэтому
+    параллельные задачи одного пользователя не пересекаются. Папка
+    удаляется целиком в cleanup().
+    """
+
+    def __init__(self, path: str, in_ram: bool = False, reserved_bytes: int = 0, manager=None):
+        self.path = path
+        self.in_ram = in_ram
+        self.reserved_bytes = reserved_bytes
+        self.manager = manager
+        self.closed = False
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def input_path(self) -> str:
+        return self.file('input.mp4')
+
+    def output_path(self, copy_index: int) -> str:
+        return self.file(f'copy_{copy_index + 1}.mp4')
+
+    @property
+    def work_dir(self) -> str:
+        """Папка для промежуточных файлов обработки"""
+        work_dir = self.file('work')
+        os.makedirs(work_dir, exist_ok=True)
+        return work_dir
+
+    def cleanup(self):
+        """Удаляет папку задачи.
+
+        Папка сначала переименовывается (атомарно в пределах файловой системы),
+        так что частично удаленная задача не остается под рабочим именем,
+        затем удаляется вместе с содержимым.
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        trash_path = os.path.join(os.path.dirname(self.path), TRASH_PREFIX + os.path.basename(self.path))
+        try:
+            os.rename(self.path, trash_path)
+        except FileNotFoundError:
+            trash_path = None
+        except OSError as e:
+            logger.warning(f"Не удалось переименовать рабочую папку {self.path}: {e}")
+            trash_path = self.path
+
+        if trash_path:
+            shutil.rmtree(trash_path, ignore_errors=True)
+            logger.info(f"Удалена рабочая папка задачи: {self.path}")
+
+        if self.manager is not None:
+            self.manager.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+
+class WorkspaceManager:
+    """Выдает рабочие папки задачам.
+
+    Папка создается в RAM (WORKSPACE_RAM_DIR, обычно /dev/shm), пока
+    оценка места задач укладывается в бюджет WORKSPACE_RAM_BUDGET_MB и
+    в свободное место tmpfs; иначе - на диске в TEMP_DIR.
+    """
+
+    def __init__(self, ram_dir: str = None, ram_budget_mb: int = None, disk_dir: str = None):
+        ram_dir = WORKSPACE_RAM_DIR if ram_dir is None else ram_dir
+        self.ram_budget = (WORKSPACE_RAM_BUDGET_MB if ram_budget_mb is None else ram_budget_mb) * 1024 * 1024
+        self.disk_dir = os.path.abspath(disk_dir or TEMP_DIR)
+        self.ram_dir = os.path.abspath(ram_dir) if ram_dir and self._prepare_ram_dir(ram_dir) else None
+        self.ram_used = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.disk_dir, exist_ok=True)
+
+        if self.ram_dir:
+            logger.info(f"Рабочие папки задач в RAM: {self.ram_dir}, бюджет {self.ram_budget // (1024 * 1024)} МБ")
+        else:
+            logger.info(f"Рабочие папки задач на диске: {self.disk_dir}")
+
+    def _prepare_ram_dir(self, ram_dir: str) -> bool:
+        if self.ram_budget <= 0:
+            return False
+        try:
+            os.makedirs(ram_dir, exist_ok=True)
+            return os.access(ram_dir, os.W_OK)
+        except OSError as e:
+            logger.warning(f"Папка в RAM {ram_dir} недоступна, используем диск: {e}")
+            return False
+
+    def _reserve_ram(self, expected_bytes: int) -> bool:
+        if not self.ram_dir:
+            return False
+        with self._lock:
+            if self.ram_used + expected_bytes > self.ram_budget:
+                return False
+            try:
+                if shutil.disk_usage(self.ram_dir).free < expected_bytes:
+                    return False
+            except OSError:
+                return False
+            self.ram_used += expected_bytes
+            return True
+
+    def allocate(self, expected_bytes: int = 0) -> JobWorkspace:
+        """Создает рабочую папку задачи; expected_bytes - оценка из estimate_workspace_bytes()"""
+        expected_bytes = expected_bytes or estimate_workspace_bytes(0, 1)
+        if self._reserve_ram(expected_bytes):
+            try:
+                path = tempfile.mkdtemp(prefix=WORKSPACE_PREFIX, dir=self.ram_dir)
+                return JobWorkspace(path, in_ram=True, reserved_bytes=expected_bytes, manager=self)
+            except OSError as e:
+                logger.warning(f"Не удалось создать папку в RAM, используем диск: {e}")
+                self._release_bytes(expected_bytes)
+
+        path = tempfile.mkdtemp(prefix=WORKSPACE_PREFIX, dir=self.disk_dir)
+        return JobWorkspace(path, manager=self)
+
+    def ensure_capacity(self, workspace: JobWorkspace, expected_bytes: int) -> JobWorkspace:
+        """Расширяет резерв папки под новую оценку места задачи.
+
+        Нужно, когда папка выделена до того, как стало известно число копий
+        (упреждающее скачивание). Если в бюджет RAM задача не помещается,
+        входной файл переносится в новую папку на диске, старая удаляется.
+        """
+        if not workspace.in_ram or expected_bytes <= workspace.reserved_bytes:
+            return workspace
+        if self._reserve_ram(expected_bytes - workspace.reserved_bytes):
+            workspace.reserved_bytes = expected_bytes
+            return workspace
+
+        disk_workspace = JobWorkspace(tempfile.mkdtemp(prefix=WORKSPACE_PREFIX, dir=self.disk_dir), manager=self)
+        for name in os.listdir(workspace.path):
+            shutil.move(workspace.file(name), disk_workspace.file(name))
+        workspace.cleanup()
+        logger.info(f"Задача не помещается в бюджет RAM, рабочая папка перенесена на диск: {disk_workspace.path}")
+        return disk_workspace
+
+    def release(self, workspace: JobWorkspace):
+        """Возвращает зарезервированное место папки в бюджет"""
+        if workspace.in_ram:
+            self._release_bytes(workspace.reserved_bytes)
+            workspace.reserved_bytes = 0
+
+    def _release_bytes(self, reserved_bytes: int):
+        with self._lock:
+            self.ram_used = max(0, self.ram_used - reserved_bytes)
+
+    def cleanup_stale(self, max_age: int = 3600):
+        """Удаляет папки задач старше max_age секунд, оставшиеся после сбоя"""
+        current_time = time.time()
+        for base_dir in filter(None, [self.ram_dir, self.disk_dir]):
+            try:
+                names = os.listdir(base_dir)
+            except OSError:
+                continue
+            for name in names:
+                if not name.startswith((WORKSPACE_PREFIX, TRASH_PREFIX)):
+                    continue
+                path = os.path.join(base_dir, name)
+                try:
+                    if os.path.isdir(path) and current_time - os.path.getmtime(path) > max_age:
+                        shutil.rmtree(path, ignore_errors=True)
+                        logger.info(f"Удалена старая рабочая папка: {path}")
+                except OSError as e:
+                    logger.warning(f"Ошибка при удалении старой рабочей папки {path}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'ram_dir': self.ram_dir,
+            'ram_used_mb': self.ram_used // (1024 * 1024),
+            'ram_budget_mb': self.ram_budget // (1024 * 1024),
+        }
@@ -0,0 +1,164 @@
+"""
+Упреждающее скачивание медиа, пока пользователь выбирает параметры обработки
+"""
+
+import os
+import time
+import asyncio
+import logging
+import contextlib
+from dataclasses import dataclass, field
+
+from config import MEDIA_PREFETCH, MEDIA_PREFETCH_TTL
+from job_workspace import JobWorkspace, WorkspaceManager, estimate_workspace_bytes
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PrefetchedMedia:
+    """Скачанный заранее файл в собственной рабочей папке"""
+    file_id: str
+    workspace: JobWorkspace
+    path: str
+    file_size: int
+    video_info: object = None  # VideoInfo из ProbeCache, только для видео
+
+
+@dataclass
+class _PrefetchEntry:
+    file_id: str
+    task: asyncio.Task
+    started_at: float = field(default_factory=time.monotonic)
+    expiry: asyncio.TimerHandle = None
+
+
+class MediaPrefetcher:
+    """Скачивает файл сразу после получения, не дожидаясь выбора параметров.
+
+    На пользователя приходится одна упреждающая загрузка: новый файл
+    отменяет предыдущую. Обработка забирает результат через take() -
+    готовый сразу, незавершенный дожидается. Невостребованные загрузки
+    удаляются через MEDIA_PREFETCH_TTL секунд или при сбросе сессии (discard).
+    """
+
+    def __init__(self, workspaces: WorkspaceManager, probe_cache=None, enabled: bool = None, ttl: int = None,
+                 input_cache=None, download_limit: asyncio.Semaphore = None):
+        self.workspaces = workspaces
+        self.probe_cache = probe_cache
+        self.input_cache = input_cache
+        # Общий с обработкой лимит одновременных скачиваний
+        self.download_limit = download_limit
+        self.enabled = MEDIA_PREFETCH if enabled is None else enabled
+        self.ttl = MEDIA_PREFETCH_TTL if ttl is None else ttl
+        self._entries = {}
+
+    def start(self, user_id: int, bot, file_id: str, file_unique_id: str = None, file_size: int = None,
+              file_name: str = 'input.mp4', probe: bool = False):
+        """Запускает фоновое скачивание файла пользователя; probe - сразу прочитать метаданные видео"""
+        if not self.enabled:
+            return None
+        self.discard(user_id)
+
+        task = asyncio.create_task(self._fetch(bot, file_id, file_unique_id, file_size, file_name, probe))
+        entry = _PrefetchEntry(file_id, task)
+        # Срок хранения отсчитывается для каждой загрузки отдельно, без ожидания следующего start()
+        entry.expiry = asyncio.get_running_loop().call_later(self.ttl, self._expire, user_id, entry)
+        self._entries[user_id] = entry
+        logger.info(f"Упреждающее скачивание файла пользователя {user_id} запущено")
+        return task
+
+    def is_ready(self, user_id: int, file_id: str) -> bool:
+        """Файл уже скачан и его можно забрать без ожидания"""
+        entry = self._entries.get(user_id)
+        return (
+            entry is not None and entry.file_id == file_id and entry.task.done()
+            and not entry.task.cancelled() and entry.task.exception() is None
+        )
+
+    async def take(self, user_id: int, file_id: str):
+        """Забирает скачанный файл для обработки; None - скачивать заново.
+
+        Если загрузка еще идет, дожидается ее. После take() рабочая папка
+        принадлежит обработке и удаляется ею.
+        """
+        entry = self._entries.get(user_id)
+        if entry is None or entry.file_id != file_id:
+            return None
+        del self._entries[user_id]
+        entry.expiry.cancel()
+
+        try:
+            media = await entry.task
+        except asyncio.CancelledError:
+            # Отменена обработка, которая ждала загрузку - загрузка отменяется вместе с ней
+            if not entry.task.done():
+                entry.task.cancel()
+            elif not entry.task.cancelled():
+                self._cleanup(entry)
+            raise
+        except Exception as e:
+            logger.warning(f"Упреждающее скачивание не удалось, скачиваем заново: {e}")
+            return None
+
+        waited = time.monotonic() - entry.started_at
+        logger.info(f"Используется файл, скачанный заранее (загрузка начата {waited:.1f} с назад)")
+        return media
+
+    def discard(self, user_id: int):
+        """Отменяет загрузку пользователя и удаляет уже скачанный файл"""
+        entry = self._entries.pop(user_id, None)
+        if entry is None:
+            return
+        entry.expiry.cancel()
+        if entry.task.done():
+            self._cleanup(entry)
+        else:
+            entry.task.cancel()
+
+    def _expire(self, user_id: int, entry: _PrefetchEntry):
+        if self._entries.get(user_id) is not entry:
+            return
+        logger.info(f"Файл пользователя {user_id} не понадобился за {self.ttl} с, удаляю")
+        self.discard(user_id)
+
+    @staticmethod
+    def _cleanup(entry: _PrefetchEntry):
+        if entry.task.cancelled() or entry.task.exception() is not None:
+            return
+        entry.task.result().workspace.cleanup()
+
+    @staticmethod
+    def _cleanup_allocation(allocation: asyncio.Future):
+        if not allocation.cancelled() and allocation.exception() is None:
+            allocation.result().cleanup()
+
+    async def _fetch(self, bot, file_id: str, file_unique_id: str, file_size: int, file_name: str,
+                     probe: bool) -> PrefetchedMedia:
+        # Число копий еще не выбрано - резерв под одну, обработка расширит его (ensure_capacity)
+        # statvfs и mkdir - в потоке, чтобы не блокировать цикл событий
+        allocation = asyncio.ensure_future(
+            asyncio.to_thread(self.workspaces.allocate, estimate_workspace_bytes(file_size, 1))
+        )
+        try:
+            workspace = await asyncio.shield(allocation)
+        except asyncio.CancelledError:
+            # Папка, созданная уже после отмены загрузки, удаляется сразу
+            allocation.add_done_callback(self._cleanup_allocation)
+            raise
+        try:
+            path = workspace.file(file_name)
+            async with self.download_limit or contextlib.nullcontext():
+                if self.input_cache is not None:
+                    await self.input_cache.fetch(bot, file_id, file_unique_id, path)
+                else:
+                    telegram_file = await bot.get_file(file_id)
+                    await telegram_file.download_to_drive(path)
+
+            video_info = None
+            if probe and self.probe_cache is not None:
+                video_info = await self.probe_cache.probe(path, file_unique_id)
+            return PrefetchedMedia(file_id, workspace, path, os.path.getsize(path), video_info)
+        except BaseException:
+            workspace.cleanup()
+            raise
@@ -0,0 +1,196 @@
+"""
+Быстрое получение метаданных видео и их кеш по file_unique_id
+"""
+
+import os
+import re
+import asyncio
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Optional
+from moviepy.config import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Сколько записей держать в памяти (SQLite хранит все)
+PROBE_CACHE_MEMORY_SIZE = 1024
+
+_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_BITRATE_RE = re.compile(r"Duration: .*?bitrate: (\d+) kb/s")
+_VIDEO_RE = re.compile(r"Stream #\d+:\d+.*?: Video: (\w+).*?, (\d{2,5})x(\d{2,5})")
+_FPS_RE = re.compile(r"Stream #\d+:\d+.*?: Video: .*?([\d.]+) (?:fps|tbr)")
+_AUDIO_RE = re.compile(r"Stream #\d+:\d+.*?: Audio: (\w+)")
+_ROTATION_RE = re.compile(r"rotation of (-?[\d.]+) degrees|rotate\s*: (-?\d+)")
+
+
+@dataclass
+class VideoInfo:
+    """Метаданные контейнера, достаточные для планирования обработки"""
+    duration: float
+    fps: float
+    width: int
+    height: int
+    video_codec: str = None
+    audio_codec: str = None
+    bitrate: int = None  # кбит/с, общий битрейт контейнера
+    file_size: int = None  # байт
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_codec is not None
+
+    @property
+    def frame_count(self) -> int:
+        return int(self.duration * self.fps)
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'VideoInfo':
+        return cls(**{key: data.get(key) for key in cls.__dataclass_fields__})
+
+
+def parse_ffmpeg_info(ffmpeg_output: str, file_size: int = None) -> Optional[VideoInfo]:
+    """Разбирает заголовок `ffmpeg -i` (только метаданные контейнера, без декодирования)"""
+    video_match = _VIDEO_RE.search(ffmpeg_output)
+    if not video_match:
+        return None
+
+    duration = 0.0
+    duration_match = _DURATION_RE.search(ffmpeg_output)
+    if duration_match:
+        hours, minutes, seconds = duration_match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    fps_match = _FPS_RE.search(ffmpeg_output)
+    bitrate_match = _BITRATE_RE.search(ffmpeg_output)
+    audio_match = _AUDIO_RE.search(ffmpeg_output)
+
+    width, height = int(video_match.group(2)), int(video_match.group(3))
+    rotation_match = _ROTATION_RE.search(ffmpeg_output)
+    if rotation_match:
+        rotation = abs(int(float(rotation_match.group(1) or rotation_match.group(2)))) % 180
+        if rotation == 90:
+            # Видео с телефона: кадр хранится повернутым, декодер отдает его уже развернутым
+            width, height = height, width
+
+    return VideoInfo(
+        duration=duration,
+        fps=float(fps_match.group(1)) if fps_match else 25.0,
+        width=width,
+        height=height,
+        video_codec=video_match.group(1),
+        audio_codec=audio_match.group(1) if audio_match else None,
+        bitrate=int(bitrate_match.group(1)) if bitrate_match else None,
+        file_size=file_size
+    )
+
+
+def probe_video(input_path: str) -> Optional[VideoInfo]:
+    """Читает метаданные видео без открытия VideoFileClip и декодирования кадров"""
+    try:
+        proc = subprocess.run(
+            [get_setting("FFMPEG_BINARY"), '-hide_banner', '-i', input_path],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            timeout=30
+        )
+        file_size = os.path.getsize(input_path) if os.path.exists(input_path) else None
+        info = parse_ffmpeg_info(proc.stderr.decode('utf8', errors='replace'), file_size)
+        if info is None:
+            logger.warning(f"Не удалось получить метаданные видео: {input_path}")
+        return info
+    except Exception as e:
+        logger.error(f"Ошибка при получении метаданных видео {input_path}: {e}")
+        return None
+
+
+def estimate_processing_timeout(info: Optional[VideoInfo], copies: int, file_size_mb: float,
+                                minimum: int = 300, seconds_per_mb: int = 30) -> int:
+    """Таймаут обработки всех копий.
+
+    По метаданным таймаут считается от длительности и числа пикселей
+    (секунда 720p-видео на копию - не больше 10 секунд работы); без
+    метаданных используется старая оценка по размеру файла.
+    """
+    if info is None or info.duration <= 0:
+        return max(minimum, int(file_size_mb * seconds_per_mb)) * copies
+
+    pixel_scale = max(1.0, info.pixels / (1280 * 720))
+    return max(minimum, int(info.duration * pixel_scale * 10)) * copies
+
+
+class ProbeCache:
+    """Кеш метаданных видео по Telegram file_unique_id: память + SQLite.
+
+    Одно и то же видео (популярные ролики) присылают многократно, и при
+    попадании в кеш ffmpeg не запускается вовсе. get/put обращаются к SQLite,
+    поэтому probe() вызывает их в отдельном потоке.
+    """
+
+    def __init__(self, db_manager=None, memory_size: int = PROBE_CACHE_MEMORY_SIZE):
+        self.db_manager = db_manager
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_unique_id: str) -> Optional[VideoInfo]:
+        """Возвращает метаданные из кеша или None"""
+        if not file_unique_id:
+            return None
+
+        with self._lock:
+            info = self._memory.get(file_unique_id)
+            if info is not None:
+                self._memory.move_to_end(file_unique_id)
+                return info
+
+        if self.db_manager is not None:
+            data = self.db_manager.get_video_probe(file_unique_id)
+            if data:
+                info = VideoInfo.from_dict(data)
+                self._remember(file_unique_id, info)
+                return info
+        return None
+
+    def put(self, file_unique_id: str, info: VideoInfo):
+        """Сохраняет метаданные в память и SQLite"""
+        if not file_unique_id or info is None:
+            return
+        self._remember(file_unique_id, info)
+        if self.db_manager is not None:
+            self.db_manager.save_video_probe(file_unique_id, info.to_dict())
+
+    def _remember(self, file_unique_id: str, info: VideoInfo):
+        with self._lock:
+            self._memory[file_unique_id] = info
+            self._memory.move_to_end(file_unique_id)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    async def probe(self, input_path: str, file_unique_id: str = None) -> Optional[VideoInfo]:
+        """Метаданные видео: из кеша, а при промахе - через ffmpeg в отдельном потоке"""
+        info = await asyncio.to_thread(self.get, file_unique_id)
+        if info is not None:
+            self.hits += 1
+            logger.info(f"Метаданные видео {file_unique_id} взяты из кеша")
+            return info
+
+        self.misses += 1
+        info = await asyncio.to_thread(probe_video, input_path)
+        if info is not None:
+            logger.info(
+                f"Метаданные видео: {info.width}x{info.height}, {info.fps:.2f} fps, "
+                f"{info.duration:.1f} с, аудио: {info.audio_codec or 'нет'}"
+            )
+            await asyncio.to_thread(self.put, file_unique_id, info)
+        return info
@@ -0,0 +1,166 @@
+"""
+Управление битрейтом по целевому размеру файла
+"""
+
+import os
+import math
+import time
+import random
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Оценка битрейта аудиодорожки, когда готовой дорожки еще нет (audio_bitrate_kbps)
+AUDIO_BITRATE_ESTIMATE_KBPS = 192
+# Доля целевого размера на потоки; остальное - запас на контейнер MP4
+CONTAINER_EFFICIENCY = 0.96
+# Ниже этого битрейта видео становится непригодным - размер тогда не гарантируется
+MIN_VIDEO_BITRATE_KBPS = 300
+# Разброс битрейта между копиями: от 92% до 100% допустимого
+BITRATE_JITTER = (0.92, 1.0)
+
+# Прогноз размера строится после этой доли кадров, раньше он неточен
+SIZE_CHECK_MIN_PROGRESS = 0.2
+# Кодирование прерывается, если прогноз больше лимита на эту долю
+SIZE_CHECK_TOLERANCE = 1.1
+# Как часто проверять размер выходных файлов, секунд
+SIZE_CHECK_INTERVAL = 1.0
+
+
+def parse_bitrate_kbps(bitrate: str) -> int:
+    """'1500k' -> 1500"""
+    bitrate = str(bitrate).strip().lower()
+    if bitrate.endswith('k'):
+        return int(float(bitrate[:-1]))
+    if bitrate.endswith('m'):
+        return int(float(bitrate[:-1]) * 1000)
+    return int(float(bitrate) / 1000)
+
+
+def audio_bitrate_kbps(audio_path: str, duration: float) -> int:
+    """Фактический битрейт общей аудиодорожки задачи по размеру ее файла; 0 - звука нет"""
+    if not audio_path or not duration:
+        return 0
+    return math.ceil(os.path.getsize(audio_path) * 8 / duration / 1000)
+
+
+def plan_copy_bitrate(ceiling_kbps: int, duration: float, has_audio: bool, max_size_bytes: int,
+                      rng=random, audio_kbps: int = None) -> dict:
+    """Битрейт копии под лимит размера файла.
+
+    Допустимый битрейт видео = (лимит размера / длительность) - аудио.
+    audio_kbps - битрейт готовой аудиодорожки (AAC копируется как есть);
+    если он неизвестен, для видео со звуком берется AUDIO_BITRATE_ESTIMATE_KBPS.
+    Копия получает случайную долю из BITRATE_JITTER от меньшего из
+    допустимого и ceiling_kbps, поэтому битрейты копий различаются.
+    maxrate/bufsize ограничивают пики VBV, чтобы средний битрейт не ушел выше лимита.
+    """
+    if audio_kbps is None:
+        audio_kbps = AUDIO_BITRATE_ESTIMATE_KBPS if has_audio else 0
+    budget_kbps = int(max_size_bytes * 8 * CONTAINER_EFFICIENCY / duration / 1000) - audio_kbps
+    if budget_kbps < MIN_VIDEO_BITRATE_KBPS:
+        logger.warning(
+            f"Видео длительностью {duration:.0f} с не укладывается в {max_size_bytes // (1024 * 1024)} МБ "
+            f"даже на {MIN_VIDEO_BITRATE_KBPS}k"
+        )
+        budget_kbps = MIN_VIDEO_BITRATE_KBPS
+
+    limit_kbps = min(ceiling_kbps, budget_kbps)
+    bitrate_kbps = max(MIN_VIDEO_BITRATE_KBPS, int(limit_kbps * rng.uniform(*BITRATE_JITTER)))
+    maxrate_kbps = max(bitrate_kbps, min(int(bitrate_kbps * 1.5), budget_kbps))
+    return {
+        'bitrate': f'{bitrate_kbps}k',
+        'maxrate': f'{maxrate_kbps}k',
+        'bufsize': f'{maxrate_kbps * 2}k',
+    }
+
+
+def rate_control_args(codec_settings: dict) -> list:
+    """Аргументы ffmpeg для maxrate/bufsize, если они заданы в настройках кодека"""
+    args = []
+    if codec_settings.get('maxrate'):
+        args.extend(['-maxrate', codec_settings['maxrate']])
+    if codec_settings.get('bufsize'):
+        args.extend(['-bufsize', codec_settings['bufsize']])
+    return args
+
+
+class OutputTooLarge(Exception):
+    """Прогноз размера копии превышает лимит - кодирование прерывается заранее"""
+
+
+class OutputSizeGuard:
+    """Следит за размером выходных файлов во время кодирования.
+
+    По доле готовых кадров прогнозирует итоговый размер; если прогноз
+    заметно больше лимита, выбрасывает OutputTooLarge, не дожидаясь
+    конца кодирования. Подключается как обертка над progress_callback.
+    При сегментном кодировании копия пишется в файлы сегментов, а не в
+    output_paths - их передают в watch().
+    """
+
+    def __init__(self, output_paths: list, max_size_bytes: int, total_frames: int):
+        self.output_paths = output_paths
+        self.max_size_bytes = max_size_bytes
+        self.total_frames = total_frames
+        self.tripped = False
+        self.copy_files = None
+        self._last_check = 0.0
+
+    def watch(self, copy_files: list = None):
+        """Задает файлы каждой копии, сумма размеров которых проверяется; None - output_paths"""
+        self.copy_files = copy_files
+
+    def check(self, frames: int, copy_indices: list = None):
+        if self.tripped:
+            raise OutputTooLarge()
+        if not self.total_frames or frames < self.total_frames * SIZE_CHECK_MIN_PROGRESS:
+            return
+
+        now = time.monotonic()
+        if now - self._last_check < SIZE_CHECK_INTERVAL:
+            return
+        self._last_check = now
+
+        for copy_index in (range(len(self.output_paths)) if copy_indices is None else copy_indices):
+            files = self.copy_files[copy_index] if self.copy_files is not None else [self.output_paths[copy_index]]
+            size = 0
+            for path in files:
+                try:
+                    size += os.path.getsize(path)
+                except OSError:
+                    continue
+            if not size:
+                continue
+            projected_size = size * self.total_frames / frames
+            if projected_size > self.max_size_bytes * SIZE_CHECK_TOLERANCE:
+                self.tripped = True
+                logger.warning(
+                    f"Копия {copy_index + 1} превысит лимит: прогноз {projected_size / (1024 * 1024):.1f} МБ "
+                    f"при лимите {self.max_size_bytes / (1024 * 1024):.1f} МБ, кодирование прервано"
+                )
+                raise OutputTooLarge()
+
+    def wrap(self, progress_callback=None):
+        """progress_callback, который перед отчетом о прогрессе проверяет размер копий"""
+        def callback(frames, copy_indices=None, total_frames=None):
+            self.check(frames, copy_indices)
+            if progress_callback is not None:
+                progress_callback(frames, copy_indices, total_frames)
+        return callback
+
+
+def drop_oversized_outputs(output_paths: list, results: list, max_size_bytes: int) -> list:
+    """Помечает неудачными и удаляет копии больше лимита - их все равно не получится отправить"""
+    for i, output_path in enumerate(output_paths):
+        if not results[i] or not os.path.exists(output_path):
+            continue
+        size = os.path.getsize(output_path)
+        if size > max_size_bytes:
+            logger.error(
+                f"Копия {i + 1} больше лимита: {size / (1024 * 1024):.1f} МБ "
+                f"при лимите {max_size_bytes / (1024 * 1024):.1f} МБ"
+            )
+            results[i] = False
+            os.remove(output_path)
+    return results
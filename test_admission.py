@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки адаптивного допуска задач
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from admission import AdmissionController, SystemLoad, read_system_load
+from job_queue import FairJobQueue
+
+
+def _busy_queue(running: int, waiting: int) -> FairJobQueue:
+    """Очередь с running выполняющимися и waiting ожидающими задачами"""
+    queue = FairJobQueue(max_running=running, max_per_user=100)
+
+    async def fill():
+        for user_id in range(running):
+            await queue.wait(queue.submit(user_id))
+        for user_id in range(waiting):
+            queue.submit(1000 + user_id)
+
+    asyncio.run(fill())
+    return queue
+
+
+def test_read_system_load():
+    """Показатели читаются из файлов /proc"""
+    with tempfile.TemporaryDirectory() as proc_dir:
+        with open(os.path.join(proc_dir, 'loadavg'), 'w') as f:
+            f.write(f"{2.0 * (os.cpu_count() or 1)} 1.00 0.50 2/74 18290\n")
+        with open(os.path.join(proc_dir, 'meminfo'), 'w') as f:
+            f.write("MemTotal:        6147400 kB\nMemFree:          100000 kB\nMemAvailable:    2097152 kB\n")
+        with open(os.path.join(proc_dir, 'vmstat'), 'w') as f:
+            f.write("pswpin 3\npswpout 42\n")
+
+        sample = read_system_load(proc_dir)
+        assert abs(sample.load_per_cpu - 2.0) < 1e-6
+        assert sample.mem_available_mb == 2048
+        assert sample.swapped_out_pages == 42
+
+    print("✅ Нагрузка читается из /proc")
+    return True
+
+
+def test_limit_follows_load():
+    """Свободные ресурсы при очереди - лимит растет, перегрузка и нехватка памяти - снижается"""
+    queue = _busy_queue(running=4, waiting=3)
+    controller = AdmissionController(
+        queue, min_jobs=2, max_jobs=6, target_load=1.0, min_free_mb=1000, job_memory_mb=500, cooldown=30
+    )
+
+    idle = SystemLoad(load_per_cpu=0.3, mem_available_mb=8000, swapped_out_pages=0)
+    assert controller.decide(idle, now=0) == 5
+    queue.max_running = 5
+    # Load average еще не отразил новую задачу - следующее увеличение только после паузы
+    assert controller.decide(idle, now=10) == 5
+
+    overloaded = SystemLoad(load_per_cpu=1.5, mem_available_mb=8000, swapped_out_pages=0)
+    assert controller.decide(overloaded, now=20) == 4
+    queue.max_running = 4
+
+    low_memory = SystemLoad(load_per_cpu=0.3, mem_available_mb=900, swapped_out_pages=0)
+    assert controller.decide(low_memory, now=60) == 2, "При нехватке памяти лимит падает вдвое"
+    queue.max_running = 2
+
+    # Памяти хватает на сервер, но не на еще одну задачу - лимит не растет
+    tight = SystemLoad(load_per_cpu=0.3, mem_available_mb=1200, swapped_out_pages=0)
+    assert controller.decide(tight, now=120) == 2
+
+    swapping = SystemLoad(load_per_cpu=0.3, mem_available_mb=8000, swapped_out_pages=10)
+    queue.max_running = 6
+    assert controller.decide(swapping, now=180) == 2, "Вытеснение в swap снижает лимит"
+
+    print("✅ Лимит задач следует за нагрузкой в заданных пределах")
+    return True
+
+
+def test_long_queue_waits_raise_limit():
+    """Долгое ожидание в очереди разрешает рост лимита до самой целевой нагрузки"""
+    queue = _busy_queue(running=4, waiting=3)
+    controller = AdmissionController(
+        queue, min_jobs=2, max_jobs=6, target_load=1.0, min_free_mb=1000, job_memory_mb=500, cooldown=30,
+        max_queue_wait=60
+    )
+    busy = SystemLoad(load_per_cpu=0.9, mem_available_mb=8000, swapped_out_pages=0)
+    assert controller.decide(busy, now=0) == 4, "Задачи ждут недолго - запас по нагрузке сохраняется"
+
+    queue.recent_waits.extend([120.0] * 10)
+    assert queue.recent_wait(0.9) == 120.0
+    assert controller.decide(busy, now=60) == 5
+
+    print("✅ Время ожидания в очереди влияет на допуск задач")
+    return True
+
+
+def test_resize_admits_waiting_jobs():
+    """Увеличение лимита сразу запускает ожидающие задачи"""
+    async def scenario():
+        queue = FairJobQueue(max_running=1, max_per_user=5)
+        first = queue.submit(1)
+        await queue.wait(first)
+        second = queue.submit(2)
+        waiter = asyncio.create_task(queue.wait(second))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+
+        await queue.resize(2)
+        await asyncio.wait_for(waiter, timeout=1)
+        assert queue.stats()['running'] == 2
+
+    asyncio.run(scenario())
+
+    print("✅ Новый лимит сразу применяется к очереди")
+    return True
+
+
+if __name__ == "__main__":
+    success = (
+        test_read_system_load()
+        and test_limit_follows_load()
+        and test_long_queue_waits_raise_limit()
+        and test_resize_admits_waiting_jobs()
+    )
+    sys.exit(0 if success else 1)
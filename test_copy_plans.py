@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки планов копий, построенных из seed задачи
+"""
+
+import sys
+import os
+import json
+import random
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from copy_seeds import copy_rng
+from video_processor import build_copy_plans
+from image_processor import generate_image_modification_params
+
+
+def test_video_plans_are_reproducible():
+    """Тот же seed дает те же планы, планы сериализуются и не трогают глобальный random"""
+    random.seed(42)
+    expected_next = random.random()
+
+    random.seed(42)
+    first = build_copy_plans(12345, 6, add_frames=True, compress=True, duration=30, has_audio=True)
+    assert random.random() == expected_next, "Планы не должны использовать глобальный random"
+
+    second = build_copy_plans(12345, 6, add_frames=True, compress=True, duration=30, has_audio=True)
+    assert json.dumps(first) == json.dumps(second), "Планы с одним seed должны совпадать"
+
+    other = build_copy_plans(54321, 6, add_frames=True, compress=True, duration=30, has_audio=True)
+    assert json.dumps(first) != json.dumps(other)
+
+    frames = {json.dumps(plan['modifications']['frame']) for plan in first}
+    assert len(frames) > 1, "Рамки копий должны различаться"
+
+    print("✅ Планы копий видео воспроизводятся по seed задачи")
+    return True
+
+
+def test_image_plans_are_reproducible():
+    """План копии изображения повторяется по тому же seed"""
+    plans = [
+        generate_image_modification_params(i, True, True, True, True, None, copy_rng(777, i))
+        for i in range(3)
+    ]
+    replay = [
+        generate_image_modification_params(i, True, True, True, True, None, copy_rng(777, i))
+        for i in range(3)
+    ]
+    assert json.dumps(plans) == json.dumps(replay)
+    assert all(plan['filters'] and plan['frame'] and plan['size'] for plan in plans)
+
+    print("✅ Планы копий изображений воспроизводятся по seed задачи")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_video_plans_are_reproducible() and test_image_plans_are_reproducible()
+    sys.exit(0 if success else 1)
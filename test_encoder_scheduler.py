@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки планировщика потоков кодирования
+"""
+
+import sys
+import os
+import asyncio
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from encoder_scheduler import EncoderScheduler
+
+
+def test_plan_depends_on_queue_depth():
+    """При пустой очереди потоков на копию больше, при глубокой - меньше"""
+    scheduler = EncoderScheduler(total_threads=16, max_threads_per_copy=4)
+
+    assert scheduler.plan(3, queue_depth=1).threads_per_copy == 4
+    assert scheduler.plan(3, queue_depth=2).threads_per_copy == 2
+    assert scheduler.plan(3, queue_depth=8).threads_per_copy == 1
+
+    print("✅ Число потоков на копию зависит от глубины очереди")
+    return True
+
+
+def test_long_video_is_segmented_when_cores_are_free():
+    """Длинное видео делится на сегменты только при свободном бюджете"""
+    scheduler = EncoderScheduler(total_threads=16, max_threads_per_copy=4, segmented=True)
+
+    idle = scheduler.plan(1, queue_depth=1, frame_pixels=1280 * 720, duration=120)
+    assert idle.segments > 1 and idle.threads <= 16
+
+    # Бэкенд moviepy кодирует видео целиком - лишние потоки под сегменты не резервируются
+    moviepy = EncoderScheduler(total_threads=16, max_threads_per_copy=4, segmented=False)
+    assert moviepy.plan(1, queue_depth=1, frame_pixels=1280 * 720, duration=120).segments == 1
+
+    busy = scheduler.plan(1, queue_depth=8, frame_pixels=1280 * 720, duration=120)
+    assert busy.segments == 1
+
+    short = scheduler.plan(1, queue_depth=1, frame_pixels=1280 * 720, duration=20)
+    assert short.segments == 1
+
+    print("✅ Сегментное кодирование включается только при свободных ядрах")
+    return True
+
+
+def test_budget_is_not_exceeded():
+    """Одновременно выданные слоты не превышают бюджет потоков"""
+    scheduler = EncoderScheduler(total_threads=8, max_threads_per_copy=4)
+    peak = 0
+
+    async def job(copies):
+        nonlocal peak
+        slot = await scheduler.acquire(copies)
+        peak = max(peak, scheduler.used_threads)
+        await asyncio.sleep(0.01)
+        await scheduler.release(slot)
+
+    async def run():
+        await asyncio.gather(*(job(3) for _ in range(10)))
+
+    asyncio.run(run())
+    assert peak <= 8, f"Бюджет превышен: {peak}"
+    assert scheduler.used_threads == 0 and scheduler.active_jobs == 0
+
+    print("✅ Бюджет потоков соблюдается")
+    return True
+
+
+def test_acquire_counts_job_once():
+    """Одиночная задача через acquire получает тот же слот, что и plan при пустой очереди"""
+    scheduler = EncoderScheduler(total_threads=16, max_threads_per_copy=16)
+
+    async def run():
+        lone = await scheduler.acquire(1, duration=120)
+        assert lone == scheduler.plan(1, queue_depth=1, duration=120), lone
+        assert lone.threads_per_copy == 16
+        # Следующая задача увидит первую в очереди и разделит бюджет с ней
+        assert scheduler.plan(1).threads_per_copy == 8
+        await scheduler.release(lone)
+
+    asyncio.run(run())
+
+    print("✅ acquire учитывает саму задачу в очереди один раз")
+    return True
+
+
+def test_waiters_are_served_in_order():
+    """Маленькая задача не обгоняет большую, которая ждет потоков, а отмена ожидающей не блокирует очередь"""
+    scheduler = EncoderScheduler(total_threads=8, max_threads_per_copy=4)
+    order = []
+
+    async def job(name, copies, hold):
+        slot = await scheduler.acquire(copies)
+        order.append(name)
+        await asyncio.sleep(hold)
+        await scheduler.release(slot)
+
+    async def run():
+        running = asyncio.create_task(job('running', 1, 0.05))  # Занимает 4 потока из 8
+        await asyncio.sleep(0)
+        # Большой задаче нужно 6 потоков - ждет; маленькой хватило бы свободных 4
+        large = asyncio.create_task(job('large', 6, 0.01))
+        await asyncio.sleep(0)
+        small = asyncio.create_task(job('small', 1, 0.01))
+        await asyncio.gather(running, large, small)
+        assert order == ['running', 'large', 'small'], order
+
+        order.clear()
+        running = asyncio.create_task(job('running', 1, 0.05))
+        await asyncio.sleep(0)
+        large = asyncio.create_task(job('large', 6, 0.01))
+        await asyncio.sleep(0)
+        small = asyncio.create_task(job('small', 1, 0.01))
+        await asyncio.sleep(0.01)
+        large.cancel()
+        await asyncio.wait_for(small, timeout=1)
+        assert order == ['running', 'small'], order
+        await running
+
+    asyncio.run(run())
+    assert scheduler.used_threads == 0 and scheduler.waiting_jobs == 0
+
+    print("✅ Задачи получают потоки в порядке очереди")
+    return True
+
+
+if __name__ == "__main__":
+    success = (
+        test_plan_depends_on_queue_depth()
+        and test_long_video_is_segmented_when_cores_are_free()
+        and test_budget_is_not_exceeded()
+        and test_acquire_counts_job_once()
+        and test_waiters_are_served_in_order()
+    )
+    sys.exit(0 if success else 1)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки выбора профиля кодирования
+"""
+
+import sys
+import os
+from datetime import datetime
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import encoding_profiles
+from encoding_profiles import get_encoding_profile, is_peak_hour, select_encoding_profile
+
+
+def test_peak_hours():
+    """Интервал часов пик, в том числе через полночь"""
+    assert is_peak_hour(18, '18-23') and is_peak_hour(23, '18-23')
+    assert not is_peak_hour(17, '18-23')
+    assert is_peak_hour(1, '22-2') and is_peak_hour(22, '22-2')
+    assert not is_peak_hour(12, '22-2')
+    assert not is_peak_hour(12, '') and not is_peak_hour(12, 'вечер')
+
+    print("✅ Часы пик определяются корректно")
+    return True
+
+
+def test_profile_selection():
+    """Часы пик важнее уровня пользователя, неизвестный профиль заменяется профилем по умолчанию"""
+    saved = (encoding_profiles.ENCODING_PEAK_PROFILE, encoding_profiles.ENCODING_PEAK_HOURS,
+             encoding_profiles.ENCODING_PROFILE_ADMIN)
+    try:
+        encoding_profiles.ENCODING_PEAK_PROFILE = 'fast'
+        encoding_profiles.ENCODING_PEAK_HOURS = '18-23'
+        encoding_profiles.ENCODING_PROFILE_ADMIN = 'quality'
+
+        evening = datetime(2025, 1, 1, 20, 0)
+        morning = datetime(2025, 1, 1, 9, 0)
+        assert select_encoding_profile(is_admin=True, now=evening) == 'fast'
+        assert select_encoding_profile(is_admin=True, now=morning) == 'quality'
+        assert select_encoding_profile(is_admin=False, now=morning) == encoding_profiles.ENCODING_PROFILE
+    finally:
+        (encoding_profiles.ENCODING_PEAK_PROFILE, encoding_profiles.ENCODING_PEAK_HOURS,
+         encoding_profiles.ENCODING_PROFILE_ADMIN) = saved
+
+    assert get_encoding_profile('fast')['preset'] == 'veryfast'
+    assert get_encoding_profile('нет такого') == get_encoding_profile(None)
+
+    print("✅ Профиль кодирования выбирается по часам пик и уровню пользователя")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_peak_hours() and test_profile_selection()
+    sys.exit(0 if success else 1)
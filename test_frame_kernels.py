@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки табличного изменения яркости кадров
+"""
+
+import sys
+import os
+import numpy as np
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from frame_kernels import FrameKernel, apply_lut, build_brightness_lut
+
+
+def test_brightness_lut_matches_float_path():
+    """Таблица дает тот же результат, что и умножение кадра во float"""
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, size=(64, 48, 3), dtype=np.uint8)
+
+    for brightness_factor in [0.95, 0.98, 1.0, 1.03, 1.25]:
+        expected = np.clip(frame * brightness_factor, 0, 255).astype('uint8')
+        result = apply_lut(frame, build_brightness_lut(brightness_factor))
+        assert np.array_equal(result, expected), f"Расхождение для коэффициента {brightness_factor}"
+
+    # Запись результата в исходный массив
+    in_place = frame.copy()
+    apply_lut(in_place, build_brightness_lut(1.03), out=in_place)
+    assert np.array_equal(in_place, np.clip(frame * 1.03, 0, 255).astype('uint8'))
+
+    print("✅ Таблица яркости совпадает с float-версией")
+    return True
+
+
+def test_brightness_kernel_reuses_buffer():
+    """Ядро не выделяет новый массив на каждый кадр и не меняет входной кадр"""
+    kernel = FrameKernel(brightness_factor=1.02)
+    frame = np.full((16, 16, 3), 200, dtype=np.uint8)
+
+    first = kernel(frame)
+    second = kernel(frame)
+    assert first is second, "Выходной буфер должен переиспользоваться"
+    assert np.all(frame == 200), "Входной кадр не должен изменяться"
+    assert np.all(second == 204)
+
+    print("✅ Выходной буфер переиспользуется")
+    return True
+
+
+def test_frame_kernel_border_and_shift():
+    """Рамка и сдвиг совпадают с послойной сборкой: рамка по краям, затем сдвиг с черными полями"""
+    rng = np.random.default_rng(1)
+    frame = rng.integers(0, 256, size=(40, 30, 3), dtype=np.uint8)
+    color = (255, 0, 128)
+    top_bottom, left_right = 5, 2
+
+    for shift in [(0, 0), (2, -3), (-1, 3), (3, 0)]:
+        # Эталон: рамка поверх кадра, затем сдвиг через pad/crop
+        bordered = frame.copy()
+        bordered[:top_bottom] = color
+        bordered[-top_bottom:] = color
+        bordered[:, :left_right] = color
+        bordered[:, -left_right:] = color
+        padded = np.zeros((40 + 6, 30 + 6, 3), dtype=np.uint8)
+        padded[3:-3, 3:-3] = bordered
+        shift_x, shift_y = shift
+        expected = padded[3 - shift_y:3 - shift_y + 40, 3 - shift_x:3 - shift_x + 30]
+
+        kernel = FrameKernel(border_color=color, top_bottom=top_bottom, left_right=left_right, shift=shift)
+        result = kernel(frame)
+        assert np.array_equal(result, expected), f"Расхождение для сдвига {shift}"
+
+    print("✅ Рамка и сдвиг записываются в кадр корректно")
+    return True
+
+
+if __name__ == "__main__":
+    success = (
+        test_brightness_lut_matches_float_path()
+        and test_brightness_kernel_reuses_buffer()
+        and test_frame_kernel_border_and_shift()
+    )
+    sys.exit(0 if success else 1)
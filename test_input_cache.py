@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки кеша скачанных файлов
+"""
+
+import sys
+import os
+import time
+import asyncio
+import tempfile
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from input_cache import InputCache
+
+
+class FakeFile:
+    def __init__(self, content: bytes):
+        self.content = content
+
+    async def download_to_drive(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.content)
+
+
+class FakeBot:
+    def __init__(self):
+        self.downloads = 0
+
+    async def get_file(self, file_id):
+        self.downloads += 1
+        return FakeFile(file_id.encode() * 100)
+
+
+def test_repeated_file_is_not_downloaded():
+    """Повторный файл с тем же file_unique_id берется из кеша"""
+    with tempfile.TemporaryDirectory() as cache_dir, tempfile.TemporaryDirectory() as work_dir:
+        cache = InputCache(cache_dir=cache_dir, max_mb=1, ttl=3600)
+        bot = FakeBot()
+
+        first_path = os.path.join(work_dir, 'first.mp4')
+        second_path = os.path.join(work_dir, 'second.mp4')
+        assert not asyncio.run(cache.fetch(bot, 'file-1', 'unique-1', first_path))
+        # Другой пользователь переслал то же видео: другой file_id, тот же file_unique_id
+        assert asyncio.run(cache.fetch(bot, 'file-1-forwarded', 'unique-1', second_path))
+        assert bot.downloads == 1
+        assert open(first_path, 'rb').read() == open(second_path, 'rb').read()
+
+        # Удаление файла задачи не затрагивает кеш
+        os.remove(first_path)
+        os.remove(second_path)
+        assert cache.get('unique-1') is not None
+
+    print("✅ Повторный файл берется из кеша без скачивания")
+    return True
+
+
+def test_lru_and_ttl_eviction():
+    """Сверх бюджета удаляются самые давние записи, записи старше ttl - всегда"""
+    with tempfile.TemporaryDirectory() as cache_dir, tempfile.TemporaryDirectory() as work_dir:
+        cache = InputCache(cache_dir=cache_dir, max_mb=1, ttl=3600)
+        chunk = 400 * 1024
+
+        for name in ('a', 'b'):
+            path = os.path.join(work_dir, name)
+            with open(path, 'wb') as f:
+                f.write(b'\0' * chunk)
+            cache.put(name, path)
+        # Запись a использовали позже b - при нехватке места удаляется b
+        os.utime(cache.get('b'), (time.time() - 60, time.time() - 60))
+        cache.get('a')
+
+        path = os.path.join(work_dir, 'c')
+        with open(path, 'wb') as f:
+            f.write(b'\0' * chunk)
+        cache.put('c', path)
+        assert cache.get('a') is not None and cache.get('c') is not None
+        assert cache.get('b') is None
+
+        old = time.time() - 7200
+        os.utime(cache.get('a'), (old, old))
+        assert cache.get('a') is None, "Запись старше ttl не должна возвращаться"
+
+    print("✅ Кеш соблюдает бюджет и срок хранения")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_repeated_file_is_not_downloaded() and test_lru_and_ttl_eviction()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки брокера задач для воркеров на других серверах
+"""
+
+import sys
+import os
+import tempfile
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_store import JobStore, JOB_DONE
+from job_broker import JobBrokerServer, SocketBroker, LocalBroker, BrokerError
+
+
+def _enqueue_job(store: JobStore, bot_dir: str, copies: int, input_bytes: bytes) -> str:
+    input_path = os.path.join(bot_dir, 'input.mp4')
+    with open(input_path, 'wb') as f:
+        f.write(input_bytes)
+    payload = {
+        'input_path': input_path,
+        'output_paths': [os.path.join(bot_dir, f'copy_{i + 1}.mp4') for i in range(copies)],
+        'work_dir': os.path.join(bot_dir, 'work'),
+    }
+    return store.enqueue('video', 1, 100, payload)
+
+
+def test_remote_worker_round_trip():
+    """Удаленный воркер получает задачу и вход по сокету и сдает копии боту"""
+    with tempfile.TemporaryDirectory() as bot_dir, tempfile.TemporaryDirectory() as worker_dir:
+        store = JobStore(os.path.join(bot_dir, 'jobs.db'))
+        # Больше CHUNK_SIZE - файл передается несколькими блоками
+        input_bytes = os.urandom(3 * 1024 * 1024 + 17)
+        job_id = _enqueue_job(store, bot_dir, 2, input_bytes)
+
+        server = JobBrokerServer(store, '127.0.0.1:0', 'secret')
+        server.start()
+        try:
+            broker = SocketBroker(server.address, 'secret', shared_storage=False, work_root=worker_dir)
+            job = broker.claim('remote-1', lease_seconds=60)
+            assert job['job_id'] == job_id and job['attempts'] == 1
+            assert broker.heartbeat(job_id, 'remote-1', 60)
+
+            with broker.job_files(job, 'remote-1') as (input_path, output_paths, work_dir):
+                assert input_path.startswith(worker_dir) and os.path.isdir(work_dir)
+                with open(input_path, 'rb') as f:
+                    assert f.read() == input_bytes
+                for i, output_path in enumerate(output_paths):
+                    with open(output_path, 'wb') as f:
+                        f.write(input_bytes[::i + 1])
+                    broker.push_output(job, 'remote-1', i, output_path)
+                    assert not os.path.exists(output_path), "Сданная копия удаляется у воркера"
+            assert not os.path.exists(os.path.join(worker_dir, f'job-{job_id}'))
+
+            assert broker.complete(job_id, 'remote-1')
+            done = store.get(job_id)
+            assert done['status'] == JOB_DONE and done['ready_copies'] == [0, 1]
+            for i, output_path in enumerate(done['payload']['output_paths']):
+                with open(output_path, 'rb') as f:
+                    assert f.read() == input_bytes[::i + 1]
+        finally:
+            server.stop()
+
+    print("✅ Задача и файлы проходят через брокер между серверами")
+    return True
+
+
+def test_broker_rejects_foreign_requests():
+    """Без токена или аренды задачи брокер не отдает и не принимает файлы"""
+    with tempfile.TemporaryDirectory() as bot_dir, tempfile.TemporaryDirectory() as worker_dir:
+        store = JobStore(os.path.join(bot_dir, 'jobs.db'))
+        job_id = _enqueue_job(store, bot_dir, 1, b'video')
+
+        server = JobBrokerServer(store, '127.0.0.1:0', 'secret')
+        server.start()
+        try:
+            intruder = SocketBroker(server.address, 'wrong', shared_storage=False, work_root=worker_dir)
+            try:
+                intruder.claim('remote-x', lease_seconds=60)
+                raise AssertionError("Запрос с неверным токеном должен быть отклонен")
+            except BrokerError:
+                pass
+
+            broker = SocketBroker(server.address, 'secret', shared_storage=False, work_root=worker_dir)
+            job = broker.claim('remote-1', lease_seconds=60)
+            try:
+                with broker.job_files(job, 'remote-2'):
+                    pass
+                raise AssertionError("Вход задачи отдается только воркеру с арендой")
+            except BrokerError:
+                pass
+            for foreign_call in (lambda: broker.get(job_id, 'remote-2'),
+                                 lambda: broker.mark_copy_ready(job_id, 'remote-2', 0)):
+                try:
+                    foreign_call()
+                    raise AssertionError("Задача и отметки копий доступны только воркеру с арендой")
+                except BrokerError:
+                    pass
+            assert store.get(job_id)['ready_copies'] == []
+            assert broker.get(job_id, 'remote-1')['worker'] == 'remote-1'
+        finally:
+            server.stop()
+
+        # Локальный брокер: общие пути, копия только отмечается готовой
+        local = LocalBroker(store)
+        job = local.claim('local-1', lease_seconds=60)
+        assert job is None, "Задача уже в работе у remote-1"
+        store.release(job_id, 'remote-1')
+        job = local.claim('local-1', lease_seconds=60)
+        with local.job_files(job, 'local-1') as (input_path, output_paths, work_dir):
+            assert input_path == job['payload']['input_path']
+            local.push_output(job, 'local-1', 0, output_paths[0])
+        assert store.get(job_id)['ready_copies'] == [0]
+
+    print("✅ Брокер отклоняет чужие запросы")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_remote_worker_round_trip() and test_broker_rejects_foreign_requests()
+    sys.exit(0 if success else 1)
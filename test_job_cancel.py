@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки отмены задач обработки
+"""
+
+import sys
+import os
+import time
+import threading
+import subprocess
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_cancel import CancelScope, JobCancelled, check_cancelled, popen_tracked, untrack_process
+
+
+def test_cancel_kills_tracked_process():
+    """Установленное событие отмены завершает процесс задачи и прерывает кадровый цикл"""
+    cancel_event = threading.Event()
+    cancelled = False
+
+    with CancelScope(cancel_event):
+        proc = popen_tracked(['sleep', '30'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        started = time.monotonic()
+        threading.Timer(0.1, cancel_event.set).start()
+        proc.wait(timeout=5)
+        untrack_process(proc)
+        assert time.monotonic() - started < 5, "Процесс должен быть остановлен сразу после отмены"
+
+        try:
+            check_cancelled()
+        except JobCancelled:
+            cancelled = True
+
+    assert cancelled, "check_cancelled() должен выбросить JobCancelled"
+    # Вне области отмены проверка ничего не делает
+    check_cancelled()
+
+    print("✅ Отмена завершает процессы задачи")
+    return True
+
+
+def test_no_cancel_keeps_process():
+    """Без отмены процессы задачи работают до конца"""
+    with CancelScope(threading.Event()):
+        proc = popen_tracked(['sleep', '0.3'])
+        assert proc.wait(timeout=5) == 0
+        untrack_process(proc)
+        check_cancelled()
+
+    print("✅ Без отмены задача выполняется полностью")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_cancel_kills_tracked_process() and test_no_cancel_keeps_process()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки отчетов о прогрессе обработки копий
+"""
+
+import sys
+import os
+import queue
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_progress import JobProgress, ProgressReporter
+
+
+def test_reporter_updates_job_progress():
+    """Отчеты воркера доходят до прогресса задачи с процентами по копиям"""
+    progress_queue = queue.Queue()
+    reporter = ProgressReporter(progress_queue, 'job-1', copies=2, total_frames=100)
+    progress = JobProgress(2)
+
+    reporter(50)
+    reporter(80, [1])  # Прореживается: слишком скоро после предыдущего отчета
+    reporter.finish()
+
+    messages = []
+    while not progress_queue.empty():
+        messages.append(progress_queue.get_nowait())
+    assert len(messages) == 2, f"Ожидалось 2 отчета, получено {len(messages)}"
+    assert messages[0] == ('job-1', [50, 50], 100, [])
+
+    job_id, frames, total_frames, ready = messages[0]
+    progress.update(frames, total_frames, ready)
+    assert progress.started and progress.percent == 50 and progress.copy_percent(1) == 50
+    assert progress.eta_seconds() is not None
+
+    progress.update(*messages[1][1:])
+    assert progress.percent == 100 and progress.completed_copies == 2
+
+    print("✅ Прогресс по кадрам передается корректно")
+    return True
+
+
+def test_ready_copies_reported_once():
+    """Готовая копия сообщается сразу и один раз, в порядке готовности"""
+    progress_queue = queue.Queue()
+    reporter = ProgressReporter(progress_queue, 'job-2', copies=3, total_frames=100)
+    ready_copies = []
+    progress = JobProgress(3, on_copy_ready=ready_copies.append)
+
+    reporter.copy_ready(2)
+    reporter.copy_ready(0)
+    reporter.copy_ready(2)
+    while not progress_queue.empty():
+        progress.update(*progress_queue.get_nowait()[1:])
+
+    assert ready_copies == [2, 0], f"Неожиданный порядок готовых копий: {ready_copies}"
+    assert progress.copy_percent(2) == 100 and progress.copy_percent(1) == 0
+
+    print("✅ Готовые копии сообщаются по мере готовности")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_reporter_updates_job_progress() and test_ready_copies_reported_once()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки очереди задач обработки
+"""
+
+import sys
+import os
+import asyncio
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_queue import FairJobQueue, JobQueueFull, PRIORITY_ADMIN, PRIORITY_NORMAL, PRIORITY_SMALL, job_priority
+
+
+async def _run_jobs(queue: FairJobQueue, jobs: list) -> list:
+    """Запускает задачи (user_id, priority) по порядку и возвращает порядок их старта"""
+    started = []
+    gate = asyncio.Event()
+
+    async def job(user_id, priority, name):
+        ticket = queue.submit(user_id, priority)
+        async with queue.slot(ticket):
+            started.append(name)
+            await gate.wait()
+
+    # Первая задача занимает единственный слот, остальные встают в очередь
+    tasks = [asyncio.create_task(job(*jobs[0]))]
+    await asyncio.sleep(0)
+    tasks.extend(asyncio.create_task(job(*spec)) for spec in jobs[1:])
+    await asyncio.sleep(0)
+
+    for _ in jobs:
+        gate.set()
+        await asyncio.sleep(0.01)
+        gate.clear()
+    gate.set()
+    await asyncio.gather(*tasks)
+    return started
+
+
+def test_fair_share_between_users():
+    """Пользователи обслуживаются по кругу, приоритет важнее порядка поступления"""
+    queue = FairJobQueue(max_running=1, max_per_user=5)
+    started = asyncio.run(_run_jobs(queue, [
+        (1, PRIORITY_NORMAL, 'a1'),
+        (1, PRIORITY_NORMAL, 'a2'),
+        (1, PRIORITY_NORMAL, 'a3'),
+        (2, PRIORITY_NORMAL, 'b1'),
+        (3, PRIORITY_SMALL, 'c1'),
+        (4, PRIORITY_ADMIN, 'admin'),
+    ]))
+    assert started[0] == 'a1'
+    assert started[1:3] == ['admin', 'c1'], f"Неожиданный порядок: {started}"
+    assert started.index('b1') < started.index('a3'), f"Неожиданный порядок: {started}"
+    assert queue.stats()['running'] == 0 and queue.stats()['waiting'] == 0
+
+    print("✅ Задачи запускаются по приоритету и справедливой доле пользователей")
+    return True
+
+
+def test_user_limit_and_positions():
+    """Лишняя задача пользователя отклоняется, место в очереди сообщается, отмена снимает задачу"""
+    async def scenario():
+        queue = FairJobQueue(max_running=1, max_per_user=2)
+        running = queue.submit(1)
+        await queue.wait(running)
+        waiting = queue.submit(1)
+        try:
+            queue.submit(1)
+            raise AssertionError("Ожидалось JobQueueFull")
+        except JobQueueFull:
+            pass
+
+        other = queue.submit(2)
+        assert queue.position(other) == 1 and queue.position(waiting) == 2
+
+        positions = []
+
+        async def report(position):
+            positions.append(position)
+
+        waiter = asyncio.create_task(queue.wait(waiting, report))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await queue.release(waiting)
+        assert positions == [2]
+        assert queue.position(other) == 1 and queue.user_jobs(1) == 1
+
+        await queue.release(running)
+        await asyncio.wait_for(queue.wait(other), timeout=1)
+        assert queue.position(other) == 0
+
+    asyncio.run(scenario())
+    assert job_priority(True, 500) == PRIORITY_ADMIN
+    assert job_priority(False, 5) == PRIORITY_SMALL and job_priority(False, None) == PRIORITY_NORMAL
+
+    print("✅ Лимит задач пользователя и место в очереди работают")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_fair_share_between_users() and test_user_limit_and_positions()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки стадии отправки готовых копий
+"""
+
+import sys
+import os
+import asyncio
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_stages import UploadStage
+from job_queue import FairJobQueue
+
+
+def test_slot_released_before_uploads_finish():
+    """Слот обработки освобождается после кодирования, копии отправляются без него"""
+    async def scenario():
+        queue = FairJobQueue(max_running=1, max_per_user=5)
+        network = asyncio.Event()
+        sent = []
+        events = []
+
+        async def send_copy(path):
+            await network.wait()
+            sent.append(path)
+
+        ticket = queue.submit(1)
+        async with UploadStage(send_copy) as uploads:
+            async with queue.slot(ticket):
+                for i in range(3):
+                    await uploads.put(f'copy_{i}.mp4')
+            events.append(('encoded', queue.stats()['running'], len(sent)))
+            # Слот свободен - следующая задача начинает кодирование, пока идет отправка
+            other = queue.submit(2)
+            await asyncio.wait_for(queue.wait(other), timeout=1)
+            events.append(('next_started', uploads.pending))
+            network.set()
+        await queue.release(other)
+
+        assert events == [('encoded', 0, 0), ('next_started', 2)], events
+        assert sent == ['copy_0.mp4', 'copy_1.mp4', 'copy_2.mp4']
+        assert uploads.sent == 3
+
+    asyncio.run(scenario())
+
+    print("✅ Слот обработки не ждет отправку копий")
+    return True
+
+
+def test_upload_error_stops_processing():
+    """Ошибка отправки прерывает обработку, отмена обработки останавливает отправку"""
+    async def failing_scenario():
+        async def send_copy(path):
+            raise ConnectionError("сеть недоступна")
+
+        async with UploadStage(send_copy) as uploads:
+            await uploads.put('copy_0.mp4')
+            await asyncio.sleep(0.01)
+            await uploads.put('copy_1.mp4')
+
+    try:
+        asyncio.run(failing_scenario())
+        raise AssertionError("Ожидалась ошибка отправки")
+    except ConnectionError:
+        pass
+
+    async def cancelled_scenario():
+        started = asyncio.Event()
+        sent = []
+
+        async def send_copy(path):
+            started.set()
+            await asyncio.sleep(10)
+            sent.append(path)
+
+        async def job():
+            async with UploadStage(send_copy) as uploads:
+                await uploads.put('copy_0.mp4')
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(job())
+        await asyncio.wait_for(started.wait(), timeout=1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert task.cancelled() and sent == []
+
+    asyncio.run(cancelled_scenario())
+
+    print("✅ Ошибки и отмена проходят между стадиями")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_slot_released_before_uploads_finish() and test_upload_error_stops_processing()
+    sys.exit(0 if success else 1)
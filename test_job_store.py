@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки постоянной очереди задач сервиса воркеров
+"""
+
+import sys
+import os
+import tempfile
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_store import JobStore, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_DELIVERED
+
+
+def test_claim_order_and_lease_expiry():
+    """Задачи забираются по приоритету, задача упавшего воркера возвращается в очередь"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = JobStore(os.path.join(tmp_dir, 'jobs.db'))
+        normal = store.enqueue('video', 1, 100, {'copies': 3}, priority=2, max_attempts=2)
+        admin = store.enqueue('video', 2, 200, {'copies': 1}, priority=0, max_attempts=2)
+
+        first = store.claim('worker-a', lease_seconds=60)
+        assert first['job_id'] == admin and first['attempts'] == 1
+        second = store.claim('worker-b', lease_seconds=-1)
+        assert second['job_id'] == normal
+
+        # Аренда worker-b уже истекла: задача снова в очереди, вторая попытка - последняя
+        retried = store.claim('worker-c', lease_seconds=-1)
+        assert retried['job_id'] == normal and retried['attempts'] == 2
+        assert not store.heartbeat(normal, 'worker-b', 60), "Старый воркер не должен продлевать аренду"
+
+        assert store.claim('worker-d', lease_seconds=60) is None
+        assert store.get(normal)['status'] == JOB_FAILED, "После всех попыток задача считается неудачной"
+        assert store.get(admin)['status'] == JOB_RUNNING
+
+    print("✅ Очередь соблюдает приоритет и возвращает задачи упавших воркеров")
+    return True
+
+
+def test_resume_and_delivery():
+    """Готовые копии сохраняются между попытками и досылаются после перезапуска бота"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'jobs.db')
+        store = JobStore(db_file)
+        job_id = store.enqueue('video', 1, 100, {'copies': 3}, max_attempts=3)
+
+        job = store.claim('worker-a', lease_seconds=60)
+        store.mark_copy_ready(job_id, 1)
+        store.mark_copy_ready(job_id, 1)
+        assert store.fail(job_id, 'worker-a', "Не созданы копии: 2", job['attempts'], job['max_attempts'])
+        assert store.get(job_id)['status'] == JOB_QUEUED
+
+        # Бот перезапущен: новая копия JobStore видит готовую, но не отправленную копию
+        store = JobStore(db_file)
+        pending = store.pending_delivery()
+        assert [(p['job_id'], p['ready_copies'], p['delivered_copies']) for p in pending] == [(job_id, [1], [])]
+
+        job = store.claim('worker-b', lease_seconds=60)
+        assert job['ready_copies'] == [1], "Повтор должен делать только недостающие копии"
+
+        store.mark_copy_delivered(job_id, 1)
+        assert store.pending_delivery() == []
+
+        store.mark_copy_ready(job_id, 0)
+        store.mark_copy_ready(job_id, 2)
+        assert store.complete(job_id, 'worker-b')
+        assert store.get(job_id)['status'] == JOB_DONE
+        assert [p['job_id'] for p in store.pending_delivery()] == [job_id]
+
+        store.mark_delivered(job_id)
+        assert store.pending_delivery() == []
+        assert store.stats() == {JOB_DELIVERED: 1}
+
+        # Остановка сервиса не тратит попытку
+        other = store.enqueue('video', 2, 200, {'copies': 1}, max_attempts=1)
+        store.claim('worker-c', lease_seconds=60)
+        assert store.release(other, 'worker-c')
+        assert store.claim('worker-c', lease_seconds=60)['attempts'] == 1
+
+        store.purge(older_than=-1)
+        assert store.get(job_id) is None
+
+    print("✅ Готовые копии переживают повтор задачи и перезапуск бота")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_claim_order_and_lease_expiry() and test_resume_and_delivery()
+    sys.exit(0 if success else 1)
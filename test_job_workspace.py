@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки рабочих папок задач
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_workspace import WorkspaceManager
+from media_probe import ProbeCache
+from video_processor import VideoProcessor
+
+
+def test_workspaces_do_not_collide():
+    """Две задачи одного пользователя получают разные папки, cleanup удаляет папку целиком"""
+    with tempfile.TemporaryDirectory() as base_dir:
+        manager = WorkspaceManager(ram_dir='', disk_dir=base_dir)
+        first = manager.allocate()
+        second = manager.allocate()
+        assert first.path != second.path
+        assert first.input_path != second.input_path
+        assert first.output_path(0) != second.output_path(0)
+
+        with open(first.input_path, 'wb') as f:
+            f.write(b'video')
+        with open(os.path.join(first.work_dir, 'audio.m4a'), 'wb') as f:
+            f.write(b'audio')
+
+        first.cleanup()
+        first.cleanup()  # Повторный вызов ничего не делает
+        assert not os.path.exists(first.path)
+        assert os.path.isdir(second.path)
+        second.cleanup()
+        assert os.listdir(base_dir) == []
+
+    print("✅ Рабочие папки задач не пересекаются и удаляются целиком")
+    return True
+
+
+def test_ram_budget_falls_back_to_disk():
+    """Задачи сверх бюджета RAM получают папку на диске, освобожденный бюджет используется снова"""
+    with tempfile.TemporaryDirectory() as ram_dir, tempfile.TemporaryDirectory() as disk_dir:
+        manager = WorkspaceManager(ram_dir=ram_dir, ram_budget_mb=10, disk_dir=disk_dir)
+        in_ram = manager.allocate(8 * 1024 * 1024)
+        on_disk = manager.allocate(8 * 1024 * 1024)
+        assert in_ram.in_ram and in_ram.path.startswith(os.path.abspath(ram_dir))
+        assert not on_disk.in_ram and on_disk.path.startswith(os.path.abspath(disk_dir))
+
+        in_ram.cleanup()
+        on_disk.cleanup()
+        assert manager.ram_used == 0
+        assert manager.allocate(8 * 1024 * 1024).in_ram
+
+    print("✅ Бюджет RAM соблюдается, лишние задачи идут на диск")
+    return True
+
+
+def test_concurrent_copies_use_own_paths():
+    """Параллельные задачи одного пользователя пишут копии по разным путям"""
+    processor = VideoProcessor.__new__(VideoProcessor)
+    processor.probe_cache = ProbeCache()
+    processor.worker_pool = SimpleNamespace(shutdown=lambda: None)
+    jobs = []
+
+    async def fake_copy_job(job, timeout=None, progress=None):
+        jobs.append(job)
+        await asyncio.sleep(0.01)  # Задачи идут одновременно
+        for i, output_path in enumerate(job.output_paths):
+            with open(output_path, 'wb') as f:
+                f.write(job.job_id.encode())
+            yield i, True
+
+    processor.iter_copy_job = fake_copy_job
+
+    async def scenario(input_path, workspaces):
+        return await asyncio.gather(*(
+            processor.process_video(input_path, 1, 2, False, False, workspace=workspace) for workspace in workspaces
+        ))
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        input_path = os.path.join(base_dir, 'input.mp4')
+        with open(input_path, 'wb') as f:
+            f.write(b'video')
+        manager = WorkspaceManager(ram_dir='', disk_dir=base_dir)
+        workspaces = [manager.allocate(), manager.allocate()]
+
+        results = asyncio.run(scenario(input_path, workspaces))
+        for workspace, job, copies in zip(workspaces, jobs, results):
+            assert copies == [workspace.output_path(0), workspace.output_path(1)]
+            assert job.work_dir == workspace.work_dir
+            for path in copies:
+                with open(path, 'rb') as f:
+                    assert f.read() == job.job_id.encode()
+
+        # Без рабочей папки имена копий в OUTPUT_DIR различаются по id задачи
+        jobs.clear()
+        results = asyncio.run(scenario(input_path, [None, None]))
+        assert not set(results[0]) & set(results[1])
+        for path in results[0] + results[1]:
+            os.remove(path)
+        for workspace in workspaces:
+            workspace.cleanup()
+
+    print("✅ Копии параллельных задач пользователя не перезаписывают друг друга")
+    return True
+
+
+if __name__ == "__main__":
+    success = (
+        test_workspaces_do_not_collide()
+        and test_ram_budget_falls_back_to_disk()
+        and test_concurrent_copies_use_own_paths()
+    )
+    sys.exit(0 if success else 1)
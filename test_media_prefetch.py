@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки упреждающего скачивания файлов
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from job_workspace import WorkspaceManager
+from media_prefetch import MediaPrefetcher
+
+
+class FakeFile:
+    def __init__(self, content: bytes, delay: float):
+        self.content = content
+        self.delay = delay
+
+    async def download_to_drive(self, path):
+        await asyncio.sleep(self.delay)
+        with open(path, 'wb') as f:
+            f.write(self.content)
+
+
+class FakeBot:
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.downloads = 0
+
+    async def get_file(self, file_id):
+        self.downloads += 1
+        return FakeFile(file_id.encode(), self.delay)
+
+
+def test_take_reuses_or_awaits_download():
+    """Обработка забирает готовый файл или дожидается загрузки; чужой file_id не подходит"""
+    async def scenario(base_dir):
+        bot = FakeBot()
+        prefetcher = MediaPrefetcher(WorkspaceManager(ram_dir='', disk_dir=base_dir), enabled=True)
+
+        prefetcher.start(1, bot, 'video-a')
+        assert not prefetcher.is_ready(1, 'video-a')
+        media = await prefetcher.take(1, 'video-a')  # Загрузка еще идет - ждем ее
+        assert media is not None and open(media.path, 'rb').read() == b'video-a'
+        media.workspace.cleanup()
+
+        prefetcher.start(2, bot, 'video-b')
+        await asyncio.sleep(0.1)
+        assert prefetcher.is_ready(2, 'video-b')
+        assert await prefetcher.take(2, 'video-c') is None
+        media = await prefetcher.take(2, 'video-b')
+        assert media.file_size == len(b'video-b')
+        media.workspace.cleanup()
+        assert bot.downloads == 2
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        asyncio.run(scenario(base_dir))
+        assert os.listdir(base_dir) == []
+
+    print("✅ Файл, скачанный заранее, используется при обработке")
+    return True
+
+
+def test_discard_removes_download():
+    """Новый файл и сброс сессии отменяют загрузку и удаляют ее папку"""
+    async def scenario(base_dir):
+        bot = FakeBot(delay=0.5)
+        prefetcher = MediaPrefetcher(WorkspaceManager(ram_dir='', disk_dir=base_dir), enabled=True)
+
+        first = prefetcher.start(1, bot, 'video-a')
+        prefetcher.start(1, bot, 'video-b')  # Пользователь прислал другое видео
+        await asyncio.sleep(0)
+        assert first.cancelled()
+
+        prefetcher.discard(1)
+        await asyncio.sleep(0.05)
+        assert await prefetcher.take(1, 'video-b') is None
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        asyncio.run(scenario(base_dir))
+        assert os.listdir(base_dir) == []
+
+    print("✅ Невостребованные загрузки отменяются и удаляются")
+    return True
+
+
+def test_unclaimed_download_expires():
+    """Невостребованная загрузка удаляется по истечении TTL без новых файлов от пользователей"""
+    async def scenario(base_dir):
+        bot = FakeBot(delay=0.01)
+        prefetcher = MediaPrefetcher(WorkspaceManager(ram_dir='', disk_dir=base_dir), enabled=True, ttl=0.2)
+
+        prefetcher.start(1, bot, 'video-a')
+        await asyncio.sleep(0.1)
+        assert prefetcher.is_ready(1, 'video-a') and len(os.listdir(base_dir)) == 1
+
+        await asyncio.sleep(0.2)
+        assert not prefetcher.is_ready(1, 'video-a')
+        assert os.listdir(base_dir) == []
+
+        # Забранная загрузка по TTL не удаляется - папка принадлежит обработке
+        prefetcher.start(2, bot, 'video-b')
+        media = await prefetcher.take(2, 'video-b')
+        await asyncio.sleep(0.3)
+        assert os.path.exists(media.path)
+        media.workspace.cleanup()
+
+    with tempfile.TemporaryDirectory() as base_dir:
+        asyncio.run(scenario(base_dir))
+
+    print("✅ Невостребованные загрузки удаляются по TTL")
+    return True
+
+
+def test_ensure_capacity_moves_to_disk():
+    """Если под выбранное число копий не хватает бюджета RAM, файл переносится на диск"""
+    with tempfile.TemporaryDirectory() as ram_dir, tempfile.TemporaryDirectory() as disk_dir:
+        manager = WorkspaceManager(ram_dir=ram_dir, ram_budget_mb=10, disk_dir=disk_dir)
+        workspace = manager.allocate(3 * 1024 * 1024)
+        with open(workspace.input_path, 'wb') as f:
+            f.write(b'video')
+
+        assert manager.ensure_capacity(workspace, 9 * 1024 * 1024) is workspace
+        assert manager.ram_used == 9 * 1024 * 1024
+
+        moved = manager.ensure_capacity(workspace, 20 * 1024 * 1024)
+        assert not moved.in_ram and moved.path.startswith(os.path.abspath(disk_dir))
+        assert open(moved.input_path, 'rb').read() == b'video'
+        assert not os.path.exists(workspace.path) and manager.ram_used == 0
+        moved.cleanup()
+
+    print("✅ Резерв рабочей папки расширяется под задачу")
+    return True
+
+
+if __name__ == "__main__":
+    success = (
+        test_take_reuses_or_awaits_download()
+        and test_discard_removes_download()
+        and test_unclaimed_download_expires()
+        and test_ensure_capacity_moves_to_disk()
+    )
+    sys.exit(0 if success else 1)
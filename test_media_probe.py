@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки разбора метаданных видео и их кеша
+"""
+
+import sys
+import asyncio
+import os
+import tempfile
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from media_probe import ProbeCache, VideoInfo, parse_ffmpeg_info
+from database import DatabaseManager
+
+FFMPEG_OUTPUT = """Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'input.mp4':
+  Duration: 00:01:02.50, start: 0.000000, bitrate: 2150 kb/s
+  Stream #0:0[0x1](und): Video: h264 (High) (avc1 / 0x31637661), yuv420p(tv, bt709), 1920x1080, 2000 kb/s, 29.97 fps, 29.97 tbr, 90k tbn (default)
+    Side data:
+      displaymatrix: rotation of -90.00 degrees
+  Stream #0:1[0x2](und): Audio: aac (LC) (mp4a / 0x6134706D), 44100 Hz, stereo, fltp, 128 kb/s (default)
+"""
+
+
+def test_parse_ffmpeg_info():
+    """Из заголовка ffmpeg извлекаются длительность, fps, размер с учетом поворота и аудио"""
+    info = parse_ffmpeg_info(FFMPEG_OUTPUT, file_size=1000)
+
+    assert info is not None
+    assert abs(info.duration - 62.5) < 1e-6
+    assert abs(info.fps - 29.97) < 1e-6
+    assert (info.width, info.height) == (1080, 1920), "Поворот на 90 градусов должен менять стороны"
+    assert info.video_codec == 'h264' and info.audio_codec == 'aac'
+    assert info.bitrate == 2150
+
+    # Без видеопотока метаданных нет
+    assert parse_ffmpeg_info("Input #0, mp3, from 'a.mp3':\n  Stream #0:0: Audio: mp3") is None
+
+    print("✅ Метаданные разобраны корректно")
+    return True
+
+
+def test_probe_cache_persists_in_sqlite():
+    """Метаданные, сохраненные одним кешем, находятся другим через SQLite"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_manager = DatabaseManager(os.path.join(temp_dir, 'test.db'))
+        info = VideoInfo(duration=10.0, fps=30.0, width=720, height=1280, audio_codec='aac')
+
+        ProbeCache(db_manager).put('unique-1', info)
+        cached = ProbeCache(db_manager).get('unique-1')
+
+        assert cached == info
+        assert ProbeCache(db_manager).get('unique-2') is None
+
+        # probe() читает SQLite в отдельном потоке; при попадании ffmpeg не запускается
+        cache = ProbeCache(db_manager)
+        assert asyncio.run(cache.probe('missing.mp4', 'unique-1')) == info
+        assert cache.hits == 1 and cache.misses == 0
+
+    print("✅ Кеш метаданных сохраняется в SQLite")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_parse_ffmpeg_info() and test_probe_cache_persists_in_sqlite()
+    sys.exit(0 if success else 1)
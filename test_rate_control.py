@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки битрейта по целевому размеру файла
+"""
+
+import sys
+import os
+import random
+import tempfile
+import subprocess
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from rate_control import (
+    AUDIO_BITRATE_ESTIMATE_KBPS, OutputSizeGuard, OutputTooLarge, audio_bitrate_kbps, parse_bitrate_kbps,
+    plan_copy_bitrate
+)
+
+from moviepy.config import get_setting
+
+MAX_SIZE = 48 * 1024 * 1024
+
+
+def test_bitrate_fits_target_size():
+    """Длинное видео получает битрейт, при котором файл укладывается в лимит"""
+    rng = random.Random(0)
+    duration = 600
+    for _ in range(20):
+        plan = plan_copy_bitrate(2000, duration, True, MAX_SIZE, rng)
+        bitrate = parse_bitrate_kbps(plan['bitrate'])
+        expected_size = (bitrate + AUDIO_BITRATE_ESTIMATE_KBPS) * 1000 / 8 * duration
+        assert expected_size <= MAX_SIZE, f"Битрейт {plan['bitrate']} не укладывается в лимит"
+        assert parse_bitrate_kbps(plan['maxrate']) >= bitrate
+
+    print("✅ Битрейт длинного видео укладывается в лимит размера")
+    return True
+
+
+def test_short_video_keeps_ceiling_and_varies():
+    """Короткому видео лимит не мешает: битрейт не выше потолка и различается у копий"""
+    rng = random.Random(1)
+    bitrates = {plan_copy_bitrate(2000, 30, True, MAX_SIZE, rng)['bitrate'] for _ in range(6)}
+    assert all(parse_bitrate_kbps(bitrate) <= 2000 for bitrate in bitrates)
+    assert len(bitrates) > 1, "Битрейты копий должны различаться"
+
+    print("✅ Битрейт короткого видео не выше потолка и различается у копий")
+    return True
+
+
+def test_audio_bitrate_from_prepared_track():
+    """Битрейт видео считается от фактического битрейта аудиодорожки, а не от оценки"""
+    duration = 600
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        audio_path = os.path.join(tmp_dir, 'audio.m4a')
+        with open(audio_path, 'wb') as f:
+            f.write(b'\0' * (64 * 1000 // 8 * duration))  # 64 кбит/с
+        audio_kbps = audio_bitrate_kbps(audio_path, duration)
+    assert audio_kbps == 64
+    assert audio_bitrate_kbps(None, duration) == 0
+
+    for audio in (64, 320):
+        plan = plan_copy_bitrate(2000, duration, True, MAX_SIZE, random.Random(2), audio_kbps=audio)
+        expected_size = (parse_bitrate_kbps(plan['bitrate']) + audio) * 1000 / 8 * duration
+        assert expected_size <= MAX_SIZE, f"Аудио {audio}k: битрейт {plan['bitrate']} не укладывается в лимит"
+    low = plan_copy_bitrate(2000, duration, True, MAX_SIZE, random.Random(2), audio_kbps=64)
+    estimated = plan_copy_bitrate(2000, duration, True, MAX_SIZE, random.Random(2))
+    assert parse_bitrate_kbps(low['bitrate']) > parse_bitrate_kbps(estimated['bitrate'])
+
+    print("✅ Битрейт видео учитывает фактическое аудио")
+    return True
+
+
+def test_size_guard_aborts_early():
+    """Прогноз размера больше лимита прерывает кодирование"""
+    with tempfile.TemporaryDirectory() as work_dir:
+        output_path = os.path.join(work_dir, 'copy.mp4')
+        with open(output_path, 'wb') as f:
+            f.write(b'\0' * 400)
+
+        guard = OutputSizeGuard([output_path], max_size_bytes=1000, total_frames=100)
+        guard.check(10)  # Слишком рано для прогноза
+        guard.check(50)  # Прогноз 800 байт - в пределах лимита
+
+        guard._last_check = 0.0
+        with open(output_path, 'ab') as f:
+            f.write(b'\0' * 300)
+        try:
+            guard.check(50)  # Прогноз 1400 байт
+            raise AssertionError("Ожидалось OutputTooLarge")
+        except OutputTooLarge:
+            pass
+        assert guard.tripped
+
+    print("✅ Копия, которая не уложится в лимит, прерывается заранее")
+    return True
+
+
+def test_size_guard_watches_segments():
+    """При сегментном кодировании размер копии - сумма ее сегментов"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, 'copy_1.mp4')
+        segment_paths = [os.path.join(tmp_dir, f'copy0_{k:03d}.mp4') for k in range(2)]
+        for path in segment_paths:
+            with open(path, 'wb') as f:
+                f.write(b'\0' * 350)
+
+        guard = OutputSizeGuard([output_path], max_size_bytes=1000, total_frames=100)
+        guard.check(50)  # Итогового файла еще нет - проверять нечего
+
+        guard._last_check = 0.0
+        guard.watch([segment_paths])
+        try:
+            guard.check(50)  # Прогноз по сегментам 1400 байт
+            raise AssertionError("Ожидалось OutputTooLarge")
+        except OutputTooLarge:
+            pass
+
+    print("✅ Лимит размера проверяется и при сегментном кодировании")
+    return True
+
+
+def test_segmented_encoding_raises_output_too_large():
+    """OutputTooLarge из сегментного кодирования доходит до fan-out, а не превращается в неудачные копии"""
+    from video_processor import build_copy_plans, process_video_copies_segmented
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.mp4')
+        subprocess.run(
+            [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error', '-f', 'lavfi', '-i',
+             'testsrc=duration=4:size=160x120:rate=10', '-c:v', 'libx264', '-g', '10', input_path],
+            check=True
+        )
+        plans = build_copy_plans(1, 2, add_frames=True, compress=False, duration=4, has_audio=False)
+
+        def too_large(frames, copy_indices=None, total_frames=None):
+            raise OutputTooLarge()
+
+        try:
+            process_video_copies_segmented(
+                input_path, [os.path.join(tmp_dir, f'copy_{i + 1}.mp4') for i in range(2)],
+                [plan['modifications'] for plan in plans], [plan['codec_settings'] for plan in plans],
+                False, None, 2, 4, progress_callback=too_large, work_dir=tmp_dir
+            )
+            raise AssertionError("Ожидалось OutputTooLarge")
+        except OutputTooLarge:
+            pass
+
+    print("✅ Превышение лимита размера прерывает и сегментное кодирование")
+    return True
+
+
+if __name__ == "__main__":
+    success = (
+        test_bitrate_fits_target_size()
+        and test_short_video_keeps_ceiling_and_varies()
+        and test_audio_bitrate_from_prepared_track()
+        and test_size_guard_aborts_early()
+        and test_size_guard_watches_segments()
+        and test_segmented_encoding_raises_output_too_large()
+    )
+    sys.exit(0 if success else 1)
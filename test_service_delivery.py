@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки постановки задач в сервис воркеров и отправки готовых копий
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from bot import VideoBot
+from database import DatabaseManager
+from job_queue import FairJobQueue
+from job_store import JobStore, JOB_DELIVERED
+
+
+class FlakyBot:
+    """Telegram-бот, у которого первая отправка видео обрывается"""
+
+    def __init__(self):
+        self.videos = []
+        self.messages = []
+        self.failures = 1
+
+    async def send_video(self, chat_id, video, caption=None, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("сеть недоступна")
+        self.videos.append(caption)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None):
+        self.messages.append(text)
+
+    async def send_message(self, chat_id, text):
+        self.messages.append(text)
+
+
+class FakeMessage:
+    message_id = 10
+
+    def __init__(self):
+        self.texts = []
+
+    async def edit_text(self, text):
+        self.texts.append(text)
+
+
+def test_service_job_limit_per_user():
+    """В режиме сервиса у пользователя не больше JOB_QUEUE_MAX_PER_USER задач в очереди и в работе"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = JobStore(os.path.join(tmp_dir, 'jobs.db'))
+        first = store.enqueue('video', 1, 100, {}, max_active=2)
+        store.enqueue('video', 1, 100, {}, max_active=2)
+        assert store.enqueue('video', 1, 100, {}, max_active=2) is None
+        assert store.enqueue('video', 2, 200, {}, max_active=2) is not None, "Лимит считается по пользователю"
+        assert store.active_jobs(1) == 2
+
+        video_bot = VideoBot.__new__(VideoBot)
+        video_bot.job_store = store
+        video_bot.job_queue = FairJobQueue(max_per_user=2)
+        input_path = os.path.join(tmp_dir, 'input.mp4')
+        with open(input_path, 'wb') as f:
+            f.write(b'video')
+        message = FakeMessage()
+
+        job_id = asyncio.run(video_bot._enqueue_service_job(
+            1, {'copies': 2}, input_path, 'unique', 1.0, message, 100
+        ))
+        assert job_id is None and store.active_jobs(1) == 2
+        assert "У вас уже 2 задач в обработке" in message.texts[0]
+        assert os.path.exists(input_path), "Отклоненная задача не забирает входной файл"
+
+        # Задача завершилась - место освобождается
+        store.claim('worker-a', lease_seconds=60)
+        store.complete(first, 'worker-a')
+        assert store.active_jobs(1) == 1
+        assert store.enqueue('video', 1, 100, {}, max_active=2) is not None
+
+    print("✅ Лимит задач пользователя действует и в режиме сервиса")
+    return True
+
+
+def test_failed_send_is_retried():
+    """Копия, которую не удалось отправить, остается на диске и уходит при следующей проверке"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = JobStore(os.path.join(tmp_dir, 'jobs.db'))
+        job_dir = os.path.join(tmp_dir, 'job-1')
+        os.makedirs(job_dir)
+        output_paths = [os.path.join(job_dir, f'copy_{i + 1}.mp4') for i in range(3)]
+        for path in output_paths[:2]:
+            with open(path, 'wb') as f:
+                f.write(b'video')
+        job_id = store.enqueue('video', 1, 100, {
+            'output_paths': output_paths, 'job_dir': job_dir,
+            'add_frames': False, 'compress': False, 'change_resolution': False
+        })
+        job = store.claim('worker-a', lease_seconds=60)
+        # Копия 2 отмечена готовой, но ее файла нет
+        for copy_index in range(3):
+            store.mark_copy_ready(job_id, copy_index)
+        store.complete(job_id, 'worker-a')
+
+        video_bot = VideoBot.__new__(VideoBot)
+        video_bot.job_store = store
+        video_bot.db_manager = DatabaseManager(os.path.join(tmp_dir, 'stats.db'))
+        video_bot.upload_semaphore = asyncio.Semaphore(1)
+        bot = FlakyBot()
+
+        async def deliver():
+            await video_bot._deliver_service_job(bot, store.get(job_id))
+
+        asyncio.run(deliver())
+        assert os.path.exists(output_paths[0]), "Неотправленная копия не должна удаляться"
+        assert store.get(job_id)['delivered_copies'] == []
+
+        asyncio.run(deliver())
+        assert bot.videos == ["🎬 Уникальная копия #1/3", "🎬 Уникальная копия #2/3"]
+        job = store.get(job_id)
+        assert job['delivered_copies'] == [0, 1], "Потерянная копия не считается отправленной"
+        assert job['status'] == JOB_DELIVERED
+        assert "Отправлено 2 уникальных копий" in bot.messages[0] and "Не удалось отправить копий: 1" in bot.messages[0]
+        assert not os.path.exists(job_dir)
+
+    print("✅ Копии сервиса не теряются при ошибке отправки")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_service_job_limit_per_user() and test_failed_send_is_retried()
+    sys.exit(0 if success else 1)
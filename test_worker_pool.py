@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Тест для проверки восстановления пула воркеров после падения процесса
+"""
+
+import sys
+import os
+import asyncio
+import operator
+import tempfile
+import threading
+import subprocess
+from concurrent.futures.process import BrokenProcessPool
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from moviepy.config import get_setting
+
+import job_cancel
+import video_processor
+from media_probe import probe_video
+from worker_pool import VideoWorkerPool, VideoCopyJob, run_video_copy_job
+
+
+def test_restart_keeps_job_channels():
+    """После падения воркера задачи пользуются прежними событием отмены и очередью прогресса"""
+    pool = VideoWorkerPool(max_workers=1, max_tasks_per_child=10)
+
+    async def scenario():
+        await pool.run(os.getpid)
+        # Задача, которая ждала слот, пока воркер падал
+        cancel_event = pool._manager.Event()
+        progress_queue = pool._progress_queue
+
+        try:
+            await pool.run(os._exit, 1)
+            raise AssertionError("Ожидалось BrokenProcessPool")
+        except BrokenProcessPool:
+            pass
+
+        assert await pool.run(operator.methodcaller('is_set'), cancel_event) is False
+        cancel_event.set()
+        assert await pool.run(operator.methodcaller('is_set'), cancel_event) is True
+        assert pool._progress_queue is progress_queue
+        await pool.run(operator.methodcaller('put', ('job', 1, 10, None)), progress_queue)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+
+    print("✅ Пул пересоздается без потери отмены и прогресса задач")
+    return True
+
+
+class CancelAfterFirstCopy:
+    """Очередь прогресса: как только копия готова, задача отменяется (как по таймауту)"""
+
+    def __init__(self, cancel_event: threading.Event):
+        self.cancel_event = cancel_event
+
+    def put_nowait(self, report):
+        job_id, frames, total_frames, ready = report
+        if ready and not self.cancel_event.is_set():
+            self.cancel_event.set()
+            # Ждем, пока поток-наблюдатель отметит отмену в области задачи
+            for _ in range(50):
+                if job_cancel._current_scope is not None and job_cancel._current_scope.cancelled:
+                    break
+                threading.Event().wait(0.1)
+
+
+def test_cancel_keeps_ready_copies():
+    """Отмена после готовности первой копии удаляет только незавершенные копии"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.mp4')
+        subprocess.run(
+            [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error', '-f', 'lavfi', '-i',
+             'testsrc=duration=4:size=160x120:rate=10', '-c:v', 'libx264', '-g', '10', input_path],
+            check=True
+        )
+        cancel_event = threading.Event()
+        job = VideoCopyJob(
+            input_path=input_path,
+            output_paths=[os.path.join(tmp_dir, f'copy_{i + 1}.mp4') for i in range(2)],
+            add_frames=True,
+            video_info=probe_video(input_path).to_dict(),
+            segments=2,
+            work_dir=tmp_dir,
+            progress_queue=CancelAfterFirstCopy(cancel_event),
+            cancel_event=cancel_event
+        )
+
+        # Сегменты кодирует только бэкенд ffmpeg
+        backend = video_processor.VIDEO_BACKEND
+        video_processor.VIDEO_BACKEND = 'ffmpeg'
+        try:
+            results = run_video_copy_job(job)
+        finally:
+            video_processor.VIDEO_BACKEND = backend
+        assert results == [True, False], results
+        assert os.path.exists(job.output_paths[0]), "Готовая копия не должна удаляться при отмене"
+        assert not os.path.exists(job.output_paths[1])
+
+    print("✅ Отмена не удаляет уже готовые копии")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_restart_keeps_job_channels() and test_cancel_keeps_ready_copies()
+    sys.exit(0 if success else 1)
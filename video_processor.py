@@ -3,12 +3,31 @@ import random
 import asyncio
 import logging
 import time
+import re
+import subprocess
+import shutil
+import tempfile
 import concurrent.futures
+from contextlib import aclosing
 from multiprocessing import Process, Queue, Manager
-from moviepy.editor import VideoFileClip, CompositeVideoClip
+from moviepy.editor import VideoFileClip, VideoClip
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from moviepy.config import get_setting
 from PIL import Image, ImageDraw
 import numpy as np
-from config import OUTPUT_DIR, TEMP_DIR
+from config import OUTPUT_DIR, TEMP_DIR, VIDEO_BACKEND, VIDEO_REMUX_FAST_PATH, VIDEO_RATE_CONTROL, VIDEO_TARGET_SIZE_MB
+from worker_pool import VideoWorkerPool, VideoCopyJob
+from job_progress import JobProgress
+from frame_kernels import FrameKernel
+from encoding_profiles import get_encoding_profile
+from copy_seeds import copy_rng, new_job_seed
+from media_probe import ProbeCache, estimate_processing_timeout, probe_video
+from job_workspace import JobWorkspace
+from job_cancel import check_cancelled, kill_process, popen_tracked, track_process, untrack_process
+from rate_control import (
+    OutputSizeGuard, OutputTooLarge, audio_bitrate_kbps, drop_oversized_outputs, parse_bitrate_kbps, plan_copy_bitrate,
+    rate_control_args
+)
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -38,7 +57,7 @@ except ImportError:
     logger.warning("OpenCV недоступен, используем альтернативные методы обработки")
 
 class VideoProcessor:
-    def __init__(self):
+    def __init__(self, db_manager=None):
         self.frame_colors = [
             (255, 0, 0),    # Красный
             (0, 255, 0),    # Зеленый
@@ -47,10 +66,14 @@ class VideoProcessor:
             (255, 0, 255),  # Пурпурный
             (0, 255, 255),  # Голубой
         ]
-        # Убираем ProcessPoolExecutor чтобы избежать проблем с pickle
+        # Пул процессов для копий; задачи передаются в него сериализуемыми планами
+        self.worker_pool = VideoWorkerPool()
+        # Метаданные видео по file_unique_id (память + SQLite, если передан db_manager)
+        self.probe_cache = ProbeCache(db_manager)
 
-    async def process_video(self, input_path: str, user_id: int, copies: int, add_frames: bool, compress: bool):
-        """Основная функция обработки видео"""
+    async def process_video(self, input_path: str, user_id: int, copies: int, add_frames: bool, compress: bool,
+                            file_unique_id: str = None, profile: str = None, workspace: JobWorkspace = None):
+        """Основная функция обработки видео; workspace - рабочая папка задачи (см. iter_video_copies)"""
         logger.info(f"=== НАЧАЛО ОБРАБОТКИ ВИДЕО ===")
         logger.info(f"Пользователь: {user_id}")
         logger.info(f"Входной файл: {input_path}")
@@ -61,59 +84,9 @@ class VideoProcessor:
         processed_videos = []
         
         try:
-            # Проверяем существование входного файла
-            if not os.path.exists(input_path):
-                logger.error(f"Входной файл не найден: {input_path}")
-                raise FileNotFoundError(f"Файл {input_path} не найден")
-            
-            logger.info(f"Входной файл найден: {input_path}")
-            file_size = os.path.getsize(input_path) / (1024 * 1024)  # MB
-            logger.info(f"Размер файла: {file_size:.2f} MB")
-            
-            for i in range(copies):
-                logger.info(f"--- Обработка копии {i+1}/{copies} ---")
-                output_path = f"{OUTPUT_DIR}/processed_{user_id}_{i+1}.mp4"
-                
-                # Увеличиваем таймаут для больших файлов
-                timeout_seconds = max(300, int(file_size * 30))  # Минимум 5 минут, +30 сек на MB
-                logger.info(f"Установлен таймаут: {timeout_seconds} секунд")
-                
-                try:
-                    # Проверяем что входной файл существует перед передачей в процесс
-                    if not os.path.exists(input_path):
-                        raise FileNotFoundError(f"Файл {input_path} не найден")
-                    
-                    # Получаем абсолютные пути для передачи в процесс
-                    abs_input_path = os.path.abspath(input_path)
-                    abs_output_path = os.path.abspath(output_path)
-                    
-                    # Создаем директорию для выходного файла если не существует
-                    os.makedirs(os.path.dirname(abs_output_path), exist_ok=True)
-                    
-                    # Используем ThreadPoolExecutor для избежания проблем с pickle
-                    loop = asyncio.get_event_loop()
-                    await asyncio.wait_for(
-                        loop.run_in_executor(
-                            None,  # Используем стандартный ThreadPoolExecutor
-                            process_video_copy_new,
-                            abs_input_path, abs_output_path, i, add_frames, compress, False, user_id
-                        ),
-                        timeout=timeout_seconds
-                    )
-                    
-                    if os.path.exists(output_path):
-                        output_size = os.path.getsize(output_path) / (1024 * 1024)
-                        logger.info(f"Копия {i+1} создана успешно. Размер: {output_size:.2f} MB")
-                        processed_videos.append(output_path)
-                    else:
-                        logger.error(f"Файл копии {i+1} не был создан")
-                        
-                except asyncio.TimeoutError:
-                    logger.error(f"Таймаут при создании копии {i+1} (превышено {timeout_seconds} секунд)")
-                    raise Exception(f"Превышено время ожидания при обработке копии {i+1}")
-                except Exception as e:
-                    logger.error(f"Ошибка при создании копии {i+1}: {str(e)}")
-                    raise
+            async for output_path in self.iter_video_copies(
+                    input_path, user_id, copies, add_frames, compress, file_unique_id, profile, workspace):
+                processed_videos.append(output_path)
             
             logger.info(f"=== ОБРАБОТКА ЗАВЕРШЕНА ===")
             logger.info(f"Создано копий: {len(processed_videos)}")
@@ -131,215 +104,646 @@ class VideoProcessor:
                         pass
             raise
 
+    async def iter_video_copies(self, input_path: str, user_id: int, copies: int, add_frames: bool, compress: bool,
+                                file_unique_id: str = None, profile: str = None, workspace: JobWorkspace = None):
+        """Создает копии видео и отдает пути к ним по мере готовности.
+        
+        Асинхронный итератор: первая готовая копия отдается, пока остальные
+        еще кодируются, поэтому ее можно сразу отправлять. Неудачные копии
+        пропускаются. Копии и промежуточные файлы пишутся в рабочую папку
+        задачи workspace; без нее - в OUTPUT_DIR под именами с id задачи,
+        чтобы параллельные задачи одного пользователя не пересекались.
+        """
+        # Проверяем существование входного файла
+        if not os.path.exists(input_path):
+            logger.error(f"Входной файл не найден: {input_path}")
+            raise FileNotFoundError(f"Файл {input_path} не найден")
+        
+        logger.info(f"Входной файл найден: {input_path}")
+        file_size = os.path.getsize(input_path) / (1024 * 1024)  # MB
+        logger.info(f"Размер файла: {file_size:.2f} MB")
+        
+        video_info = await self.probe_cache.probe(input_path, file_unique_id)
+        
+        # Все копии создаются за одно декодирование, поэтому таймаут растет с числом копий
+        timeout_seconds = estimate_processing_timeout(video_info, copies, file_size)
+        logger.info(f"Установлен таймаут: {timeout_seconds} секунд")
+        
+        job = VideoCopyJob(
+            input_path=os.path.abspath(input_path),
+            add_frames=add_frames,
+            compress=compress,
+            change_resolution=False,
+            user_id=user_id,
+            video_info=video_info.to_dict() if video_info else None,
+            work_dir=workspace.work_dir if workspace else None,
+            profile=profile
+        )
+        if workspace is not None:
+            output_paths = [workspace.output_path(i) for i in range(copies)]
+        else:
+            output_paths = [
+                os.path.abspath(f"{OUTPUT_DIR}/processed_{user_id}_{job.job_id}_{i+1}.mp4")
+                for i in range(copies)
+            ]
+        job.output_paths = output_paths
+        
+        try:
+            async with aclosing(self.iter_copy_job(job, timeout=timeout_seconds)) as ready_copies:
+                async for i, result in ready_copies:
+                    output_path = output_paths[i]
+                    if result and os.path.exists(output_path):
+                        output_size = os.path.getsize(output_path) / (1024 * 1024)
+                        logger.info(f"Копия {i+1} создана успешно. Размер: {output_size:.2f} MB")
+                        yield output_path
+                    else:
+                        logger.error(f"Файл копии {i+1} не был создан")
+        except asyncio.TimeoutError:
+            logger.error(f"Таймаут при создании копий (превышено {timeout_seconds} секунд)")
+            raise Exception("Превышено время ожидания при обработке копий")
+
+    def iter_copy_job(self, job: VideoCopyJob, timeout: float = None, progress: JobProgress = None):
+        """Выполняет готовый план копий в пуле воркеров; пары (copy_index, успех) в порядке готовности"""
+        return self.worker_pool.iter_video_copy_job(job, timeout=timeout, progress=progress)
+
     def __del__(self):
         """Деструктор класса"""
-        pass  # Больше нет process_executor для закрытия
+        self.worker_pool.shutdown()
 
 
-# Глобальная функция для обработки видео в отдельном процессе
-def apply_unique_modifications(video, copy_index: int, add_frames: bool, enable_brightness_change: bool = True):
-    """Применяет уникальные модификации к видео"""
-    # Расширенная палитра цветов для рамок
-    frame_colors = [
-        (255, 0, 0),      # Красный
-        (0, 255, 0),      # Зеленый  
-        (0, 0, 255),      # Синий
-        (255, 255, 0),    # Желтый
-        (255, 0, 255),    # Пурпурный
-        (0, 255, 255),    # Голубой
-        (255, 128, 0),    # Оранжевый
-        (128, 0, 255),    # Фиолетовый
-        (255, 192, 203),  # Розовый
-        (0, 128, 0),      # Темно-зеленый
-        (128, 128, 0),    # Оливковый
-        (0, 128, 128),    # Темно-голубой
-        (128, 0, 0),      # Темно-красный
-        (0, 0, 128),      # Темно-синий
-        (255, 165, 0),    # Оранжево-красный
-        (75, 0, 130),     # Индиго
-        (238, 130, 238),  # Фиолетово-розовый
-        (255, 20, 147),   # Темно-розовый
-        (0, 191, 255),    # Ярко-голубой
-        (50, 205, 50),    # Лайм-зеленый
-        (255, 69, 0),     # Красно-оранжевый
-        (138, 43, 226),   # Сине-фиолетовый
-        (255, 215, 0),    # Золотой
-        (220, 20, 60),    # Малиновый
-        (32, 178, 170),   # Светло-морской
-        (255, 105, 180),  # Ярко-розовый
-        (124, 252, 0),    # Лайм
-        (255, 99, 71),    # Томатный
-        (72, 61, 139),    # Темно-синий сланец
-        (255, 140, 0)     # Темно-оранжевый
-    ]
+# Расширенная палитра цветов для рамок
+FRAME_COLORS = [
+    (255, 0, 0),      # Красный
+    (0, 255, 0),      # Зеленый  
+    (0, 0, 255),      # Синий
+    (255, 255, 0),    # Желтый
+    (255, 0, 255),    # Пурпурный
+    (0, 255, 255),    # Голубой
+    (255, 128, 0),    # Оранжевый
+    (128, 0, 255),    # Фиолетовый
+    (255, 192, 203),  # Розовый
+    (0, 128, 0),      # Темно-зеленый
+    (128, 128, 0),    # Оливковый
+    (0, 128, 128),    # Темно-голубой
+    (128, 0, 0),      # Темно-красный
+    (0, 0, 128),      # Темно-синий
+    (255, 165, 0),    # Оранжево-красный
+    (75, 0, 130),     # Индиго
+    (238, 130, 238),  # Фиолетово-розовый
+    (255, 20, 147),   # Темно-розовый
+    (0, 191, 255),    # Ярко-голубой
+    (50, 205, 50),    # Лайм-зеленый
+    (255, 69, 0),     # Красно-оранжевый
+    (138, 43, 226),   # Сине-фиолетовый
+    (255, 215, 0),    # Золотой
+    (220, 20, 60),    # Малиновый
+    (32, 178, 170),   # Светло-морской
+    (255, 105, 180),  # Ярко-розовый
+    (124, 252, 0),    # Лайм
+    (255, 99, 71),    # Томатный
+    (72, 61, 139),    # Темно-синий сланец
+    (255, 140, 0)     # Темно-оранжевый
+]
+
+
+def get_frame_thicknesses(thickness: int, frame_style: str):
+    """Возвращает толщину рамки (верх/низ, бока) для выбранного стиля"""
+    if frame_style == 'top_bottom_thick':
+        # Верх и низ толще боков (как в кино)
+        return thickness, max(3, thickness // 3)
+    elif frame_style == 'sides_thick':
+        # Бока толще верха/низа (вертикальная ориентация)
+        return max(3, thickness // 3), thickness
+    # uniform - все стороны одинаковые
+    return thickness, thickness
+
+
+def generate_modification_params(copy_index: int, add_frames: bool, enable_brightness_change: bool = True,
+                                 rng: random.Random = None) -> dict:
+    """Генерирует параметры уникальных модификаций одной копии.
+    
+    Один и тот же набор параметров применяется как через moviepy,
+    так и через фильтры ffmpeg. rng - генератор копии (copy_seeds.copy_rng);
+    глобальный random не используется, поэтому параллельные копии не влияют друг на друга.
+    """
+    if rng is None:
+        rng = random.Random()
+    
+    params = {
+        'copy_index': copy_index,
+        # Очень небольшое изменение яркости (0.98-1.03)
+        'brightness_factor': 0.98 + (copy_index * 0.01) if enable_brightness_change else None,
+        'frame': None,
+        'shift': (0, 0),
+    }
     
     if add_frames:
-        # Генерируем случайные параметры для уникальности
-        import time
-        import hashlib
-        
-        # Создаем уникальный seed на основе времени и copy_index
-        current_time = int(time.time() * 1000000)  # Микросекунды для большей уникальности
-        seed_string = f"{current_time}_{copy_index}_{random.randint(1, 999999)}"
-        seed_hash = int(hashlib.md5(seed_string.encode()).hexdigest()[:8], 16)
-        
-        # Используем seed для генерации случайных параметров
-        random.seed(seed_hash)
-        
         # Случайный выбор цвета из расширенной палитры
-        color = random.choice(frame_colors)
+        color = rng.choice(FRAME_COLORS)
         
         # Случайная толщина рамки от 3 до 80 пикселей
-        frame_thickness = random.randint(3, 80)
+        frame_thickness = rng.randint(3, 80)
         
         # Случайные пропорции для разных сторон рамки
         # Варианты: 1) Верх/низ толще, 2) Бока толще, 3) Все одинаково
-        frame_style = random.choice(['top_bottom_thick', 'sides_thick', 'uniform'])
-        
-        logger.info(f"Копия {copy_index + 1}: цвет {color}, толщина {frame_thickness}px, стиль {frame_style}")
-        
-        # Сначала применяем незаметное изменение яркости (если включено)
-        if enable_brightness_change:
-            brightness_factor = 0.98 + (copy_index * 0.01)  # Очень небольшое изменение яркости (0.98-1.03)
-            
-            def adjust_brightness(image):
-                """Изменяет яркость изображения"""
-                adjusted = image * brightness_factor
-                return np.clip(adjusted, 0, 255).astype('uint8')
-            
-            # Применяем изменение яркости к видео
-            try:
-                brightened_video = video.fl_image(adjust_brightness)
-                logger.info(f"Копия {copy_index + 1}: применено незаметное изменение яркости ({brightness_factor:.2f})")
-            except Exception as e:
-                logger.warning(f"Ошибка при изменении яркости: {e}, используем оригинальное видео")
-                brightened_video = video
-        else:
-            brightened_video = video
+        frame_style = rng.choice(['top_bottom_thick', 'sides_thick', 'uniform'])
         
-        # Создаем цветную рамку с выбранным стилем
-        frame_clip = add_frame_to_video(brightened_video, color, frame_thickness, frame_style)
+        top_bottom_thickness, left_right_thickness = get_frame_thicknesses(frame_thickness, frame_style)
+        params['frame'] = {
+            'color': color,
+            'thickness': frame_thickness,
+            'style': frame_style,
+            'top_bottom': top_bottom_thickness,
+            'left_right': left_right_thickness,
+        }
         
-        # Добавляем случайный сдвиг видео на 1-3 пикселя для дополнительной уникальности
-        shift_x = random.randint(-3, 3)  # Случайный сдвиг по X от -3 до +3 пикселей
-        shift_y = random.randint(-3, 3)  # Случайный сдвиг по Y от -3 до +3 пикселей
-        
-        if shift_x != 0 or shift_y != 0:
-            # Применяем сдвиг к видео с рамкой
-            shifted_clip = frame_clip.set_position(lambda t: (shift_x, shift_y))
-            logger.info(f"Копия {copy_index + 1}: применен сдвиг видео ({shift_x}, {shift_y}) пикселей")
-            return shifted_clip
-        else:
-            logger.info(f"Копия {copy_index + 1}: сдвиг не применен (0, 0)")
-            return frame_clip
-    else:
-        # Добавляем незаметное изменение яркости для уникальности (если включено)
-        if enable_brightness_change:
-            # Используем очень небольшое изменение, чтобы было незаметно глазу
-            brightness_factor = 0.98 + (copy_index * 0.01)  # Очень небольшое изменение яркости (0.98-1.03)
-            
-            # Применяем изменение яркости через изменение пикселей каждого кадра
-            def adjust_brightness(image):
-                """Изменяет яркость изображения"""
-                # Умножаем значения пикселей на коэффициент яркости
-                adjusted = image * brightness_factor
-                # Ограничиваем значения в диапазоне 0-255
-                return np.clip(adjusted, 0, 255).astype('uint8')
-            
-            # Применяем функцию к каждому кадру видео
-            # Используем оптимизированную версию для ускорения
-            try:
-                modified_video = video.fl_image(adjust_brightness)
-                logger.info(f"Копия {copy_index + 1}: применено незаметное изменение яркости ({brightness_factor:.2f})")
-            except Exception as e:
-                logger.warning(f"Ошибка при изменении яркости: {e}, возвращаем оригинальное видео")
-                modified_video = video
-        else:
-            modified_video = video
-        
-        return modified_video
+        # Случайный сдвиг видео на 1-3 пикселя для дополнительной уникальности
+        params['shift'] = (rng.randint(-3, 3), rng.randint(-3, 3))
+    
+    return params
 
 
-def add_frame_to_video(video, color, thickness, frame_style='top_bottom_thick'):
-    """Добавляет цветную рамку к видео с настраиваемыми пропорциями"""
-    from moviepy.editor import ColorClip
+def apply_unique_modifications(video, copy_index: int, add_frames: bool, enable_brightness_change: bool = True,
+                               params: dict = None):
+    """Применяет уникальные модификации к видео"""
+    if params is None:
+        params = generate_modification_params(copy_index, add_frames, enable_brightness_change)
+    
+    brightness_factor = params['brightness_factor']
+    frame = params['frame']
     
-    # Получаем размеры видео
-    w, h = video.size
+    if frame:
+        logger.info(f"Копия {copy_index + 1}: цвет {frame['color']}, толщина {frame['thickness']}px, стиль {frame['style']}")
     
+    if brightness_factor is not None:
+        logger.info(f"Копия {copy_index + 1}: применено незаметное изменение яркости ({brightness_factor:.2f})")
+    
+    if not frame:
+        if brightness_factor is None:
+            return video
+        # Таблица uint8 на копию: без float-копии кадра на каждом кадре
+        return video.fl_image(FrameKernel(brightness_factor=brightness_factor))
+    
+    shift_x, shift_y = params['shift']
+    if shift_x != 0 or shift_y != 0:
+        logger.info(f"Копия {copy_index + 1}: применен сдвиг видео ({shift_x}, {shift_y}) пикселей")
+    else:
+        logger.info(f"Копия {copy_index + 1}: сдвиг не применен (0, 0)")
+    
+    # Яркость, сдвиг с черными полями и рамка записываются в кадр за один проход
+    return add_frame_to_video(video, frame['color'], frame['thickness'], frame['style'],
+                              brightness_factor=brightness_factor, shift=(shift_x, shift_y))
+
+
+def add_frame_to_video(video, color, thickness, frame_style='top_bottom_thick', brightness_factor: float = None,
+                       shift: tuple = (0, 0)):
+    """Добавляет цветную рамку к видео с настраиваемыми пропорциями.
+    
+    Рамка не накладывается отдельными слоями: полосы цвета записываются
+    прямо в кадр срезами, геометрия которых вычисляется один раз на копию.
+    """
     # Вычисляем толщину для разных сторон в зависимости от стиля
-    if frame_style == 'top_bottom_thick':
-        # Верх и низ толще боков (как в кино)
-        top_bottom_thickness = thickness
-        left_right_thickness = max(3, thickness // 3)
-    elif frame_style == 'sides_thick':
-        # Бока толще верха/низа (вертикальная ориентация)
-        left_right_thickness = thickness
-        top_bottom_thickness = max(3, thickness // 3)
-    else:  # uniform
-        # Все стороны одинаковые
-        top_bottom_thickness = thickness
-        left_right_thickness = thickness
+    top_bottom_thickness, left_right_thickness = get_frame_thicknesses(thickness, frame_style)
     
     logger.info(f"Стиль {frame_style}: верх/низ={top_bottom_thickness}px, бока={left_right_thickness}px")
     
-    # Создаем цветные полосы для рамки
-    # Верхняя полоса
-    top_frame = ColorClip(size=(w, top_bottom_thickness), color=color, duration=video.duration)
-    # Нижняя полоса
-    bottom_frame = ColorClip(size=(w, top_bottom_thickness), color=color, duration=video.duration)
-    # Левая полоса
-    left_frame = ColorClip(size=(left_right_thickness, h), color=color, duration=video.duration)
-    # Правая полоса
-    right_frame = ColorClip(size=(left_right_thickness, h), color=color, duration=video.duration)
+    kernel = FrameKernel(
+        brightness_factor=brightness_factor,
+        border_color=color,
+        top_bottom=top_bottom_thickness,
+        left_right=left_right_thickness,
+        shift=shift
+    )
+    return video.fl_image(kernel)
+
+
+def apply_resolution_change(video, change_resolution: bool):
+    """Приводит видео к разрешению 1080x1920 если это требуется"""
+    if not change_resolution:
+        return video
+    
+    # Получаем текущие размеры
+    original_width, original_height = video.size
+    
+    # Всегда меняем на 1080x1920 (вертикальное видео для Stories/Reels)
+    target_width, target_height = 1080, 1920
+    
+    # Проверяем, нужно ли изменение
+    if original_width != target_width or original_height != target_height:
+        logger.info(f"Разрешение изменено с {original_width}x{original_height} на {target_width}x{target_height}")
+        return video.resize((target_width, target_height))
+    
+    logger.info(f"Разрешение уже {target_width}x{target_height}, изменение не требуется")
+    return video
+
+
+# Лимит размера копии в режиме target_size
+MAX_OUTPUT_SIZE_BYTES = int(VIDEO_TARGET_SIZE_MB * 1024 * 1024)
+
+
+def select_codec_settings(compress: bool, duration: float = None, has_audio: bool = True,
+                          profile: str = None, rng: random.Random = None, audio_kbps: int = None) -> dict:
+    """Выбирает настройки кодека для копии.
+    
+    В режиме VIDEO_RATE_CONTROL='target_size' при известной длительности
+    выбранный битрейт становится потолком, а фактический битрейт и
+    maxrate/bufsize рассчитываются так, чтобы копия уложилась в VIDEO_TARGET_SIZE_MB.
+    profile - имя профиля кодирования из ENCODING_PROFILES (preset, tune, CRF, GOP, faststart).
+    rng - генератор копии (copy_seeds.copy_rng).
+    audio_kbps - битрейт общей аудиодорожки задачи (rate_control.audio_bitrate_kbps).
+    """
+    if rng is None:
+        rng = random.Random()
+    
+    # Настройки сжатия с шестью вариантами битрейта
+    bitrate_options = ['2000k', '1500k', '1600k', '1700k', '1800k', '1900k']
+    
+    if compress:
+        # При сжатии используем случайный битрейт из шести вариантов
+        selected_bitrate = rng.choice(bitrate_options)
+        logger.info(f"Выбран битрейт для сжатия: {selected_bitrate}")
+    else:
+        # Без сжатия используем максимальный битрейт
+        selected_bitrate = '2000k'
+    
+    codec_settings = {
+        'codec': 'libx264',
+        'bitrate': selected_bitrate,
+        'audio_codec': 'aac',
+        **get_encoding_profile(profile)
+    }
+    if VIDEO_RATE_CONTROL == 'target_size' and duration:
+        codec_settings.update(plan_copy_bitrate(
+            parse_bitrate_kbps(selected_bitrate), duration, has_audio, MAX_OUTPUT_SIZE_BYTES, rng, audio_kbps
+        ))
+    elif codec_settings['crf'] is not None:
+        # В режиме CRF выбранный битрейт ограничивает пики
+        codec_settings['maxrate'] = codec_settings['bitrate']
+        codec_settings['bufsize'] = f"{parse_bitrate_kbps(codec_settings['bitrate']) * 2}k"
+    return codec_settings
+
+
+def build_copy_plans(seed: int, copies: int, add_frames: bool, compress: bool, duration: float = None,
+                     has_audio: bool = True, profile: str = None, audio_kbps: int = None) -> list:
+    """Планы всех копий задачи, построенные заранее из seed задачи.
+    
+    План копии содержит только простые типы (сериализуется в JSON):
+    параметры модификаций кадра (цвет, толщина и стиль рамки, сдвиг, яркость)
+    и настройки кодека (битрейт, профиль). С тем же seed и теми же
+    настройками планы совпадают - задачу можно повторить, например в бенчмарке.
+    """
+    plans = []
+    for copy_index in range(copies):
+        rng = copy_rng(seed, copy_index)
+        plans.append({
+            'copy_index': copy_index,
+            'seed': seed,
+            'modifications': generate_modification_params(copy_index, add_frames, rng=rng),
+            'codec_settings': select_codec_settings(compress, duration, has_audio, profile, rng, audio_kbps),
+        })
+    return plans
+
+
+# Максимальный сдвиг кадра в пикселях (см. generate_modification_params)
+MAX_SHIFT = 3
+
+
+def build_ffmpeg_filter_chain(params: dict, change_resolution: bool) -> str:
+    """Собирает цепочку фильтров ffmpeg, эквивалентную модификациям moviepy"""
+    filters = []
+    
+    brightness_factor = params['brightness_factor']
+    if brightness_factor is not None:
+        filters.append(
+            f"colorchannelmixer=rr={brightness_factor:.4f}:gg={brightness_factor:.4f}:bb={brightness_factor:.4f}"
+        )
     
-    # Позиционируем рамки
-    top_frame = top_frame.set_position(('center', 0))
-    bottom_frame = bottom_frame.set_position(('center', h - top_bottom_thickness))
-    left_frame = left_frame.set_position((0, 'center'))
-    right_frame = right_frame.set_position((w - left_right_thickness, 'center'))
+    frame = params['frame']
+    if frame:
+        color = '0x%02X%02X%02X' % tuple(frame['color'])
+        top_bottom, left_right = frame['top_bottom'], frame['left_right']
+        filters.extend([
+            f"drawbox=x=0:y=0:w=iw:h={top_bottom}:color={color}:t=fill",
+            f"drawbox=x=0:y=ih-{top_bottom}:w=iw:h={top_bottom}:color={color}:t=fill",
+            f"drawbox=x=0:y=0:w={left_right}:h=ih:color={color}:t=fill",
+            f"drawbox=x=iw-{left_right}:y=0:w={left_right}:h=ih:color={color}:t=fill",
+        ])
+        
+        shift_x, shift_y = params['shift']
+        if shift_x != 0 or shift_y != 0:
+            # Сдвигаем кадр внутри исходного размера, освободившаяся полоса заливается черным
+            filters.append(
+                f"pad=iw+{2 * MAX_SHIFT}:ih+{2 * MAX_SHIFT}:{MAX_SHIFT}:{MAX_SHIFT}:black,"
+                f"crop=iw-{2 * MAX_SHIFT}:ih-{2 * MAX_SHIFT}:{MAX_SHIFT - shift_x}:{MAX_SHIFT - shift_y}"
+            )
     
-    # Создаем композитное видео с рамкой
-    final_video = CompositeVideoClip([video, top_frame, bottom_frame, left_frame, right_frame])
+    if change_resolution:
+        # Всегда меняем на 1080x1920 (вертикальное видео для Stories/Reels)
+        filters.append("scale=1080:1920,setsar=1")
     
-    return final_video
+    filters.append("format=yuv420p")
+    return ",".join(filters)
+
 
+def _encoder_params(codec_settings: dict) -> list:
+    """Параметры профиля кодирования, общие для ffmpeg-бэкенда и FFMPEG_VideoWriter moviepy"""
+    params = []
+    if codec_settings.get('crf') is not None:
+        params.extend(['-crf', str(codec_settings['crf'])])
+    params.extend(rate_control_args(codec_settings))
+    if codec_settings.get('tune'):
+        params.extend(['-tune', codec_settings['tune']])
+    if codec_settings.get('gop'):
+        params.extend(['-g', str(codec_settings['gop'])])
+    if codec_settings.get('faststart'):
+        params.extend(['-movflags', '+faststart'])
+    return params
 
 
+def _video_bitrate(codec_settings: dict):
+    """Битрейт для -b:v; в режиме CRF не задается"""
+    return codec_settings['bitrate'] if codec_settings.get('crf') is None else None
 
 
-    def cleanup_temp_files(self, user_id: int):
-        """Очистка временных файлов пользователя"""
+def _ffmpeg_codec_args(codec_settings: dict) -> list:
+    """Аргументы кодирования видеопотока одного выхода ffmpeg"""
+    args = ['-c:v', codec_settings['codec'], '-preset', codec_settings.get('preset', 'medium')]
+    if _video_bitrate(codec_settings):
+        args.extend(['-b:v', _video_bitrate(codec_settings)])
+    args.extend(_encoder_params(codec_settings))
+    if codec_settings.get('threads'):
+        args.extend(['-threads', str(codec_settings['threads'])])
+    return args
+
+
+def _ffmpeg_audio_args(shared_audio_path: str, audio_input_index: int = 1) -> list:
+    """Аргументы для подключения общей аудиодорожки к выходу ffmpeg"""
+    if shared_audio_path is None:
+        return ['-an']
+    return ['-map', f'{audio_input_index}:a:0', '-c:a', 'copy']
+
+
+def _run_ffmpeg(cmd: list, on_frame=None) -> bool:
+    """Запускает ffmpeg и возвращает True при успешном завершении.
+    
+    on_frame(frames) вызывается по мере кодирования с числом готовых кадров
+    (ffmpeg пишет прогресс в stdout через -progress). Процесс регистрируется
+    в области отмены задачи: при отмене он завершается, а вызов выбрасывает
+    JobCancelled.
+    """
+    if on_frame is not None:
+        cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    
+    # stderr пишется во временный файл, чтобы заполненный канал не блокировал чтение прогресса
+    with tempfile.TemporaryFile() as stderr_file:
+        proc = popen_tracked(
+            cmd, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE if on_frame is not None else subprocess.DEVNULL,
+            stderr=stderr_file
+        )
         try:
-            # Удаляем временные файлы пользователя
-            for filename in os.listdir(TEMP_DIR):
-                if str(user_id) in filename:
-                    file_path = os.path.join(TEMP_DIR, filename)
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-        except Exception as e:
-            print(f"Ошибка при очистке временных файлов: {e}")
+            if on_frame is not None:
+                for line in proc.stdout:
+                    if line.startswith(b'frame='):
+                        try:
+                            on_frame(int(line[6:].strip()))
+                        except ValueError:
+                            pass
+            returncode = proc.wait()
+        except BaseException:
+            # Обработчик прогресса прервал кодирование (например, OutputTooLarge)
+            kill_process(proc)
+            proc.wait()
+            raise
+        finally:
+            untrack_process(proc)
+        
+        check_cancelled()
+        
+        if returncode != 0:
+            stderr_file.seek(0)
+            error_text = stderr_file.read().decode('utf8', errors='replace').strip()[-500:]
+            logger.error(f"ffmpeg завершился с кодом {returncode}: {error_text}")
+            return False
+    return True
+
+
+def probe_audio_codec(input_path: str):
+    """Возвращает кодек первой аудиодорожки файла или None, если звука нет"""
+    proc = subprocess.run(
+        [get_setting("FFMPEG_BINARY"), '-hide_banner', '-i', input_path],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    match = re.search(r"Stream #\d+:\d+.*?: Audio: (\w+)", proc.stderr.decode('utf8', errors='replace'))
+    return match.group(1) if match else None
+
+
+def prepare_shared_audio(input_path: str, user_id: int = None, video_info: dict = None, work_dir: str = None):
+    """Готовит одну аудиодорожку на всю задачу.
+    
+    AAC копируется без перекодирования, остальные кодеки кодируются в AAC
+    один раз. Возвращает путь к .m4a или None, если в видео нет звука.
+    video_info - метаданные из ProbeCache; если переданы, ffmpeg повторно не запускается.
+    work_dir - рабочая папка задачи (JobWorkspace), по умолчанию TEMP_DIR.
+    """
+    if video_info is not None:
+        audio_codec = video_info.get('audio_codec')
+    else:
+        audio_codec = probe_audio_codec(input_path)
+    if audio_codec is None:
+        logger.info(f"В видео нет звука, аудио не обрабатывается: {input_path}")
+        return None
+    
+    if work_dir is None:
+        # Общая папка temp: создаем при необходимости и очищаем старые файлы
+        work_dir = TEMP_DIR
+        os.makedirs(work_dir, exist_ok=True)
+        cleanup_old_temp_files(work_dir)
+    
+    # Уникальное имя, чтобы параллельные задачи одного пользователя не пересекались
+    prefix = f'temp-audio-{user_id}-' if user_id else 'temp-audio-'
+    fd, audio_path = tempfile.mkstemp(prefix=prefix, suffix='.m4a', dir=work_dir)
+    os.close(fd)
+    
+    base_cmd = [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error', '-i', input_path, '-vn', '-map', '0:a:0']
+    if audio_codec == 'aac' and _run_ffmpeg(base_cmd + ['-c:a', 'copy', audio_path]):
+        logger.info("Аудиодорожка AAC скопирована без перекодирования")
+        return audio_path
+    
+    if _run_ffmpeg(base_cmd + ['-c:a', 'aac', '-b:a', '128k', audio_path]):
+        logger.info(f"Аудиодорожка {audio_codec} закодирована в AAC один раз для всех копий")
+        return audio_path
+    
+    remove_shared_audio(audio_path)
+    raise RuntimeError(f"Не удалось подготовить аудиодорожку из {input_path}")
 
-    def get_video_info(self, video_path: str):
-        """Получение информации о видео"""
+
+def remove_shared_audio(audio_path: str):
+    """Удаляет общую аудиодорожку задачи"""
+    if audio_path and os.path.exists(audio_path):
         try:
-            clip = VideoFileClip(video_path)
-            info = {
-                'duration': clip.duration,
-                'fps': clip.fps,
-                'size': clip.size,
-                'audio': clip.audio is not None
-            }
-            clip.close()
-            return info
+            os.remove(audio_path)
         except Exception as e:
-            print(f"Ошибка при получении информации о видео: {e}")
-            return None
+            logger.warning(f"Не удалось удалить временный аудиофайл {audio_path}: {e}")
+
+
+def process_video_copy_ffmpeg(input_path: str, output_path: str, params: dict, codec_settings: dict,
+                              change_resolution: bool, shared_audio_path: str = None) -> bool:
+    """Создает копию видео одним фильтрграфом ffmpeg, без передачи кадров в Python"""
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        cmd = [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error', '-i', input_path]
+        if shared_audio_path:
+            cmd.extend(['-i', shared_audio_path])
+        cmd.extend([
+            '-map', '0:v:0',
+            '-vf', build_ffmpeg_filter_chain(params, change_resolution),
+            *_ffmpeg_codec_args(codec_settings),
+            *_ffmpeg_audio_args(shared_audio_path),
+            output_path
+        ])
+        return _run_ffmpeg(cmd) and os.path.exists(output_path)
+    except Exception as e:
+        logger.error(f"Ошибка ffmpeg-обработки копии {params['copy_index'] + 1}: {str(e)}")
+        return False
+
 
-def process_video_copy_new(input_path: str, output_path: str, copy_index: int, add_frames: bool, compress: bool, change_resolution: bool, user_id: int = None):
-    """Обрабатывает одну копию видео - функция для использования в ProcessPoolExecutor"""
+def process_video_copies_ffmpeg(input_path: str, output_paths: list, params_list: list, codec_settings_list: list,
+                                change_resolution: bool, shared_audio_path: str = None, on_frame=None) -> list:
+    """Создает все копии одним процессом ffmpeg: декодирование один раз, split на N цепочек фильтров"""
+    copies = len(output_paths)
+    try:
+        for output_path in output_paths:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        
+        if copies == 1:
+            graph = [f"[0:v]{build_ffmpeg_filter_chain(params_list[0], change_resolution)}[v0]"]
+        else:
+            split_outputs = "".join(f"[s{i}]" for i in range(copies))
+            graph = [f"[0:v]split={copies}{split_outputs}"]
+            graph.extend(
+                f"[s{i}]{build_ffmpeg_filter_chain(params, change_resolution)}[v{i}]"
+                for i, params in enumerate(params_list)
+            )
+        
+        cmd = [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error', '-i', input_path]
+        if shared_audio_path:
+            cmd.extend(['-i', shared_audio_path])
+        cmd.extend(['-filter_complex', ";".join(graph)])
+        for i, (output_path, codec_settings) in enumerate(zip(output_paths, codec_settings_list)):
+            cmd.extend([
+                '-map', f'[v{i}]',
+                *_ffmpeg_codec_args(codec_settings),
+                *_ffmpeg_audio_args(shared_audio_path),
+                output_path
+            ])
+        
+        if not _run_ffmpeg(cmd, on_frame):
+            return [False] * copies
+        return [os.path.exists(output_path) for output_path in output_paths]
+    except OutputTooLarge:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка ffmpeg fan-out обработки: {str(e)}")
+        return [False] * copies
+
+
+# Кодеки, которые можно скопировать в MP4 без перекодирования
+REMUX_VIDEO_CODECS = {'h264', 'hevc', 'mpeg4', 'av1', 'vp9'}
+REMUX_AUDIO_CODECS = {'aac', 'mp3', 'ac3', 'eac3', 'alac', 'opus'}
+
+
+def can_remux_copies(add_frames: bool, compress: bool, change_resolution: bool, video_info: dict = None) -> bool:
+    """Можно ли сделать копии без перекодирования видеопотока.
+    
+    Быстрый путь используется, когда не выбраны рамки, сжатие и смена
+    разрешения, а потоки входного файла совместимы с MP4.
+    """
+    if not VIDEO_REMUX_FAST_PATH or add_frames or compress or change_resolution or video_info is None:
+        return False
+    if video_info.get('video_codec') not in REMUX_VIDEO_CODECS:
+        return False
+    audio_codec = video_info.get('audio_codec')
+    return audio_codec is None or audio_codec in REMUX_AUDIO_CODECS
+
+
+def generate_remux_params(copy_index: int, rng: random.Random = None) -> dict:
+    """Генерирует параметры уникальности копии на уровне контейнера"""
+    if rng is None:
+        rng = random.Random()
+    creation_time = time.time() - rng.randint(60, 30 * 24 * 3600)
+    return {
+        'copy_index': copy_index,
+        # Метаданные контейнера: свой идентификатор и дата создания у каждой копии
+        'comment': '%032x' % rng.getrandbits(128),
+        'creation_time': time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime(creation_time)),
+        # Сдвиг временных меток на 1-40 мс записывается в edit list, кадры не меняются
+        'ts_offset': rng.randint(1, 40) / 1000,
+        # Разная раскладка MP4: major brand и положение moov-атома
+        'brand': rng.choice(['isom', 'mp42', 'iso5', 'avc1']),
+        'faststart': rng.choice([True, False]),
+    }
+
+
+def process_video_copy_remux(input_path: str, output_path: str, params: dict) -> bool:
+    """Создает копию видео копированием потоков (-c copy) с изменениями только в контейнере"""
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        cmd = [
+            get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error', '-i', input_path,
+            '-map', '0:v:0', '-map', '0:a:0?',
+            '-c', 'copy',
+            '-map_metadata', '-1', '-map_chapters', '-1',
+            '-metadata', f"creation_time={params['creation_time']}",
+            '-metadata', f"comment={params['comment']}",
+            '-output_ts_offset', f"{params['ts_offset']:.3f}",
+            '-brand', params['brand'],
+        ]
+        if params['faststart']:
+            cmd.extend(['-movflags', '+faststart'])
+        cmd.append(output_path)
+        return _run_ffmpeg(cmd) and os.path.exists(output_path)
+    except Exception as e:
+        logger.error(f"Ошибка при создании копии {params['copy_index'] + 1} без перекодирования: {str(e)}")
+        return False
+
+
+def process_video_copies_remux(input_path: str, output_paths: list, progress_callback=None,
+                               seed: int = None) -> list:
+    """Быстрый путь: все копии создаются без декодирования и кодирования видео"""
+    if seed is None:
+        seed = new_job_seed()
+    results = []
+    for i, output_path in enumerate(output_paths):
+        result = process_video_copy_remux(input_path, output_path, generate_remux_params(i, copy_rng(seed, i)))
+        if result:
+            logger.info(f"Копия {i + 1} создана без перекодирования: {output_path}")
+            total_frames = getattr(progress_callback, 'total_frames', 0)
+            if progress_callback is not None and total_frames:
+                progress_callback(total_frames, [i])
+        results.append(result)
+    return results
+
+
+def process_video_copy_new(input_path: str, output_path: str, copy_index: int, add_frames: bool, compress: bool, change_resolution: bool, user_id: int = None,
+                           use_ffmpeg_backend: bool = None, shared_audio_path: str = None, profile: str = None,
+                           seed: int = None):
+    """Обрабатывает одну копию видео - функция для использования в ProcessPoolExecutor
+    
+    При use_ffmpeg_backend копия создается фильтрграфом ffmpeg, moviepy остается
+    запасным вариантом. По умолчанию бэкенд берется из VIDEO_BACKEND.
+    shared_audio_path - общая аудиодорожка задачи из prepare_shared_audio; если
+    не передана, копия готовит ее сама.
+    profile - профиль кодирования из ENCODING_PROFILES, по умолчанию ENCODING_PROFILE.
+    seed - seed задачи: с тем же seed копия получает те же параметры.
+    """
+    if use_ffmpeg_backend is None:
+        use_ffmpeg_backend = VIDEO_BACKEND == 'ffmpeg'
+    rng = copy_rng(new_job_seed() if seed is None else seed, copy_index)
+    
     video = None
     modified_video = None
+    own_audio_path = None
     
     try:
         logger.info(f"Начинаю обработку копии {copy_index + 1}: {input_path} -> {output_path}")
@@ -352,62 +756,50 @@ def process_video_copy_new(input_path: str, output_path: str, copy_index: int, a
         # Создаем директорию для выходного файла
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
+        video_info = probe_video(input_path)
+        
+        if VIDEO_REMUX_FAST_PATH and not (add_frames or compress or change_resolution):
+            if can_remux_copies(add_frames, compress, change_resolution, video_info.to_dict() if video_info else None):
+                if process_video_copy_remux(input_path, output_path, generate_remux_params(copy_index, rng)):
+                    logger.info(f"Копия {copy_index + 1} создана без перекодирования: {output_path}")
+                    return True
+                logger.warning(f"Копия {copy_index + 1}: не удалось создать без перекодирования, используем полную обработку")
+        
+        if shared_audio_path is None:
+            own_audio_path = prepare_shared_audio(input_path, user_id)
+            shared_audio_path = own_audio_path
+        
+        duration = video_info.duration if video_info else None
+        params = generate_modification_params(copy_index, add_frames, rng=rng)
+        codec_settings = select_codec_settings(
+            compress, duration, video_info.has_audio if video_info else True,
+            profile, rng, audio_bitrate_kbps(shared_audio_path, duration) if duration else None
+        )
+        
+        if use_ffmpeg_backend:
+            if process_video_copy_ffmpeg(input_path, output_path, params, codec_settings, change_resolution, shared_audio_path):
+                logger.info(f"Копия {copy_index + 1} успешно создана через ffmpeg: {output_path}")
+                return True
+            logger.warning(f"Копия {copy_index + 1}: ffmpeg-бэкенд не справился, используем moviepy")
+        
         # Загружаем видео
         video = VideoFileClip(input_path)
         
         # Применяем уникальные модификации
-        modified_video = apply_unique_modifications(video, copy_index, add_frames)
+        modified_video = apply_unique_modifications(video, copy_index, add_frames, params=params)
         
         # Изменяем разрешение если нужно
-        if change_resolution:
-            # Получаем текущие размеры
-            original_width, original_height = modified_video.size
-            
-            # Всегда меняем на 1080x1920 (вертикальное видео для Stories/Reels)
-            target_width, target_height = 1080, 1920
-            
-            # Проверяем, нужно ли изменение
-            if original_width != target_width or original_height != target_height:
-                modified_video = modified_video.resize((target_width, target_height))
-                logger.info(f"Разрешение изменено с {original_width}x{original_height} на {target_width}x{target_height}")
-            else:
-                logger.info(f"Разрешение уже {target_width}x{target_height}, изменение не требуется")
-        
-        # Настройки сжатия с шестью вариантами битрейта
-        bitrate_options = ['2000k', '1500k', '1600k', '1700k', '1800k', '1900k']
-        
-        if compress:
-            # При сжатии используем случайный битрейт из шести вариантов
-            selected_bitrate = random.choice(bitrate_options)
-            codec_settings = {
-                'codec': 'libx264',
-                'bitrate': selected_bitrate,
-                'audio_codec': 'aac'
-            }
-            logger.info(f"Выбран битрейт для сжатия: {selected_bitrate}")
-        else:
-            # Без сжатия используем максимальный битрейт
-            codec_settings = {
-                'codec': 'libx264',
-                'bitrate': '2000k',
-                'audio_codec': 'aac'
-            }
-        
-        # Создаем папку temp если не существует
-        os.makedirs(TEMP_DIR, exist_ok=True)
-        
-        # Очищаем старые временные файлы
-        cleanup_old_temp_files(TEMP_DIR)
+        modified_video = apply_resolution_change(modified_video, change_resolution)
         
-        # Создаем уникальное имя для временного аудиофайла в папке temp
-        temp_audio_name = os.path.join(TEMP_DIR, f'temp-audio-{user_id}-{copy_index}.m4a' if user_id else f'temp-audio-{copy_index}.m4a')
-        
-        # Сохраняем видео
+        # Сохраняем видео, подключая готовую аудиодорожку без перекодирования
         modified_video.write_videofile(
             output_path,
-            **codec_settings,
-            temp_audiofile=temp_audio_name,
-            remove_temp=True,
+            codec=codec_settings['codec'],
+            bitrate=_video_bitrate(codec_settings),
+            audio=shared_audio_path if shared_audio_path else False,
+            preset=codec_settings.get('preset', 'medium'),
+            threads=codec_settings.get('threads'),
+            ffmpeg_params=_encoder_params(codec_settings),
             verbose=False,
             logger=None
         )
@@ -422,3 +814,443 @@ def process_video_copy_new(input_path: str, output_path: str, copy_index: int, a
     except Exception as e:
         logger.error(f"Ошибка при создании копии {copy_index + 1}: {str(e)}")
         return False
+    finally:
+        remove_shared_audio(own_audio_path)
+
+
+class _BroadcastClip(VideoClip):
+    """Клип-источник для fan-out: отдает всем копиям один и тот же декодированный кадр"""
+    
+    def __init__(self, size, fps: float, duration: float):
+        VideoClip.__init__(self, duration=duration)
+        # moviepy запрашивает кадр при построении цепочки эффектов, поэтому до начала
+        # декодирования отдаем черный кадр нужного размера
+        self.current_frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+        self.make_frame = lambda t: self.current_frame
+        self.size = size
+        self.fps = fps
+
+
+class _CopySink:
+    """Выход одной копии: цепочка модификаций и собственный ffmpeg-энкодер"""
+    
+    def __init__(self, copy_index: int, output_path: str, clip, writer):
+        self.copy_index = copy_index
+        self.output_path = output_path
+        self.clip = clip
+        self.writer = writer
+        self.failed = False
+    
+    def write(self, t: float):
+        """Прогоняет текущий кадр через модификации копии и отдает его энкодеру"""
+        frame = self.clip.get_frame(t)
+        if frame.dtype != np.uint8:
+            frame = frame.astype('uint8')
+        self.writer.write_frame(frame)
+    
+    def close(self):
+        """Завершает запись копии"""
+        try:
+            self.writer.close()
+        except Exception as e:
+            logger.warning(f"Ошибка при закрытии энкодера копии {self.copy_index + 1}: {e}")
+            self.failed = True
+
+
+def split_video_segments(input_path: str, segments_dir: str, segments: int, duration: float) -> list:
+    """Режет видеопоток на segments частей по ключевым кадрам без перекодирования.
+    
+    Границы выбираются равномерно по длительности; сегментер ffmpeg сдвигает
+    каждую границу к ближайшему следующему ключевому кадру.
+    """
+    split_times = ",".join(f"{duration * k / segments:.3f}" for k in range(1, segments))
+    cmd = [
+        get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error', '-i', input_path,
+        '-map', '0:v:0', '-c', 'copy', '-an',
+        '-f', 'segment', '-segment_times', split_times, '-segment_format', 'mp4',
+        '-reset_timestamps', '1',
+        os.path.join(segments_dir, 'input_%03d.mp4')
+    ]
+    if not _run_ffmpeg(cmd):
+        return []
+    return sorted(
+        os.path.join(segments_dir, name) for name in os.listdir(segments_dir)
+        if name.startswith('input_') and name.endswith('.mp4')
+    )
+
+
+def concat_video_segments(segment_paths: list, output_path: str, list_path: str,
+                          shared_audio_path: str = None, faststart: bool = False) -> bool:
+    """Склеивает закодированные сегменты копии без перекодирования и подключает общую аудиодорожку"""
+    with open(list_path, 'w', encoding='utf-8') as list_file:
+        for segment_path in segment_paths:
+            list_file.write(f"file '{segment_path}'\n")
+    
+    cmd = [get_setting("FFMPEG_BINARY"), '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path]
+    if shared_audio_path:
+        cmd.extend(['-i', shared_audio_path])
+    cmd.extend(['-map', '0:v:0', '-c:v', 'copy', *_ffmpeg_audio_args(shared_audio_path)])
+    if faststart:
+        cmd.extend(['-movflags', '+faststart'])
+    cmd.append(output_path)
+    return _run_ffmpeg(cmd) and os.path.exists(output_path)
+
+
+def process_video_copies_segmented(input_path: str, output_paths: list, params_list: list, codec_settings_list: list,
+                                   change_resolution: bool, shared_audio_path: str, segments: int,
+                                   duration: float, user_id: int = None, progress_callback=None,
+                                   work_dir: str = None, on_copy_ready=None, size_guard=None) -> list:
+    """Кодирует длинное видео параллельно по сегментам и склеивает копии без потерь.
+    
+    Вход режется по ключевым кадрам на segments частей, каждая часть
+    обрабатывается фильтрграфом ffmpeg со всеми копиями сразу (параметры
+    копий одинаковы во всех сегментах), затем сегменты каждой копии
+    склеиваются concat-демультиплексором. Каждая склеенная копия сразу
+    передается в on_copy_ready(copy_index). size_guard (OutputSizeGuard)
+    на время кодирования следит за суммой размеров сегментов копии.
+    """
+    copies = len(output_paths)
+    # Пути в списке concat считаются относительно самого списка, поэтому папка абсолютная
+    segments_dir = os.path.abspath(
+        tempfile.mkdtemp(prefix=f'segments-{user_id}-' if user_id else 'segments-', dir=work_dir or TEMP_DIR)
+    )
+    try:
+        input_segments = split_video_segments(input_path, segments_dir, segments, duration)
+        if len(input_segments) < 2:
+            logger.warning("Не удалось разрезать видео на сегменты")
+            return [False] * copies
+        
+        logger.info(f"Видео разрезано на {len(input_segments)} сегментов, кодирую параллельно")
+        
+        copy_segments = [
+            [os.path.join(segments_dir, f'copy{i}_{k:03d}.mp4') for k in range(len(input_segments))]
+            for i in range(copies)
+        ]
+        if size_guard is not None:
+            size_guard.watch(copy_segments)
+        
+        # Прогресс копии - сумма кадров, готовых во всех сегментах
+        segment_frames = [0] * len(input_segments)
+        
+        def segment_progress(k):
+            if progress_callback is None:
+                return None
+            
+            def on_frame(frames):
+                segment_frames[k] = frames
+                progress_callback(sum(segment_frames))
+            return on_frame
+        
+        # Каждый сегмент - отдельный процесс ffmpeg, потоки только ждут их завершения
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(input_segments)) as executor:
+            futures = [
+                executor.submit(
+                    process_video_copies_ffmpeg,
+                    segment_path,
+                    [copy_segments[i][k] for i in range(copies)],
+                    params_list,
+                    codec_settings_list,
+                    change_resolution,
+                    None,
+                    segment_progress(k)
+                )
+                for k, segment_path in enumerate(input_segments)
+            ]
+            segment_results = [future.result() for future in futures]
+        if size_guard is not None:
+            size_guard.watch()
+        
+        results = []
+        for i, output_path in enumerate(output_paths):
+            if not all(segment_result[i] for segment_result in segment_results):
+                logger.error(f"Копия {i + 1}: не все сегменты закодированы")
+                results.append(False)
+                continue
+            list_path = os.path.join(segments_dir, f'copy{i}.txt')
+            results.append(concat_video_segments(
+                copy_segments[i], output_path, list_path, shared_audio_path, codec_settings_list[i].get('faststart')
+            ))
+            if results[-1] and on_copy_ready is not None:
+                on_copy_ready(i)
+        return results
+    except OutputTooLarge:
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при сегментной обработке видео: {str(e)}")
+        return [False] * copies
+    finally:
+        if size_guard is not None:
+            size_guard.watch()
+        shutil.rmtree(segments_dir, ignore_errors=True)
+
+
+def process_video_copies_fanout(input_path: str, output_paths: list, add_frames: bool, compress: bool,
+                                change_resolution: bool, user_id: int = None, use_ffmpeg_backend: bool = None,
+                                encoder_threads: int = None, video_info: dict = None, segments: int = 1,
+                                progress_callback=None, work_dir: str = None, profile: str = None,
+                                seed: int = None, on_copy_ready=None):
+    """Создает все копии видео за одно декодирование входного файла.
+    
+    Каждый кадр читается из входного файла один раз и раздается N копиям,
+    у каждой из которых своя цепочка модификаций и свой энкодер.
+    encoder_threads - число потоков каждого энкодера, выделенное EncoderScheduler;
+    если не задано, libx264 выбирает его сам. video_info - метаданные из ProbeCache.
+    segments > 1 - длинное видео кодируется параллельно по сегментам (число выбирает
+    EncoderScheduler, когда есть свободные ядра); только для бэкенда ffmpeg.
+    progress_callback(frames, copy_indices=None, total_frames=None) получает число
+    готовых кадров по копиям (см. job_progress.ProgressReporter).
+    work_dir - папка для промежуточных файлов (аудиодорожка, сегменты).
+    profile - профиль кодирования из ENCODING_PROFILES.
+    seed - seed задачи для планов копий (build_copy_plans); с тем же seed копии повторяются.
+    on_copy_ready(copy_index) вызывается, как только файл копии записан полностью,
+    чтобы ее можно было отправлять, пока остальные еще кодируются.
+    В режиме VIDEO_RATE_CONTROL='target_size' копии больше VIDEO_TARGET_SIZE_MB
+    считаются неудачными и удаляются.
+    Возвращает список флагов успеха в порядке output_paths.
+    """
+    copy_ready = None
+    if on_copy_ready is not None:
+        def copy_ready(copy_index):
+            # Копию больше лимита отбросит drop_oversized_outputs - отправлять ее нельзя
+            if VIDEO_RATE_CONTROL == 'target_size' and os.path.getsize(output_paths[copy_index]) > MAX_OUTPUT_SIZE_BYTES:
+                return
+            on_copy_ready(copy_index)
+    
+    results = _process_video_copies_fanout(
+        input_path, output_paths, add_frames, compress, change_resolution, user_id, use_ffmpeg_backend,
+        encoder_threads, video_info, segments, progress_callback, work_dir, profile, seed, copy_ready
+    )
+    if VIDEO_RATE_CONTROL == 'target_size':
+        results = drop_oversized_outputs(output_paths, results, MAX_OUTPUT_SIZE_BYTES)
+    return results
+
+
+def _process_video_copies_fanout(input_path: str, output_paths: list, add_frames: bool, compress: bool,
+                                 change_resolution: bool, user_id: int, use_ffmpeg_backend: bool,
+                                 encoder_threads: int, video_info: dict, segments: int,
+                                 progress_callback, work_dir: str, profile: str, seed: int, on_copy_ready):
+    if use_ffmpeg_backend is None:
+        use_ffmpeg_backend = VIDEO_BACKEND == 'ffmpeg'
+    if seed is None:
+        seed = new_job_seed()
+    
+    results = [False] * len(output_paths)
+    # Копии, о готовности которых уже сообщили: их могут отправлять, удалять их нельзя
+    reported = set()
+    if on_copy_ready is not None:
+        report_copy_ready = on_copy_ready
+        
+        def on_copy_ready(copy_index):
+            reported.add(copy_index)
+            report_copy_ready(copy_index)
+    
+    logger.info(f"Начинаю fan-out обработку {len(output_paths)} копий: {input_path}")
+    
+    # Проверяем существование входного файла
+    if not os.path.exists(input_path):
+        logger.error(f"Входной файл не найден: {input_path}")
+        return results
+    
+    if video_info is None and VIDEO_REMUX_FAST_PATH and not (add_frames or compress or change_resolution):
+        probed_info = probe_video(input_path)
+        video_info = probed_info.to_dict() if probed_info else None
+    
+    if can_remux_copies(add_frames, compress, change_resolution, video_info):
+        # Видеопоток не меняется - копии отличаются только контейнером
+        results = process_video_copies_remux(input_path, output_paths, progress_callback, seed)
+        if all(results):
+            logger.info(f"Все {len(output_paths)} копий созданы без перекодирования")
+            # Готовность сообщается только здесь: при неудаче полная обработка перезапишет все копии
+            if on_copy_ready is not None:
+                for i in range(len(output_paths)):
+                    on_copy_ready(i)
+            return results
+        logger.warning("Не удалось создать копии без перекодирования, используем полную обработку")
+        results = [False] * len(output_paths)
+    
+    duration = video_info.get('duration') if video_info else None
+    has_audio = video_info.get('audio_codec') is not None if video_info else True
+    
+    # Прогноз размера по ходу кодирования: копию, которая не уложится в лимит, прерываем заранее
+    size_guard = None
+    if VIDEO_RATE_CONTROL == 'target_size' and duration and video_info.get('fps'):
+        size_guard = OutputSizeGuard(output_paths, MAX_OUTPUT_SIZE_BYTES, int(duration * video_info['fps']))
+        progress_callback = size_guard.wrap(progress_callback)
+    
+    shared_audio_path = None
+    try:
+        # Аудиодорожка одинакова для всех копий - готовим ее один раз на задачу
+        shared_audio_path = prepare_shared_audio(input_path, user_id, video_info, work_dir)
+        
+        # Битрейт видео считается от фактического размера аудиодорожки
+        audio_kbps = audio_bitrate_kbps(shared_audio_path, duration) if duration else None
+        plans = build_copy_plans(
+            seed, len(output_paths), add_frames, compress, duration, has_audio, profile, audio_kbps
+        )
+        logger.info(f"Планы {len(plans)} копий построены, seed задачи: {seed}")
+        params_list = [plan['modifications'] for plan in plans]
+        codec_settings_list = [plan['codec_settings'] for plan in plans]
+        for codec_settings in codec_settings_list:
+            codec_settings['threads'] = encoder_threads
+        
+        # Сегменты кодируются ffmpeg - при VIDEO_BACKEND=moviepy видео обрабатывается целиком
+        if segments > 1 and use_ffmpeg_backend and video_info and video_info.get('duration'):
+            results = process_video_copies_segmented(
+                input_path, output_paths, params_list, codec_settings_list, change_resolution,
+                shared_audio_path, segments, video_info['duration'], user_id, progress_callback, work_dir,
+                on_copy_ready, size_guard
+            )
+            if all(results):
+                logger.info(f"Все {len(output_paths)} копий созданы сегментным кодированием ({segments} сегментов)")
+                return results
+            # Склеенные копии уже могли уйти пользователю, поэтому повторяются только неудачные
+            logger.warning("Сегментное кодирование не справилось с частью копий, обрабатываем их видео целиком")
+        
+        if use_ffmpeg_backend:
+            pending = [i for i, result in enumerate(results) if not result]
+            on_frame = None
+            if progress_callback is not None:
+                def on_frame(frames):
+                    progress_callback(frames, pending)
+            ffmpeg_results = process_video_copies_ffmpeg(
+                input_path,
+                [output_paths[i] for i in pending],
+                [params_list[i] for i in pending],
+                [codec_settings_list[i] for i in pending],
+                change_resolution,
+                shared_audio_path,
+                on_frame
+            )
+            # Один процесс ffmpeg дописывает все копии одновременно
+            for i, result in zip(pending, ffmpeg_results):
+                results[i] = result
+                if result and on_copy_ready is not None:
+                    on_copy_ready(i)
+            if all(results):
+                logger.info(f"Все {len(output_paths)} копий созданы через ffmpeg")
+                return results
+            if size_guard is not None and size_guard.tripped:
+                # Повтор через moviepy даст тот же размер
+                raise OutputTooLarge()
+            logger.warning("ffmpeg-бэкенд не справился с частью копий, используем moviepy")
+        
+        # Повторяем через moviepy только копии, которые еще не созданы
+        pending = [i for i, result in enumerate(results) if not result]
+        pending_ready = None
+        if on_copy_ready is not None:
+            def pending_ready(k):
+                on_copy_ready(pending[k])
+        moviepy_results = _process_video_copies_moviepy(
+            input_path,
+            [output_paths[i] for i in pending],
+            [params_list[i] for i in pending],
+            [codec_settings_list[i] for i in pending],
+            change_resolution,
+            shared_audio_path,
+            progress_callback,
+            pending_ready
+        )
+        for i, result in zip(pending, moviepy_results):
+            results[i] = result
+        return results
+    except OutputTooLarge:
+        logger.error(f"Копии не укладываются в {MAX_OUTPUT_SIZE_BYTES / (1024 * 1024):.0f} МБ, обработка прервана")
+        # Копии, уже переданные в on_copy_ready, могут отправляться - их не трогаем
+        for i, output_path in enumerate(output_paths):
+            if i in reported:
+                results[i] = True
+                continue
+            results[i] = False
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        return results
+    except Exception as e:
+        logger.error(f"Ошибка при fan-out обработке видео: {str(e)}")
+        return results
+    finally:
+        remove_shared_audio(shared_audio_path)
+
+
+def _process_video_copies_moviepy(input_path: str, output_paths: list, params_list: list, codec_settings_list: list,
+                                  change_resolution: bool, shared_audio_path: str = None, progress_callback=None,
+                                  on_copy_ready=None):
+    """Fan-out через moviepy: один VideoFileClip, кадры раздаются цепочкам модификаций копий"""
+    video = None
+    sinks = []
+    results = [False] * len(output_paths)
+    
+    try:
+        # Загружаем видео один раз для всех копий, звук подключается готовой дорожкой
+        video = VideoFileClip(input_path, audio=False)
+        track_process(video.reader.proc)
+        fps = video.fps
+        source = _BroadcastClip(video.size, fps, video.duration)
+        
+        # Создаем выход для каждой копии
+        for output_path, params, codec_settings in zip(output_paths, params_list, codec_settings_list):
+            copy_index = params['copy_index']
+            try:
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                modified_video = apply_unique_modifications(source, copy_index, params['frame'] is not None, params=params)
+                modified_video = apply_resolution_change(modified_video, change_resolution)
+                writer = FFMPEG_VideoWriter(
+                    output_path,
+                    modified_video.size,
+                    fps,
+                    codec=codec_settings['codec'],
+                    preset=codec_settings.get('preset', 'medium'),
+                    bitrate=_video_bitrate(codec_settings),
+                    threads=codec_settings.get('threads'),
+                    ffmpeg_params=_encoder_params(codec_settings),
+                    audiofile=shared_audio_path
+                )
+                track_process(writer.proc)
+                sinks.append(_CopySink(copy_index, output_path, modified_video, writer))
+            except Exception as e:
+                logger.error(f"Ошибка при подготовке копии {copy_index + 1}: {str(e)}")
+        
+        total_frames = video.reader.nframes
+        
+        # Декодируем каждый кадр один раз и раздаем его всем копиям
+        for frame_number, (t, frame) in enumerate(
+                video.iter_frames(with_times=True, fps=fps, dtype='uint8', logger=None), 1):
+            check_cancelled()
+            source.current_frame = frame
+            active_sinks = [sink for sink in sinks if not sink.failed]
+            if not active_sinks:
+                break
+            for sink in active_sinks:
+                try:
+                    sink.write(t)
+                except Exception as e:
+                    # Энкодер мог быть остановлен отменой задачи - это не ошибка копии
+                    check_cancelled()
+                    logger.error(f"Ошибка при записи кадра копии {sink.copy_index + 1}: {str(e)}")
+                    sink.failed = True
+            if progress_callback is not None:
+                progress_callback(frame_number, [sink.copy_index for sink in active_sinks], total_frames)
+        
+        for sink in sinks:
+            sink.close()
+            if not sink.failed and os.path.exists(sink.output_path):
+                results[output_paths.index(sink.output_path)] = True
+                logger.info(f"Копия {sink.copy_index + 1} успешно создана: {sink.output_path}")
+                if on_copy_ready is not None:
+                    on_copy_ready(output_paths.index(sink.output_path))
+            else:
+                logger.error(f"Копия {sink.copy_index + 1} не была создана")
+        
+        return results
+        
+    except OutputTooLarge:
+        for sink in sinks:
+            sink.close()
+        raise
+    except Exception as e:
+        logger.error(f"Ошибка при fan-out обработке видео: {str(e)}")
+        for sink in sinks:
+            sink.close()
+        return results
+    finally:
+        if video is not None:
+            video.close()
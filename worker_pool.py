@@ -0,0 +1,371 @@
+"""
+Пул процессов для обработки копий видео
+"""
+
+import os
+import uuid
+import queue
+import asyncio
+import logging
+import threading
+import multiprocessing
+from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import VIDEO_WORKER_PROCESSES, VIDEO_WORKER_MAX_TASKS
+from encoder_scheduler import EncoderScheduler
+from job_progress import JobProgress, ProgressReporter
+from job_cancel import CancelScope, JobCancelled
+from copy_seeds import new_job_seed
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать остановки отмененной задачи в воркере, прежде чем вернуть ее слот, секунд
+CANCEL_GRACE_PERIOD = 10
+
+# Модули, которые загружаются в воркеры заранее, до первой задачи
+PRELOAD_MODULES = ['numpy', 'moviepy.editor', 'video_processor']
+
+
+@dataclass
+class VideoCopyJob:
+    """Сериализуемый план обработки копий одного видео для передачи в процесс-воркер"""
+    input_path: str
+    output_paths: list = field(default_factory=list)
+    add_frames: bool = False
+    compress: bool = False
+    change_resolution: bool = False
+    user_id: int = None
+    encoder_threads: int = None
+    video_info: dict = None  # Метаданные из ProbeCache (VideoInfo.to_dict())
+    segments: int = 1  # Сегментов для параллельного кодирования, выбирает EncoderScheduler
+    work_dir: str = None  # Папка для промежуточных файлов (JobWorkspace.work_dir)
+    profile: str = None  # Профиль кодирования из ENCODING_PROFILES
+    seed: int = field(default_factory=new_job_seed)  # Seed планов копий: тот же seed - те же копии
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    progress_queue: object = None  # Очередь Manager для отчетов о прогрессе, задает пул
+    cancel_event: object = None  # Event из Manager: установлен - задачу нужно прервать
+
+
+def _init_worker():
+    """Инициализация процесса-воркера: логирование и импорт тяжелых библиотек"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    import numpy  # noqa: F401
+    import moviepy.editor  # noqa: F401
+    import video_processor  # noqa: F401
+
+
+def _worker_pid() -> int:
+    """Пустая задача для запуска процессов пула заранее"""
+    return os.getpid()
+
+
+def run_video_copy_job(job: VideoCopyJob) -> list:
+    """Выполняет план обработки копий внутри процесса-воркера"""
+    from video_processor import process_video_copies_fanout
+
+    # Получаем абсолютные пути
+    abs_input_path = os.path.abspath(job.input_path)
+    abs_output_paths = [os.path.abspath(output_path) for output_path in job.output_paths]
+
+    # Создаем директорию для выходных файлов если не существует
+    for abs_output_path in abs_output_paths:
+        os.makedirs(os.path.dirname(abs_output_path), exist_ok=True)
+
+    progress_callback = None
+    on_copy_ready = None
+    if job.progress_queue is not None:
+        total_frames = int(job.video_info['duration'] * job.video_info['fps']) if job.video_info else 0
+        progress_callback = ProgressReporter(job.progress_queue, job.job_id, len(abs_output_paths), total_frames)
+        on_copy_ready = progress_callback.copy_ready
+
+    with CancelScope(job.cancel_event):
+        try:
+            results = process_video_copies_fanout(
+                abs_input_path, abs_output_paths, job.add_frames, job.compress, job.change_resolution, job.user_id,
+                encoder_threads=job.encoder_threads, video_info=job.video_info, segments=job.segments,
+                progress_callback=progress_callback,
+                on_copy_ready=on_copy_ready,
+                work_dir=os.path.abspath(job.work_dir) if job.work_dir else None,
+                profile=job.profile,
+                seed=job.seed
+            )
+        except JobCancelled:
+            logger.info(f"Задача {job.job_id} отменена, удаляю незавершенные копии")
+            # Копии, о готовности которых уже сообщили, могут отправляться - их не трогаем
+            ready = set(progress_callback.ready) if progress_callback is not None else set()
+            _remove_partial_outputs(abs_output_paths, ready)
+            return [i in ready for i in range(len(abs_output_paths))]
+
+    if progress_callback is not None:
+        progress_callback.finish()
+    return results
+
+
+def _remove_partial_outputs(output_paths: list, ready: set = frozenset()):
+    """Удаляет недописанные файлы копий отмененной задачи; готовые копии (ready) остаются"""
+    for i, output_path in enumerate(output_paths):
+        if i in ready:
+            continue
+        try:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        except Exception as e:
+            logger.warning(f"Не удалось удалить незавершенную копию {output_path}: {e}")
+
+
+class VideoWorkerPool:
+    """Долгоживущий пул процессов для обработки видео.
+
+    Кадровая обработка moviepy/numpy держит GIL, поэтому копии выполняются
+    в отдельных процессах. Каждый воркер перезапускается после
+    max_tasks_per_child задач, чтобы не накапливать утечки памяти.
+    """
+
+    def __init__(self, max_workers: int = None, max_tasks_per_child: int = None, scheduler: EncoderScheduler = None):
+        self.max_workers = max_workers or VIDEO_WORKER_PROCESSES
+        self.max_tasks_per_child = max_tasks_per_child or VIDEO_WORKER_MAX_TASKS
+        self.scheduler = scheduler or EncoderScheduler()
+        self._executor = None
+        # Канал прогресса: воркеры пишут в очередь Manager, поток-диспетчер раздает отчеты задачам
+        self._manager = None
+        self._progress_queue = None
+        self._progress_thread = None
+        self._progress_stop = threading.Event()
+        self._progress_by_job = {}
+        # События отмены задач, которые сейчас выполняются
+        self._cancel_events = {}
+        # start() вызывается и из потоков (asyncio.to_thread) - пул создается один раз
+        self._start_lock = threading.Lock()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        """Создает пул процессов с предзагрузкой библиотек"""
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context('forkserver')
+            # forkserver один раз импортирует модули, а воркеры наследуют их при fork
+            mp_context.set_forkserver_preload(PRELOAD_MODULES)
+        else:
+            mp_context = multiprocessing.get_context('spawn')
+
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=mp_context,
+            initializer=_init_worker,
+            max_tasks_per_child=self.max_tasks_per_child
+        )
+
+    def start(self):
+        """Запускает пул и заранее поднимает все процессы-воркеры"""
+        with self._start_lock:
+            if self._executor is not None:
+                return
+
+            self._start_progress_channel()
+            executor = self._create_executor()
+            pids = {future.result() for future in [executor.submit(_worker_pid) for _ in range(self.max_workers)]}
+            self._executor = executor
+        logger.info(f"Пул воркеров запущен: {len(pids)} процессов, перезапуск после {self.max_tasks_per_child} задач")
+
+    def _restart_executor(self, broken: ProcessPoolExecutor):
+        """Пересоздает поврежденный пул процессов.
+
+        Manager с очередью прогресса и событиями отмены остается прежним:
+        задачи, которые ждут слот или повторяются, держат его прокси.
+        """
+        with self._start_lock:
+            if self._executor is not broken:
+                # Пул уже пересоздала другая задача
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._create_executor()
+
+    async def _cancel_running(self, future, cancel_event):
+        """Прерывает уже выполняющуюся задачу и ждет, пока воркер освободится"""
+        try:
+            cancel_event.set()
+        except Exception as e:
+            logger.warning(f"Не удалось передать отмену задаче: {e}")
+            return
+        done, _ = await asyncio.wait([asyncio.wrap_future(future)], timeout=CANCEL_GRACE_PERIOD)
+        if done:
+            logger.info("Отмененная задача остановлена, воркер освобожден")
+        else:
+            logger.warning(f"Отмененная задача не остановилась за {CANCEL_GRACE_PERIOD} секунд")
+
+    def _start_progress_channel(self):
+        """Создает очередь прогресса и поток, который раздает отчеты задачам"""
+        if self._progress_queue is not None:
+            return
+        self._manager = multiprocessing.get_context('spawn').Manager()
+        self._progress_queue = self._manager.Queue()
+        self._progress_stop.clear()
+        self._progress_thread = threading.Thread(
+            target=self._dispatch_progress, args=(self._progress_queue,), name='video-progress', daemon=True
+        )
+        self._progress_thread.start()
+
+    def _dispatch_progress(self, progress_queue):
+        """Читает отчеты воркеров и обновляет прогресс соответствующих задач"""
+        while not self._progress_stop.is_set():
+            try:
+                job_id, frames, total_frames, ready = progress_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except Exception:
+                # Manager остановлен - канал прогресса закрыт
+                break
+            progress = self._progress_by_job.get(job_id)
+            if progress is not None:
+                progress.update(frames, total_frames, ready)
+
+    def _stop_progress_channel(self):
+        self._progress_stop.set()
+        if self._progress_thread is not None:
+            self._progress_thread.join(timeout=2)
+            self._progress_thread = None
+        if self._manager is not None:
+            try:
+                self._manager.shutdown()
+            except Exception as e:
+                logger.warning(f"Ошибка при остановке канала прогресса: {e}")
+            self._manager = None
+        self._progress_queue = None
+
+    async def run(self, fn, *args, timeout: float = None, cancel_event=None):
+        """Выполняет функцию в процессе-воркере и ждет результат.
+
+        При таймауте или отмене задача снимается из очереди пула,
+        если она еще не начала выполняться. Если она уже выполняется и
+        передан cancel_event, событие устанавливается: воркер завершает
+        процессы ffmpeg задачи и удаляет ее незаконченные файлы.
+        """
+        if self._executor is None:
+            await asyncio.to_thread(self.start)
+
+        executor = self._executor
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            logger.error("Пул воркеров поврежден, пересоздаем его")
+            await asyncio.to_thread(self._restart_executor, executor)
+            executor = self._executor
+            future = executor.submit(fn, *args)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if not future.cancel() and cancel_event is not None:
+                await self._cancel_running(future, cancel_event)
+            raise
+        except BrokenProcessPool:
+            logger.error("Процесс-воркер аварийно завершился, пул будет пересоздан")
+            await asyncio.to_thread(self._restart_executor, executor)
+            raise
+
+    async def run_video_copy_job(self, job: VideoCopyJob, timeout: float = None, progress: JobProgress = None) -> list:
+        """Выполняет план обработки копий видео в пуле.
+
+        Перед запуском задача получает у планировщика слот с числом потоков
+        на энкодер каждой копии; время ожидания слота не входит в timeout.
+        Задачи быстрого пути без перекодирования слот не занимают.
+        Если передан progress, он обновляется отчетами воркера по мере кодирования.
+        """
+        if self._executor is None:
+            await asyncio.to_thread(self.start)
+        
+        job.cancel_event = self._manager.Event()
+        self._cancel_events[job.job_id] = job.cancel_event
+        if progress is not None:
+            job.progress_queue = self._progress_queue
+            self._progress_by_job[job.job_id] = progress
+        try:
+            return await self._run_video_copy_job(job, timeout)
+        finally:
+            self._progress_by_job.pop(job.job_id, None)
+            self._cancel_events.pop(job.job_id, None)
+
+    async def iter_video_copy_job(self, job: VideoCopyJob, timeout: float = None, progress: JobProgress = None):
+        """Выполняет план обработки копий и отдает копии по мере готовности.
+
+        Асинхронный итератор пар (copy_index, успех): копия, о которой воркер
+        сообщил через ProgressReporter.copy_ready, отдается сразу, пока остальные
+        еще кодируются. Оставшиеся копии отдаются по результату задачи.
+        Ошибки и таймаут задачи пробрасываются после уже готовых копий.
+        Если итератор закрыт раньше времени, задача отменяется.
+        """
+        if progress is None:
+            progress = JobProgress(len(job.output_paths))
+        loop = asyncio.get_running_loop()
+        ready_queue = asyncio.Queue()
+        # Отчеты приходят в поток-диспетчер, копии передаются в цикл событий
+        progress.on_copy_ready = lambda copy_index: loop.call_soon_threadsafe(ready_queue.put_nowait, copy_index)
+
+        run_task = asyncio.create_task(self.run_video_copy_job(job, timeout=timeout, progress=progress))
+        get_ready = None
+        reported = set()
+        try:
+            while True:
+                get_ready = asyncio.ensure_future(ready_queue.get())
+                await asyncio.wait({run_task, get_ready}, return_when=asyncio.FIRST_COMPLETED)
+                if not get_ready.done():
+                    break
+                copy_index = get_ready.result()
+                if copy_index not in reported:
+                    reported.add(copy_index)
+                    yield copy_index, True
+
+            results = run_task.result()
+            for copy_index, result in enumerate(results):
+                if copy_index not in reported:
+                    reported.add(copy_index)
+                    yield copy_index, bool(result)
+        finally:
+            progress.on_copy_ready = None
+            if get_ready is not None:
+                get_ready.cancel()
+            if not run_task.done():
+                run_task.cancel()
+                try:
+                    await run_task
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+    async def _run_video_copy_job(self, job: VideoCopyJob, timeout: float = None) -> list:
+        from video_processor import can_remux_copies
+        
+        if can_remux_copies(job.add_frames, job.compress, job.change_resolution, job.video_info):
+            # Копии без перекодирования не занимают потоки энкодеров
+            return await self.run(run_video_copy_job, job, timeout=timeout, cancel_event=job.cancel_event)
+        
+        frame_pixels = None
+        duration = None
+        if job.video_info:
+            frame_pixels = job.video_info['width'] * job.video_info['height']
+            duration = job.video_info.get('duration')
+        if job.change_resolution:
+            frame_pixels = 1080 * 1920
+        
+        slot = await self.scheduler.acquire(len(job.output_paths), frame_pixels, duration)
+        try:
+            job.encoder_threads = slot.threads_per_copy
+            job.segments = slot.segments
+            return await self.run(run_video_copy_job, job, timeout=timeout, cancel_event=job.cancel_event)
+        finally:
+            await self.scheduler.release(slot)
+
+    def shutdown(self, wait: bool = False):
+        """Останавливает пул: задачи из очереди снимаются, выполняющиеся прерываются"""
+        if self._executor is None:
+            return
+        for cancel_event in list(self._cancel_events.values()):
+            try:
+                cancel_event.set()
+            except Exception:
+                pass
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor = None
+        self._stop_progress_channel()
+        logger.info("Пул воркеров остановлен")
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Сервис воркеров: обработка видео из постоянной очереди задач
+
+Запуск: python worker_service.py [--processes N]
+
+Бот в режиме JOB_EXECUTION=service только скачивает видео, ставит задачу в
+очередь (job_store.JobStore) и отправляет готовые копии. Обработку выполняют
+N процессов этого сервиса; его и бота можно перезапускать независимо.
+С --broker host:port (JOB_BROKER_URL) сервис работает на другом сервере и
+получает задачи и файлы через брокер бота (job_broker.JobBrokerServer).
+"""
+
+import os
+import sys
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+
+from config import (
+    JOB_SERVICE_PROCESSES, JOB_LEASE_SECONDS, JOB_SERVICE_POLL_INTERVAL, ENCODER_THREAD_BUDGET, JOB_BROKER_URL
+)
+from job_store import JobStore
+from job_broker import JobBroker, BrokerError, create_broker
+from job_cancel import CancelScope, JobCancelled
+from encoder_scheduler import EncoderScheduler
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать остановки процессов-воркеров при завершении сервиса, секунд
+SHUTDOWN_GRACE_PERIOD = 30
+
+
+class _LeaseKeeper:
+    """Поток, который продлевает аренду задачи, пока воркер ее обрабатывает.
+
+    Устанавливает cancel_event, если истек таймаут задачи, аренду забрали
+    (задача вернулась в очередь) или сервис останавливается (stop_event).
+    """
+
+    def __init__(self, broker: JobBroker, job: dict, worker: str, cancel_event: threading.Event,
+                 stop_event=None, timeout: float = None):
+        self.broker = broker
+        self.job = job
+        self.worker = worker
+        self.cancel_event = cancel_event
+        self.stop_event = stop_event
+        self.timeout = timeout
+        self.reason = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, name='job-lease', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._done.set()
+        self._thread.join(timeout=5)
+        return False
+
+    def _cancel(self, reason: str):
+        self.reason = reason
+        self.cancel_event.set()
+
+    def _run(self):
+        elapsed = 0.0
+        interval = min(1.0, JOB_LEASE_SECONDS / 3)
+        since_heartbeat = 0.0
+        while not self._done.wait(interval):
+            elapsed += interval
+            since_heartbeat += interval
+            if self.stop_event is not None and self.stop_event.is_set():
+                self._cancel('stop')
+                return
+            if self.timeout and elapsed > self.timeout:
+                self._cancel('timeout')
+                return
+            if since_heartbeat >= JOB_LEASE_SECONDS / 3:
+                since_heartbeat = 0.0
+                try:
+                    if not self.broker.heartbeat(self.job['job_id'], self.worker, JOB_LEASE_SECONDS):
+                        self._cancel('lease')
+                        return
+                except Exception as e:
+                    logger.warning(f"Не удалось продлить аренду задачи {self.job['job_id']}: {e}")
+
+
+def run_service_job(broker: JobBroker, job: dict, worker: str, encoder_threads: int, stop_event=None):
+    """Выполняет задачу обработки видео из очереди и отмечает результат в ней.
+
+    Копии, отмеченные готовыми в прошлых попытках, не пересоздаются.
+    """
+    from video_processor import process_video_copies_fanout
+
+    job_id = job['job_id']
+    payload = job['payload']
+    pending = [i for i in range(len(payload['output_paths'])) if i not in job['ready_copies']]
+    if not pending:
+        broker.complete(job_id, worker)
+        return
+
+    video_info = payload.get('video_info')
+    frame_pixels = video_info['width'] * video_info['height'] if video_info else None
+    duration = video_info['duration'] if video_info else None
+    slot = EncoderScheduler(total_threads=encoder_threads).plan(
+        len(pending), queue_depth=1, frame_pixels=frame_pixels, duration=duration
+    )
+    # Повтор: недостающие копии строятся по новому seed, чтобы не совпасть с уже отправленными
+    seed = payload['seed'] + job['attempts'] - 1
+    logger.info(
+        f"Воркер {worker} начал задачу {job_id}: копий {len(pending)}/{len(payload['output_paths'])}, "
+        f"попытка {job['attempts']}/{job['max_attempts']}"
+    )
+
+    cancel_event = threading.Event()
+    lease = _LeaseKeeper(broker, job, worker, cancel_event, stop_event, payload.get('timeout'))
+    try:
+        # Аренда продлевается и во время скачивания входного файла с брокера
+        with lease, broker.job_files(job, worker) as (input_path, output_paths, work_dir):
+            def on_copy_ready(k):
+                broker.push_output(job, worker, pending[k], output_paths[pending[k]])
+
+            try:
+                with CancelScope(cancel_event):
+                    results = process_video_copies_fanout(
+                        input_path, [output_paths[i] for i in pending], payload['add_frames'],
+                        payload['compress'], payload.get('change_resolution', False), job['user_id'],
+                        encoder_threads=slot.threads_per_copy, video_info=video_info, segments=slot.segments,
+                        work_dir=work_dir, profile=payload.get('profile'), seed=seed,
+                        on_copy_ready=on_copy_ready
+                    )
+            except JobCancelled:
+                _remove_unfinished(broker, job_id, worker, output_paths)
+                raise
+    except JobCancelled:
+        if lease.reason == 'stop':
+            logger.info(f"Сервис останавливается, задача {job_id} возвращена в очередь")
+            broker.release(job_id, worker)
+        elif lease.reason == 'timeout':
+            broker.fail(job_id, worker, "Превышено время обработки", job['attempts'], job['max_attempts'])
+        else:
+            logger.warning(f"Задача {job_id} больше не принадлежит воркеру {worker}")
+        return
+    except Exception as e:
+        broker.fail(job_id, worker, str(e), job['attempts'], job['max_attempts'])
+        return
+
+    failed = len(results) - sum(results)
+    if failed:
+        broker.fail(job_id, worker, f"Не созданы копии: {failed}", job['attempts'], job['max_attempts'])
+    else:
+        broker.complete(job_id, worker)
+        logger.info(f"Воркер {worker} закончил задачу {job_id}")
+
+
+def _remove_unfinished(broker: JobBroker, job_id: str, worker: str, output_paths: list):
+    """Удаляет недописанные копии прерванной задачи; готовые остаются для отправки"""
+    try:
+        job = broker.get(job_id, worker)
+    except BrokerError as e:
+        # Аренду забрали - копии перезапишет новый владелец задачи
+        logger.warning(f"Незавершенные копии задачи {job_id} не удалены: {e}")
+        return
+    ready = set(job['ready_copies']) if job else set()
+    for i, output_path in enumerate(output_paths):
+        if i in ready:
+            continue
+        try:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        except OSError as e:
+            logger.warning(f"Не удалось удалить незавершенную копию {output_path}: {e}")
+
+
+def worker_main(index: int, stop_event, encoder_threads: int, broker_address: str = None):
+    """Цикл процесса-воркера: забирает задачи из очереди, пока сервис не остановлен"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    # Остановкой управляет процесс-супервизор через stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    broker = create_broker(broker_address)
+    logger.info(f"Воркер {index} запущен ({worker}), потоков энкодера: {encoder_threads}")
+    while not stop_event.is_set():
+        try:
+            job = broker.claim(worker, JOB_LEASE_SECONDS)
+        except Exception as e:
+            logger.error(f"Не удалось получить задачу из очереди: {e}")
+            job = None
+        if job is None:
+            stop_event.wait(JOB_SERVICE_POLL_INTERVAL)
+            continue
+        try:
+            run_service_job(broker, job, worker, encoder_threads, stop_event)
+        except Exception as e:
+            # Брокер недоступен: задача вернется в очередь по истечении аренды
+            logger.error(f"Не удалось сообщить результат задачи {job['job_id']}: {e}")
+    logger.info(f"Воркер {index} остановлен")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сервис воркеров обработки видео")
+    parser.add_argument('--processes', type=int, default=JOB_SERVICE_PROCESSES,
+                        help="число процессов-воркеров (по умолчанию JOB_SERVICE_PROCESSES)")
+    parser.add_argument('--broker', default=JOB_BROKER_URL,
+                        help="host:port брокера задач на сервере бота (по умолчанию JOB_BROKER_URL)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    processes_count = max(1, args.processes)
+    encoder_threads = max(1, ENCODER_THREAD_BUDGET // processes_count)
+
+    if not args.broker:
+        # Очередь создается до запуска воркеров, чтобы они не создавали таблицы одновременно
+        JobStore()
+
+    mp_context = multiprocessing.get_context('spawn')
+    stop_event = mp_context.Event()
+    # Обработчик сигнала только ставит флаг: Event из multiprocessing внутри обработчика может
+    # заблокироваться на собственной блокировке, если сигнал пришел во время stop_event.wait()
+    stop_requested = []
+
+    def request_stop(signum, frame):
+        stop_requested.append(signum)
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    processes = {}
+    logger.info(f"Сервис воркеров запущен: {processes_count} процессов")
+    while not stop_requested:
+        # Упавший воркер перезапускается; его задача вернется в очередь по истечении аренды
+        for index in range(processes_count):
+            process = processes.get(index)
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                logger.error(f"Воркер {index} завершился с кодом {process.exitcode}, перезапускаю")
+            process = mp_context.Process(
+                target=worker_main, args=(index, stop_event, encoder_threads, args.broker), name=f'job-worker-{index}'
+            )
+            process.start()
+            processes[index] = process
+        time.sleep(1)
+
+    logger.info("Получен сигнал остановки, воркеры возвращают задачи в очередь")
+    stop_event.set()
+    for process in processes.values():
+        process.join(timeout=SHUTDOWN_GRACE_PERIOD)
+        if process.is_alive():
+            logger.warning(f"Воркер {process.name} не остановился, завершаю принудительно")
+            process.terminate()
+    logger.info("Сервис воркеров остановлен")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())